@@ -0,0 +1 @@
+"""Нагрузочное тестирование бота без сети: заглушки Telegram Bot API и OpenRouter, генератор трафика."""
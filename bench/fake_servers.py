@@ -0,0 +1,174 @@
+"""
+Заглушки внешних сервисов для бенчмарка:
+- OpenAI-совместимый /chat/completions с настраиваемой задержкой, долей ошибок,
+  долей finish_reason="length" и потоковым режимом (SSE);
+- Telegram Bot API: принимает sendMessage/editMessageText/... и считает вызовы.
+
+Запускаются в отдельном процессе, чтобы не конкурировать с ботом за event loop.
+"""
+
+import asyncio
+import itertools
+import json
+import random
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from aiohttp import web
+
+# Ответ проходит проверку бота на «сухость» (есть структура и достаточная длина)
+RESPONSE_TEXT = (
+    "Ключевые символы: полёт над городом — стремление к свободе и взгляд на ситуацию сверху; "
+    "вода под тобой — эмоции, которые пока не названы. "
+    "Эмоциональный фон: лёгкость с оттенком тревоги. "
+    "Практический вывод: запиши, что в жизни сейчас хочется «отпустить», и сделай один маленький шаг к этому."
+)
+
+
+@dataclass
+class FakeLLMConfig:
+    latency_ms: float = 800.0
+    jitter_ms: float = 200.0
+    error_rate: float = 0.0
+    length_rate: float = 0.0
+    stream_chunks: int = 20
+    completion_tokens: int = 300
+    seed: Optional[int] = None
+
+
+def _prompt_tokens(messages: list) -> int:
+    return sum(len(str(m.get("content", ""))) // 3 + 4 for m in messages)
+
+
+def create_fake_llm_app(config: FakeLLMConfig) -> web.Application:
+    rng = random.Random(config.seed)
+    counters: Dict[str, int] = {"requests": 0, "errors": 0, "length": 0, "streamed": 0}
+    ids = itertools.count(1)
+
+    def latency_s() -> float:
+        return max(0.0, rng.gauss(config.latency_ms, config.jitter_ms)) / 1000
+
+    async def completions(request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        counters["requests"] += 1
+        delay = latency_s()
+        if rng.random() < config.error_rate:
+            await asyncio.sleep(delay / 2)
+            counters["errors"] += 1
+            return web.json_response({"error": {"message": "fake upstream error", "code": 500}}, status=500)
+        finish_reason = "length" if rng.random() < config.length_rate else "stop"
+        counters["length"] += finish_reason == "length"
+        completion_id = f"chatcmpl-fake-{next(ids)}"
+        usage = {
+            "prompt_tokens": _prompt_tokens(body.get("messages", [])),
+            "completion_tokens": config.completion_tokens,
+            "total_tokens": _prompt_tokens(body.get("messages", [])) + config.completion_tokens,
+        }
+        base = {"id": completion_id, "created": int(time.time()), "model": body.get("model", "fake")}
+
+        if not body.get("stream"):
+            await asyncio.sleep(delay)
+            return web.json_response({
+                **base,
+                "object": "chat.completion",
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": RESPONSE_TEXT},
+                    "finish_reason": finish_reason,
+                }],
+                "usage": usage,
+            })
+
+        counters["streamed"] += 1
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+
+        async def send(payload: dict) -> None:
+            await response.write(f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode("utf-8"))
+
+        # время до первого токена — треть задержки, остальное распределено по кускам
+        await asyncio.sleep(delay / 3)
+        chunks = max(1, config.stream_chunks)
+        step = -(-len(RESPONSE_TEXT) // chunks)
+        for idx in range(0, len(RESPONSE_TEXT), step):
+            await send({
+                **base,
+                "object": "chat.completion.chunk",
+                "choices": [{"index": 0, "delta": {"content": RESPONSE_TEXT[idx:idx + step]}, "finish_reason": None}],
+            })
+            await asyncio.sleep(delay * 2 / 3 / chunks)
+        await send({
+            **base,
+            "object": "chat.completion.chunk",
+            "choices": [{"index": 0, "delta": {}, "finish_reason": finish_reason}],
+        })
+        if (body.get("stream_options") or {}).get("include_usage"):
+            await send({**base, "object": "chat.completion.chunk", "choices": [], "usage": usage})
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    async def stats(request: web.Request) -> web.Response:
+        return web.json_response(counters)
+
+    app = web.Application()
+    app.router.add_post("/chat/completions", completions)
+    app.router.add_get("/stats", stats)
+    return app
+
+
+def create_fake_telegram_app() -> web.Application:
+    counters: Dict[str, int] = {}
+    message_ids = itertools.count(1)
+
+    async def api_method(request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        counters[method] = counters.get(method, 0) + 1
+        if request.content_type == "application/json":
+            params = await request.json()
+        else:
+            params = dict(await request.post())
+        lowered = method.lower()
+        if lowered == "getme":
+            result = {"id": 1, "is_bot": True, "first_name": "bench"}
+        elif lowered in ("sendmessage", "editmessagetext", "senddocument"):
+            result = {
+                "message_id": int(params.get("message_id") or next(message_ids)),
+                "date": int(time.time()),
+                "chat": {"id": int(params.get("chat_id", 0)), "type": "private"},
+                "text": params.get("text", ""),
+            }
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    async def stats(request: web.Request) -> web.Response:
+        return web.json_response(counters)
+
+    app = web.Application()
+    app.router.add_post("/bot{token}/{method}", api_method)
+    app.router.add_get("/stats", stats)
+    return app
+
+
+async def _serve(llm_config: FakeLLMConfig, llm_port: int, telegram_port: int, host: str) -> None:
+    runners = []
+    for app, port in ((create_fake_llm_app(llm_config), llm_port), (create_fake_telegram_app(), telegram_port)):
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        runners.append(runner)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        for runner in runners:
+            await runner.cleanup()
+
+
+def serve(llm_config: FakeLLMConfig, llm_port: int, telegram_port: int, host: str = "127.0.0.1") -> None:
+    """Точка входа процесса с заглушками"""
+    try:
+        asyncio.run(_serve(llm_config, llm_port, telegram_port, host))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,264 @@
+"""
+Воспроизведение реального трафика: моменты прихода сообщений и состав пользователей берутся
+из событий message_in (data/events.jsonl, в том числе ротированные .gz и файлы воркеров),
+полные тексты — из истории (conversations.json с журналом или SQLite). Трафик подаётся в бот
+против заглушек с исходной скоростью или ускоренно — для планирования мощности и сравнения
+хранилищ и настроек LLM на настоящей форме нагрузки.
+
+Запуск:
+    python -m bench.replay --events data/events.jsonl --conversations data/conversations.json --speed 10
+"""
+
+import argparse
+import gzip
+import json
+import logging
+import os
+import sqlite3
+import zlib
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from .run import Arrival, add_common_arguments, percentile, run_schedule, run_with_fakes
+
+logger = logging.getLogger(__name__)
+
+# В события пишется только начало текста: handle_message обрезает его до 50 символов и добавляет "..."
+TRUNCATED_SUFFIX = "..."
+
+
+def _open_text(path: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, "r", encoding="utf-8")
+
+
+def read_events(paths: Iterable[str], names: Iterable[str] = ("message_in", "message_out")) -> List[dict]:
+    """События с нужными именами из нескольких файлов, по возрастанию времени"""
+    wanted = set(names)
+    events = []
+    for path in paths:
+        with _open_text(path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                    if record.get("event") in wanted:
+                        record["ts"] = datetime.fromisoformat(record["timestamp"])
+                        events.append(record)
+                except (ValueError, KeyError, TypeError):
+                    logger.warning(f"Пропущена повреждённая строка событий в {path}")
+    events.sort(key=lambda e: e["ts"])
+    return events
+
+
+def read_history(path: str, backend: str = "journal") -> Dict[str, dict]:
+    """Пользователи из истории: {user_id: {"username": ..., "messages": [тексты пользователя по порядку]}}"""
+    from src.storage import create_storage
+
+    storage = create_storage(backend, path)
+    if backend == "sqlite":
+        users = _read_sqlite_users(storage)
+    else:
+        # close() не вызываем: файловые бэкенды при закрытии сворачивают журнал в снимок,
+        # а исходные файлы трогать нельзя
+        storage.load()
+        users = list(storage.iter_users())
+    history = {}
+    for user in users:
+        messages = [
+            message
+            for session in user.get("sessions", [])
+            for message in session.get("messages", [])
+            if message.get("role") == "user"
+        ]
+        history[str(user["user_id"])] = {"username": user.get("username") or "", "messages": messages}
+    return history
+
+
+def _read_sqlite_users(storage) -> List[dict]:
+    """Пользователи из рабочей БД через соединение только на чтение: load() хранилища создал бы
+    файл по ошибочному пути и выполнил бы схему и миграции прямо в продакшен-базе
+    """
+    if not os.path.exists(storage.path):
+        raise FileNotFoundError(f"Нет базы истории: {storage.path}")
+    conn = sqlite3.connect(f"{Path(storage.path).resolve().as_uri()}?mode=ro", uri=True)
+    try:
+        rows = conn.execute("SELECT user_id, username, created_at FROM users ORDER BY rowid").fetchall()
+        return [storage._build_user(row, conn) for row in rows]
+    finally:
+        conn.close()
+
+
+def telegram_user_id(user_id: str) -> int:
+    """Числовой id для синтетического Update (в истории id — строка)"""
+    if user_id.isdigit():
+        return int(user_id)
+    return 10 ** 12 + zlib.crc32(user_id.encode("utf-8"))
+
+
+class _TextResolver:
+    """Восстанавливает полный текст сообщения по обрезанному тексту события.
+    Сообщения, склеенные ботом из нескольких фрагментов, хранятся одной записью через "\\n";
+    каждое событие message_in соответствует своей строке этой записи.
+    """
+
+    def __init__(self, messages: List[dict]) -> None:
+        self.texts = [m.get("content", "") for m in messages]
+        self.position = 0
+
+    def resolve(self, prefix: str) -> Optional[str]:
+        # склейка и обрезанные короткие сообщения сдвигают соответствие, поэтому смотрим на несколько записей вперёд
+        for index in range(self.position, min(len(self.texts), self.position + 5)):
+            text = self.texts[index]
+            lines = text.split("\n")
+            if len(lines) == 1 or "\n" in prefix:
+                if text.startswith(prefix):
+                    self.position = index + 1
+                    return text
+                continue
+            for line_index, line in enumerate(lines):
+                if line.startswith(prefix):
+                    # запись пройдена, когда использован её последний фрагмент
+                    self.position = index + 1 if line_index == len(lines) - 1 else index
+                    return line
+        return None
+
+
+@dataclass
+class Trace:
+    arrivals: List[Arrival]
+    span_s: float = 0.0
+    unmatched: int = 0
+    recorded_latency_s: List[float] = field(default_factory=list)
+
+
+def build_trace(
+    events: List[dict],
+    history: Optional[Dict[str, dict]] = None,
+    *,
+    speed: float = 1.0,
+    max_gap_s: float = 0.0,
+    limit: int = 0,
+) -> Trace:
+    """Расписание воспроизведения.
+    speed — ускорение (10 — в десять раз быстрее исходного), max_gap_s — ограничение пауз
+    между сообщениями до ускорения (ночные затишья не ждём), limit — первые N сообщений.
+    Без событий расписание строится по отметкам времени сообщений пользователей в истории.
+    """
+    history = history or {}
+    incoming = [e for e in events if e.get("event") == "message_in"]
+    if not incoming:
+        incoming = sorted(
+            (
+                {
+                    "ts": datetime.fromisoformat(message["timestamp"]),
+                    "event": "message_in",
+                    "payload": {"user_id": user_id, "text": message.get("content", "")},
+                }
+                for user_id, user in history.items()
+                for message in user["messages"]
+                if message.get("timestamp")
+            ),
+            key=lambda e: e["ts"],
+        )
+    if limit > 0:
+        incoming = incoming[:limit]
+
+    resolvers = {user_id: _TextResolver(user["messages"]) for user_id, user in history.items()}
+    arrivals: List[Arrival] = []
+    unmatched = 0
+    offset = 0.0
+    previous_ts = incoming[0]["ts"] if incoming else None
+    for event in incoming:
+        payload = event.get("payload", {})
+        user_id = str(payload.get("user_id", ""))
+        text = payload.get("text", "")
+        if text.endswith(TRUNCATED_SUFFIX):
+            prefix = text[: -len(TRUNCATED_SUFFIX)]
+            resolver = resolvers.get(user_id)
+            full = resolver.resolve(prefix) if resolver else None
+            if full is None:
+                # история очищена (/clear) или недоступна — воспроизводим то, что есть
+                unmatched += 1
+                full = prefix
+            text = full
+        gap = (event["ts"] - previous_ts).total_seconds()
+        if max_gap_s > 0:
+            gap = min(gap, max_gap_s)
+        offset += max(0.0, gap)
+        previous_ts = event["ts"]
+        arrivals.append(Arrival(
+            offset_s=offset / max(speed, 1e-9),
+            user_id=telegram_user_id(user_id),
+            text=text,
+            username=history.get(user_id, {}).get("username", ""),
+        ))
+
+    span = (incoming[-1]["ts"] - incoming[0]["ts"]).total_seconds() if incoming else 0.0
+    return Trace(arrivals=arrivals, span_s=span, unmatched=unmatched, recorded_latency_s=recorded_latencies(events))
+
+
+def recorded_latencies(events: List[dict]) -> List[float]:
+    """Время ответа в исходном трафике: от последнего message_in пользователя до его message_out"""
+    last_in: Dict[str, datetime] = {}
+    latencies = []
+    for event in events:
+        user_id = str(event.get("payload", {}).get("user_id", ""))
+        if event.get("event") == "message_in":
+            last_in[user_id] = event["ts"]
+        elif event.get("event") == "message_out" and user_id in last_in:
+            latencies.append((event["ts"] - last_in.pop(user_id)).total_seconds())
+    return latencies
+
+
+async def replay(trace: Trace, *, speed: float, **options) -> dict:
+    """Воспроизвести расписание против бота; options — как у run_schedule"""
+    report = await run_schedule(trace.arrivals, **options)
+    report["speed"] = speed
+    recorded = trace.recorded_latency_s
+    report["trace"] = {
+        "span_s": round(trace.span_s, 1),
+        "unmatched_texts": trace.unmatched,
+        "recorded_latency_ms": {
+            "p50": None if not recorded else round(percentile(recorded, 0.5) * 1000, 1),
+            "p99": None if not recorded else round(percentile(recorded, 0.99) * 1000, 1),
+        },
+    }
+    return report
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Воспроизведение реального трафика бота против заглушек LLM и Telegram")
+    parser.add_argument("--events", nargs="+", default=["data/events.jsonl"], help="файлы событий (.jsonl, .gz)")
+    parser.add_argument("--conversations", default="data/conversations.json", help="история с полными текстами")
+    parser.add_argument("--history-backend", default="journal", choices=["journal", "json", "sqlite"])
+    parser.add_argument("--speed", type=float, default=1.0, help="ускорение относительно исходного времени")
+    parser.add_argument("--max-gap", type=float, default=0.0, help="максимальная пауза между сообщениями, с (0 — как было)")
+    parser.add_argument("--limit", type=int, default=0, help="воспроизвести только первые N сообщений")
+    add_common_arguments(parser)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    # исходные файлы читаются до перехода в каталог данных бенчмарка
+    events = read_events([p for p in args.events if os.path.exists(p)])
+    history = read_history(args.conversations, args.history_backend)
+    trace = build_trace(events, history, speed=args.speed, max_gap_s=args.max_gap, limit=args.limit)
+    if not trace.arrivals:
+        parser.error("в событиях и истории нет входящих сообщений")
+    logger.warning(
+        f"Воспроизводится {len(trace.arrivals)} сообщений за исходные {trace.span_s:.0f} с "
+        f"(ускорение ×{args.speed}), без полного текста: {trace.unmatched}"
+    )
+    run_with_fakes(args, lambda **urls: replay(
+        trace,
+        speed=args.speed,
+        storage_backend=args.backend,
+        streaming=args.stream,
+        **urls,
+    ))
+
+
+if __name__ == "__main__":
+    main()
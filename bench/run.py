@@ -0,0 +1,394 @@
+"""
+Бенчмарк бота целиком: синтетические обновления идут через aiogram-диспетчер DreamsBot,
+LLM и Telegram Bot API заменены локальными заглушками (bench/fake_servers.py).
+
+Отчёт: пропускная способность (сообщений/с), p50/p99 сквозной задержки обработки
+обновления, задержка event loop, байты, записанные на диск в расчёте на сообщение.
+
+Запуск:
+    python -m bench.run --messages 500 --users 50 --rate 25 --llm-latency-ms 800
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import multiprocessing
+import os
+import random
+import socket
+import tempfile
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Iterator, List, Optional
+
+from .fake_servers import FakeLLMConfig, serve
+
+logger = logging.getLogger(__name__)
+
+DREAM_FRAGMENTS = [
+    "я летал над ночным городом",
+    "за мной гналась огромная собака",
+    "я снова сдавал экзамен в школе",
+    "в доме появилась дверь, которой раньше не было",
+    "я плыл по тёплому морю",
+    "у меня выпадали зубы",
+    "я опаздывал на поезд и не мог найти билет",
+]
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_port(port: int, timeout: float = 15.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        with contextlib.suppress(OSError), socket.create_connection(("127.0.0.1", port), timeout=0.5):
+            return
+        time.sleep(0.05)
+    raise RuntimeError(f"Заглушка на порту {port} не поднялась за {timeout} с")
+
+
+def _process_write_bytes() -> Optional[int]:
+    """Байты, фактически отправленные процессом на блочное устройство (Linux)"""
+    try:
+        with open("/proc/self/io") as f:
+            for line in f:
+                if line.startswith("write_bytes:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            with contextlib.suppress(OSError):
+                total += os.path.getsize(os.path.join(root, name))
+    return total
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q * (len(ordered) - 1))))
+    return ordered[index]
+
+
+@contextlib.contextmanager
+def _config_overrides(overrides: Dict[str, object]) -> Iterator[None]:
+    from src.config import Config
+
+    saved = {name: getattr(Config, name) for name in overrides}
+    for name, value in overrides.items():
+        setattr(Config, name, value)
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            setattr(Config, name, value)
+
+
+@dataclass
+class Arrival:
+    """Входящее сообщение нагрузки: через сколько секунд от старта, от кого и что"""
+
+    offset_s: float
+    user_id: int
+    text: str
+    username: str = ""
+
+
+def _make_update(update_id: int, arrival: Arrival) -> dict:
+    user_id = arrival.user_id
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": arrival.username or f"user{user_id}"},
+            "text": arrival.text,
+        },
+    }
+
+
+async def _sample_loop_lag(samples: List[float], interval: float, stop: asyncio.Event) -> None:
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        started = loop.time()
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, loop.time() - started - interval))
+
+
+async def run_schedule(
+    schedule: List[Arrival],
+    *,
+    llm_url: str,
+    telegram_url: str,
+    storage_backend: str = "journal",
+    streaming: bool = False,
+    config_overrides: Optional[Dict[str, object]] = None,
+) -> dict:
+    """Подать сообщения расписания в диспетчер бота в их моменты времени (открытая модель нагрузки:
+    следующее сообщение не ждёт ответа на предыдущее). Запускается в текущем каталоге: бот пишет в ./data.
+    """
+    from aiogram.types import Update
+
+    overrides = {
+        "TELEGRAM_BOT_TOKEN": "123456:BENCH",
+        "TELEGRAM_API_URL": telegram_url,
+        "OPENROUTER_API_KEY": "bench",
+        "LLM_BASE_URL": llm_url,
+        "LLM_STREAMING": streaming,
+        # каждое сообщение — отдельный запрос к LLM: без склейки и без кэша ответов
+        "MESSAGE_COALESCE_WINDOW": 0.0,
+        "LLM_CACHE_ENABLED": False,
+        "FAST_START": False,
+        "METRICS_HTTP_ENABLED": False,
+        "DATA_STORAGE_BACKEND": storage_backend,
+        **(config_overrides or {}),
+    }
+    root = logging.getLogger()
+    handlers_before = {handler: handler.level for handler in root.handlers}
+    with _config_overrides(overrides):
+        from src.bot import DreamsBot
+
+        bot = DreamsBot()
+        # консоль не засоряем, файл-лог бота пишется как в проде
+        for handler in root.handlers:
+            if handler in handlers_before and isinstance(handler, logging.StreamHandler):
+                handler.setLevel(logging.WARNING)
+        await bot.start_services()
+
+        latencies: List[float] = []
+        failures = 0
+        lag_samples: List[float] = []
+        stop_lag = asyncio.Event()
+        lag_task = asyncio.create_task(_sample_loop_lag(lag_samples, 0.05, stop_lag))
+
+        async def feed(update_id: int, arrival: Arrival) -> None:
+            nonlocal failures
+            update = Update.model_validate(_make_update(update_id, arrival), context={"bot": bot.bot})
+            started = time.perf_counter()
+            try:
+                await bot.dp.feed_update(bot.bot, update)
+            except Exception as e:
+                failures += 1
+                logger.warning(f"Обновление {update_id} завершилось ошибкой: {e}")
+            latencies.append(time.perf_counter() - started)
+
+        io_before = _process_write_bytes()
+        size_before = _dir_size("data")
+        started = time.perf_counter()
+        tasks = []
+        for update_id, arrival in enumerate(schedule, start=1):
+            delay = started + arrival.offset_s - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(feed(update_id, arrival)))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+
+        stop_lag.set()
+        await lag_task
+        metrics = bot.metrics.metrics
+        # всё, что бот держит в буферах, — на диск, чтобы честно посчитать байты
+        await bot.shutdown()
+        io_after = _process_write_bytes()
+        size_after = _dir_size("data")
+
+    for handler in list(root.handlers):
+        if handler not in handlers_before:
+            root.removeHandler(handler)
+            handler.close()
+    for handler, level in handlers_before.items():
+        handler.setLevel(level)
+
+    def ms(value: Optional[float]) -> Optional[float]:
+        return None if value is None else round(value * 1000, 1)
+
+    messages = len(schedule)
+    count = max(1, messages)
+    return {
+        "messages": messages,
+        "users": len({arrival.user_id for arrival in schedule}),
+        "storage_backend": storage_backend,
+        "streaming": streaming,
+        "duration_s": round(elapsed, 3),
+        "msgs_per_sec": round(messages / elapsed, 2) if elapsed > 0 else None,
+        "latency_ms": {
+            "p50": ms(percentile(latencies, 0.5)),
+            "p90": ms(percentile(latencies, 0.9)),
+            "p99": ms(percentile(latencies, 0.99)),
+            "max": ms(max(latencies, default=None)),
+        },
+        "event_loop_lag_ms": {
+            "p50": ms(percentile(lag_samples, 0.5)),
+            "p99": ms(percentile(lag_samples, 0.99)),
+            "max": ms(max(lag_samples, default=None)),
+        },
+        "disk": {
+            "write_bytes_per_msg": (
+                round((io_after - io_before) / count) if io_before is not None and io_after is not None else None
+            ),
+            "data_growth_bytes_per_msg": round((size_after - size_before) / count),
+        },
+        "bot": {
+            "llm_requests": metrics["totals"]["requests"],
+            "llm_errors": metrics["totals"]["errors"],
+            "handler_failures": failures,
+        },
+    }
+
+
+async def run_benchmark(
+    *,
+    messages: int = 200,
+    users: int = 20,
+    rate: float = 20.0,
+    seed: int = 0,
+    **options,
+) -> dict:
+    """Синтетическая нагрузка: messages сообщений от users пользователей по кругу
+    с темпом rate сообщений/с (0 — все сразу). options — как у run_schedule.
+    """
+    rng = random.Random(seed)
+    schedule = [
+        Arrival(
+            offset_s=i / rate if rate > 0 else 0.0,
+            user_id=100000 + i % max(1, users),
+            text=f"Сон №{i}: {rng.choice(DREAM_FRAGMENTS)}, а потом {rng.choice(DREAM_FRAGMENTS)}.",
+        )
+        for i in range(messages)
+    ]
+    report = await run_schedule(schedule, **options)
+    report["target_rate"] = rate
+    return report
+
+
+def _fetch_stats(url: str) -> dict:
+    import urllib.request
+
+    with urllib.request.urlopen(url.rstrip("/") + "/stats", timeout=5) as response:
+        return json.loads(response.read())
+
+
+def format_report(report: dict) -> str:
+    lat = report["latency_ms"]
+    lag = report["event_loop_lag_ms"]
+    disk = report["disk"]
+    if "speed" in report:
+        pace = f"воспроизведение ×{report['speed']}"
+    else:
+        pace = f"целевой темп {report.get('target_rate') or 'без ограничения'}"
+    lines = [
+        f"Сообщений: {report['messages']} от {report['users']} пользователей, "
+        f"хранилище {report['storage_backend']}, стриминг {'вкл' if report['streaming'] else 'выкл'}",
+        f"Пропускная способность: {report['msgs_per_sec']} сообщ/с (за {report['duration_s']} с, {pace})",
+        f"Сквозная задержка, мс: p50 {lat['p50']}, p90 {lat['p90']}, p99 {lat['p99']}, max {lat['max']}",
+        f"Задержка event loop, мс: p50 {lag['p50']}, p99 {lag['p99']}, max {lag['max']}",
+        f"Диск на сообщение: записано {disk['write_bytes_per_msg']} Б, "
+        f"рост data/ {disk['data_growth_bytes_per_msg']} Б",
+        f"LLM: запросов {report['bot']['llm_requests']}, ошибок {report['bot']['llm_errors']}",
+    ]
+    if "trace" in report:
+        trace = report["trace"]
+        recorded = trace["recorded_latency_ms"]
+        lines.append(
+            f"Исходный трафик: {trace['span_s']} с, без полного текста {trace['unmatched_texts']}, "
+            f"задержка ответа в проде p50 {recorded['p50']}, p99 {recorded['p99']} мс"
+        )
+    if "fake_llm" in report:
+        lines.append(f"Заглушка LLM: {report['fake_llm']}")
+    if "fake_telegram" in report:
+        lines.append(f"Вызовы Bot API: {report['fake_telegram']}")
+    return "\n".join(lines)
+
+
+def add_common_arguments(parser: argparse.ArgumentParser) -> None:
+    """Параметры бота и заглушки LLM, общие для синтетической нагрузки и воспроизведения"""
+    parser.add_argument("--backend", default="journal", choices=["journal", "json", "sqlite"])
+    parser.add_argument("--stream", action="store_true", help="потоковые ответы LLM")
+    parser.add_argument("--llm-latency-ms", type=float, default=800.0)
+    parser.add_argument("--llm-jitter-ms", type=float, default=200.0)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--llm-length-rate", type=float, default=0.0, help="доля ответов с finish_reason=length")
+    parser.add_argument("--data-dir", default="", help="каталог данных бота (по умолчанию временный)")
+    parser.add_argument("--json", dest="json_path", default="", help="сохранить отчёт в JSON")
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def run_with_fakes(args: argparse.Namespace, scenario: Callable[..., Awaitable[dict]]) -> dict:
+    """Поднять заглушки в отдельном процессе, выполнить scenario(llm_url=..., telegram_url=...)
+    в каталоге данных бота, напечатать и при необходимости сохранить отчёт
+    """
+    llm_port, telegram_port = _free_port(), _free_port()
+    llm_config = FakeLLMConfig(
+        latency_ms=args.llm_latency_ms,
+        jitter_ms=args.llm_jitter_ms,
+        error_rate=args.llm_error_rate,
+        length_rate=args.llm_length_rate,
+        seed=args.seed,
+    )
+    # заглушки — в отдельном процессе, чтобы не делить с ботом event loop и GIL
+    ctx = multiprocessing.get_context("spawn")
+    servers = ctx.Process(target=serve, args=(llm_config, llm_port, telegram_port), daemon=True)
+    servers.start()
+    llm_url = f"http://127.0.0.1:{llm_port}"
+    telegram_url = f"http://127.0.0.1:{telegram_port}"
+    cwd = os.getcwd()
+    json_path = os.path.abspath(args.json_path) if args.json_path else ""
+    try:
+        _wait_port(llm_port)
+        _wait_port(telegram_port)
+        with contextlib.ExitStack() as stack:
+            data_dir = args.data_dir or stack.enter_context(tempfile.TemporaryDirectory(prefix="dreams-bench-"))
+            os.makedirs(data_dir, exist_ok=True)
+            os.chdir(data_dir)
+            try:
+                report = asyncio.run(scenario(llm_url=llm_url, telegram_url=telegram_url))
+            finally:
+                os.chdir(cwd)
+        report["fake_llm"] = _fetch_stats(llm_url)
+        report["fake_telegram"] = _fetch_stats(telegram_url)
+    finally:
+        servers.terminate()
+        servers.join(timeout=5)
+
+    print(format_report(report))
+    if json_path:
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return report
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Бенчмарк DreamsBot против заглушек LLM и Telegram")
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--rate", type=float, default=20.0, help="сообщений в секунду, 0 — все сразу")
+    add_common_arguments(parser)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    run_with_fakes(args, lambda **urls: run_benchmark(
+        messages=args.messages,
+        users=args.users,
+        rate=args.rate,
+        seed=args.seed,
+        storage_backend=args.backend,
+        streaming=args.stream,
+        **urls,
+    ))
+
+
+if __name__ == "__main__":
+    main()
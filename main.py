@@ -3,20 +3,30 @@
 Точка входа для Dreams Bot
 """
 
+from src.startup import startup_timer
+
 import asyncio
 import logging
 import sys
 from src.bot import DreamsBot
 from src.config import Config
+from src.workers import run_sharded
 
 def main() -> None:
     """Основная функция запуска бота"""
     try:
+        startup_timer.mark("импорт")
         # Валидация конфигурации
         Config.validate()
         
+        if Config.WORKERS > 1:
+            # входной процесс + воркеры, шардированные по user_id
+            run_sharded(Config.WORKERS)
+            return
+
         # Создание и запуск бота
         bot = DreamsBot()
+        startup_timer.mark("инициализация")
         asyncio.run(bot.start())
         
     except ValueError as e:
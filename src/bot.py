@@ -1,14 +1,32 @@
 import asyncio
 import logging
 import os
+import queue
+import tempfile
 from datetime import datetime
+from typing import Optional
 from aiogram import Bot, Dispatcher, types
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.filters import Command
+from .coalescer import MessageCoalescer
 from .config import Config
-from .llm import LLMClient
+from .context import ContextBuilder
+from .costs import CostTracker, top_by_cost
+from .llm import LLMClient, preload_heavy_modules
 from .data_manager import DataManager
-from .metrics import MetricsManager
+from .export import iter_export_users, parse_export_args, write_export_parts
+from .metrics import MetricsManager, merge_metrics, percentiles_from, read_metrics_file
+from .persistence import BackgroundWriter
+from .profiler import parse_profile_args, profile_allocations, profile_stacks
+from .monitoring import EventLoopLagMonitor, MetricsServer, process_rss_bytes, storage_sizes
 from .logging_utils import JSONEventLogger, setup_structured_file_logging
+from .scheduler import QueueFullError, RequestScheduler
+from .sharding import worker_path
+from .startup import startup_timer
+from .streaming import TelegramStreamRenderer
+from .tracing import format_trace_report, read_spans, summarize_spans, trace_files, tracer
+from .webhook import UpdateDeduplicator, run_webhook
 
 # Настройка логирования согласно @conventions.mdc
 logging.basicConfig(
@@ -17,21 +35,115 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+_IDLE = object()
+
+
+def _queue_get(update_queue):
+    # таймаут, чтобы поток executor'а не висел на get() при остановке процесса
+    try:
+        return update_queue.get(timeout=1.0)
+    except queue.Empty:
+        return _IDLE
+
+
+def _write_text(path: str, text: str) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+
 class DreamsBot:
     """Telegram бот для осмысления снов"""
     
-    def __init__(self):
-        """Инициализация бота"""
-        self.bot = Bot(token=Config.TELEGRAM_BOT_TOKEN)
+    def __init__(self, worker_index: Optional[int] = None, worker_count: int = 1):
+        """Инициализация бота.
+        worker_index/worker_count — номер процесса в многопроцессном режиме (WORKERS > 1):
+        у каждого воркера свои файлы метрик и логов, история — в общей SQLite.
+        """
+        self.worker_index = worker_index
+        self.worker_count = worker_count
+        session = None
+        if Config.TELEGRAM_API_URL:
+            # локальный Bot API сервер (или его заглушка в бенчмарке)
+            session = AiohttpSession(api=TelegramAPIServer.from_base(Config.TELEGRAM_API_URL))
+        self.bot = Bot(token=Config.TELEGRAM_BOT_TOKEN, session=session)
         self.dp = Dispatcher()
         self.llm_client = LLMClient()
-        self.data_manager = DataManager()
-        self.metrics = MetricsManager()
-        self.events = JSONEventLogger()
+        # Вся блокирующая запись истории и метрик на диск — в отдельном потоке
+        self.writer = BackgroundWriter()
+        # FAST_START: история загружается в фоне, polling начинается сразу
+        self.data_manager = DataManager(writer=self.writer, lazy_load=Config.FAST_START)
+        self.metrics = MetricsManager(
+            path=worker_path("data/metrics.json", worker_index),
+            flush_interval=Config.METRICS_FLUSH_INTERVAL,
+            writer=self.writer,
+        )
+        # Токены и стоимость по дням, моделям и пользователям; общий бюджет делится между воркерами,
+        # пользовательский точен — все сообщения пользователя обрабатывает один воркер
+        self.costs = CostTracker(
+            self.llm_client.prices,
+            daily_budget=Config.LLM_DAILY_BUDGET_USD / max(1, worker_count),
+            user_daily_budget=Config.LLM_USER_DAILY_BUDGET_USD,
+            threshold=Config.LLM_BUDGET_THRESHOLD,
+            path=worker_path("data/costs.json", worker_index),
+            flush_interval=Config.METRICS_FLUSH_INTERVAL,
+            writer=self.writer,
+            retention_days=Config.COSTS_RETENTION_DAYS,
+        )
+        self.events = JSONEventLogger(worker_path("data/events.jsonl", worker_index), **Config.get_log_writer_options())
         self.system_prompt = self.llm_client.create_system_prompt()
+        # Контекст диалога из сохранённой истории в пределах бюджета токенов
+        self.context_builder = None
+        if Config.CONTEXT_ENABLED:
+            self.context_builder = ContextBuilder(
+                max_tokens=Config.CONTEXT_MAX_TOKENS,
+                summarizer=self._summarize_dialogue if Config.CONTEXT_SUMMARY_ENABLED else None,
+                cache_size=Config.CONTEXT_SUMMARY_CACHE_SIZE,
+            )
+        self._background_tasks: set = set()
+        # /profile: одновременно идёт не больше одного профилирования
+        self._profiling = False
+        # Окно склейки сообщений, присланных подряд (0 — выключено)
+        self.coalescer = None
+        if Config.MESSAGE_COALESCE_WINDOW > 0:
+            self.coalescer = MessageCoalescer(
+                window_s=Config.MESSAGE_COALESCE_WINDOW,
+                max_wait_s=Config.MESSAGE_COALESCE_MAX_WAIT,
+            )
+        # Очередь LLM-запросов с пулом воркеров и честностью по пользователям
+        self.scheduler = None
+        if Config.SCHEDULER_ENABLED:
+            self.scheduler = RequestScheduler(
+                workers=Config.SCHEDULER_WORKERS,
+                max_queue=Config.SCHEDULER_MAX_QUEUE,
+            )
+        # Эндпоинт /metrics для Prometheus (опционально)
+        self.loop_lag = EventLoopLagMonitor()
+        self.metrics_server = None
+        # в многопроцессном режиме /metrics отдаёт входной процесс (сумма по воркерам)
+        if Config.METRICS_HTTP_ENABLED and worker_index is None:
+            self.metrics_server = MetricsServer(
+                lambda: self.metrics.metrics,
+                self.runtime_gauges,
+                host=Config.METRICS_HTTP_HOST,
+                port=Config.METRICS_HTTP_PORT,
+            )
         self.setup_handlers()
+        # повторно доставленные обновления (ретраи webhook) не обрабатываются дважды
+        self.deduplicator = UpdateDeduplicator(max_size=Config.UPDATE_DEDUP_SIZE)
+        self.dp.update.outer_middleware(self.deduplicator)
+        # корневой спан трассы на каждое сообщение (включая ожидание загрузки истории)
+        if Config.TRACING_ENABLED:
+            tracer.configure(
+                worker_path(Config.TRACING_PATH, worker_index),
+                sample_rate=Config.TRACING_SAMPLE_RATE,
+                **Config.get_log_writer_options(),
+            )
+            self.dp.message.outer_middleware(self._trace_message)
+        # сообщения, пришедшие до окончания фоновой загрузки истории, ждут её, не блокируя event loop
+        self.dp.message.outer_middleware(self._wait_for_data)
+        self.dp.startup.register(self._on_startup)
         # структурированный файл-лог
-        setup_structured_file_logging()
+        setup_structured_file_logging(worker_path("data/app.jsonl", worker_index), **Config.get_log_writer_options())
         logger.info("Бот инициализирован с LLM и DataManager")
     
     def setup_handlers(self) -> None:
@@ -90,6 +202,12 @@ class DreamsBot:
                 self.events.log_event("export_denied", {"user_id": user_id})
                 return
             
+            try:
+                params = parse_export_args(message.text or "")
+            except ValueError as e:
+                await message.answer(f"❌ {e}\nФормат: /export from=YYYY-MM-DD to=YYYY-MM-DD users=ID,ID")
+                return
+            
             try:
                 # Получаем статистику
                 stats = self.data_manager.get_statistics()
@@ -100,23 +218,22 @@ class DreamsBot:
                     f"📝 Сообщений: {stats['total_messages']}"
                 )
                 
-                # Экспортируем данные
-                export_data = self.data_manager.export_all_history()
-                
-                # Создаем файл для отправки
-                filename = f"export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-                with open(filename, 'w', encoding='utf-8') as f:
-                    f.write(export_data)
-                
-                # Отправляем файл
-                with open(filename, 'rb') as f:
-                    await message.answer_document(
-                        types.BufferedInputFile(f.read(), filename=filename),
-                        caption=stats_text
+                # Потоковая выгрузка в сжатые части на диске (в отдельном потоке)
+                users = iter_export_users(
+                    self.data_manager.iter_user_histories(params["user_ids"]),
+                    since=params["since"],
+                    until=params["until"],
+                )
+                with tempfile.TemporaryDirectory() as tmp_dir:
+                    paths = await asyncio.to_thread(
+                        write_export_parts, users, tmp_dir, max_part_bytes=Config.EXPORT_MAX_PART_BYTES
                     )
+                    for idx, path in enumerate(paths, start=1):
+                        part_text = f"Часть {idx}/{len(paths)}" if len(paths) > 1 else ""
+                        caption = f"{stats_text}\n\n{part_text}".strip() if idx == 1 else part_text
+                        await message.answer_document(types.FSInputFile(path), caption=caption)
+                filename = os.path.basename(paths[0])
                 
-                # Удаляем временный файл
-                os.remove(filename)
                 logger.info(f"Администратор {user_id} экспортировал данные")
                 self.events.log_event("export_ok", {"user_id": user_id, "filename": filename})
                 
@@ -124,6 +241,147 @@ class DreamsBot:
                 await message.answer("❌ Ошибка при экспорте данных.")
                 logger.error(f"Ошибка экспорта для администратора {user_id}: {e}")
         
+        @self.dp.message(Command("stats"))
+        async def handle_stats_command(message: types.Message) -> None:
+            """Краткая статистика (только для администратора)"""
+            user_id = message.from_user.id
+            if not Config.is_admin(user_id):
+                # Тихо игнорируем
+                self.events.log_event("stats_denied", {"user_id": user_id})
+                return
+            stats = self.data_manager.get_statistics()
+            # Сжато: ключевые показатели + LLM-метрики из памяти процесса
+            m = self.metrics_view()
+            pct = percentiles_from(m)
+            avg_ms = 0
+            if m["timings"]["response_ms_count"]:
+                avg_ms = int(m["timings"]["response_ms_sum"] / m["timings"]["response_ms_count"])  # noqa: E501
+            avg_ttft_ms = 0
+            if m["timings"].get("ttft_ms_count"):
+                avg_ttft_ms = int(m["timings"]["ttft_ms_sum"] / m["timings"]["ttft_ms_count"])
+            text = (
+                "📊 Статистика\n"
+                f"👥 Пользователи: {stats['total_users']}\n"
+                f"💬 Сессии: {stats['total_sessions']}\n"
+                f"📝 Сообщения: {stats['total_messages']}\n"
+                f"⚙️ Запросы LLM: {m['totals']['requests']}, ошибки: {m['totals']['errors']}\n"
+                f"🧠 Primary success: {m['llm']['primary_success']}, Fallback success: {m['llm']['fallback_success']}\n"  # noqa: E501
+                f"⏱️ Ср. время ответа: {avg_ms} мс (p50/p95/p99: {pct['p50']}/{pct['p95']}/{pct['p99']})\n"
+                f"⚡ Ср. время до первого токена: {avg_ttft_ms} мс\n"
+            )
+            tokens = m.get("tokens")
+            if tokens:
+                text += (
+                    f"🔢 Токены: {tokens['total']} (prompt {tokens['prompt']}, completion {tokens['completion']}), "
+                    f"догенераций: {m['llm'].get('continuations', 0)}\n"
+                )
+            costs = self.costs_today()
+            spent = costs["total"]
+            if spent["requests"]:
+                budget = ""
+                if Config.LLM_DAILY_BUDGET_USD > 0:
+                    budget = f" из ${Config.LLM_DAILY_BUDGET_USD:.2f} ({spent['cost_usd'] / Config.LLM_DAILY_BUDGET_USD * 100:.0f}%)"
+                text += (
+                    f"💰 Сегодня: ${spent['cost_usd']:.4f}{budget}, токенов "
+                    f"{spent['prompt_tokens'] + spent['completion_tokens']} за {spent['requests']} ответов\n"
+                )
+                for model_name, bucket in top_by_cost(costs["models"]):
+                    text += f"   {model_name}: ${bucket['cost_usd']:.4f}, вызовов {bucket['requests']}\n"
+                top_users = ", ".join(f"{uid} ${b['cost_usd']:.4f}" for uid, b in top_by_cost(costs["users"]))
+                text += f"   топ пользователей: {top_users}\n"
+            cache = m["llm"].get("cache")
+            if cache:
+                text += f"🗄️ Кэш ответов: попаданий {cache['hits']}, промахов {cache['misses']}\n"
+            user_cache = self.data_manager.get_cache_stats()
+            if user_cache:
+                lookups = user_cache["hits"] + user_cache["misses"]
+                ratio = user_cache["hits"] / lookups * 100 if lookups else 0.0
+                text += (
+                    f"👤 Кэш пользователей: {user_cache['users']} в памяти ({user_cache['bytes'] // 1024} КБ), "
+                    f"попаданий {ratio:.0f}%, вытеснено {user_cache['evictions']}\n"
+                )
+            queue = m.get("queue")
+            if queue and queue["wait_ms_count"]:
+                text += (
+                    f"⏳ Очередь: сейчас {queue['depth']}, максимум {queue['max_depth']}, "
+                    f"ср. ожидание {int(queue['wait_ms_sum'] / queue['wait_ms_count'])} мс, отказов {queue['rejected']}\n"
+                )
+            router = m["llm"].get("router") or {}
+            for model_name, health in router.items():
+                text += (
+                    f"🔀 {model_name}: {health['state']}, ошибки {int(health['error_rate'] * 100)}%, "
+                    f"p50/p95 {health['p50_ms']}/{health['p95_ms']} мс\n"
+                )
+            for model_name in m["llm"].get("latency", {}):
+                model_pct = percentiles_from(m, model_name)
+                text += f"📈 {model_name}: p50/p95/p99 {model_pct['p50']}/{model_pct['p95']}/{model_pct['p99']} мс\n"
+            await message.answer(text)
+            self.events.log_event("stats_ok", {"user_id": user_id})
+        
+        @self.dp.message(Command("profile"))
+        async def handle_profile_command(message: types.Message) -> None:
+            """Профилирование процесса на лету: /profile [секунды] [cpu|mem] (только для администратора)"""
+            user_id = message.from_user.id
+            if not Config.is_admin(user_id):
+                logger.warning(f"Пользователь {user_id} попытался выполнить команду /profile без прав администратора")
+                self.events.log_event("profile_denied", {"user_id": user_id})
+                return
+            try:
+                seconds, mode = parse_profile_args(message.text or "", max_seconds=Config.PROFILER_MAX_SECONDS)
+            except ValueError as e:
+                await message.answer(f"❌ {e}\nФормат: /profile [секунды] [cpu|mem]")
+                return
+            if self._profiling:
+                await message.answer("Профилирование уже идёт, дождись результата ⏳")
+                return
+            self._profiling = True
+            try:
+                kind = "стеки потоков и asyncio-задач" if mode == "cpu" else "аллокации памяти (tracemalloc)"
+                await message.answer(f"🔬 Профилирую {seconds} с: {kind}…")
+                stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+                if mode == "mem":
+                    report = await profile_allocations(seconds)
+                    filename = f"allocations_{stamp}.txt"
+                    caption = report.split("\n", 1)[0]
+                else:
+                    profiler = await profile_stacks(seconds, interval=Config.PROFILER_INTERVAL_MS / 1000)
+                    report = profiler.collapsed()
+                    filename = f"profile_{stamp}.collapsed"
+                    caption = profiler.summary()
+                with tempfile.TemporaryDirectory() as tmp_dir:
+                    path = os.path.join(tmp_dir, filename)
+                    await asyncio.to_thread(_write_text, path, report)
+                    # подпись документа в Telegram — до 1024 символов
+                    await message.answer_document(types.FSInputFile(path), caption=caption[:1000])
+                logger.info(f"Администратор {user_id} снял профиль {mode} за {seconds} с")
+                self.events.log_event("profile_ok", {"user_id": user_id, "mode": mode, "seconds": seconds})
+            except Exception as e:
+                await message.answer("❌ Ошибка при профилировании.")
+                logger.error(f"Ошибка профилирования для администратора {user_id}: {e}")
+            finally:
+                self._profiling = False
+
+        @self.dp.message(Command("traces"))
+        async def handle_traces_command(message: types.Message) -> None:
+            """Куда уходит время на горячем пути — по файлу трасс (только для администратора)"""
+            user_id = message.from_user.id
+            if not Config.is_admin(user_id):
+                self.events.log_event("traces_denied", {"user_id": user_id})
+                return
+            if not Config.TRACING_ENABLED:
+                await message.answer("Трассировка выключена (TRACING_ENABLED=false).")
+                return
+            await asyncio.to_thread(tracer.flush)
+            files = [worker_path(Config.TRACING_PATH, self.worker_index)]
+            if self.worker_index is not None:
+                files = [worker_path(Config.TRACING_PATH, index) for index in range(self.worker_count)]
+            # после ротации основная часть окна — в ротированных частях (.gz)
+            paths = [part for path in files for part in trace_files(path)]
+            # файл может быть большим — читаем и агрегируем вне event loop
+            rows = await asyncio.to_thread(lambda: summarize_spans(read_spans(paths)))
+            await message.answer(format_trace_report(rows))
+            self.events.log_event("traces_ok", {"user_id": user_id})
+
         @self.dp.message()
         async def handle_message(message: types.Message) -> None:
             """Обработка обычных сообщений с LLM"""
@@ -140,6 +398,18 @@ class DreamsBot:
             # jsonl событие
             self.events.log_event("message_in", {"user_id": user_id, "text": log_message})
             
+            # Склеиваем фрагменты, присланные подряд, в один запрос
+            if self.coalescer:
+                with tracer.span("coalesce.wait"):
+                    fragments = await self.coalescer.collect(user_id, user_message)
+                if fragments is None:
+                    # фрагмент присоединён к уже ожидающему сообщению пользователя
+                    return
+                if len(fragments) > 1:
+                    user_message = "\n".join(fragments)
+                    logger.info(f"Пользователь {user_id}: склеено фрагментов {len(fragments)}")
+                    self.events.log_event("message_coalesced", {"user_id": user_id, "fragments": len(fragments)})
+            
             # Проверяем, содержит ли сообщение описание сна
             if len(user_message.strip()) < 15:
                 await message.answer(
@@ -151,80 +421,282 @@ class DreamsBot:
             # Сохраняем сообщение пользователя
             self.data_manager.add_message(user_id, username, "user", user_message)
             
-            # Подготовка сообщений для LLM
+            if self.scheduler is None:
+                await self.process_dream(message, user_id, username, user_message)
+                return
+            
+            # Ставим разбор в общую очередь; при глубокой очереди сразу сообщаем позицию
+            position = self.scheduler.position_for(user_id)
+            if position > Config.SCHEDULER_NOTIFY_POSITION:
+                await message.answer(
+                    f"Сейчас разбираю много снов — ты в очереди, позиция {position}. "
+                    "Ответ придёт автоматически ⏳"
+                )
+            try:
+                with tracer.span("scheduler.submit", queue_position=position):
+                    # задание выполнит воркер очереди — спаны разбора привязываем к текущей трассе
+                    await self.scheduler.submit(
+                        user_id, tracer.bind(lambda: self.process_dream(message, user_id, username, user_message))
+                    )
+            except QueueFullError:
+                await message.answer("Сейчас очень много запросов. Пожалуйста, отправь сон чуть позже 🌙")
+                logger.warning(f"Очередь заполнена, запрос пользователя {user_id} отклонён")
+                self.events.log_event("queue_full", {"user_id": user_id})
+
+    @tracer.traced("process_dream")
+    async def process_dream(self, message: types.Message, user_id: str, username: str, user_message: str) -> None:
+        """Разбор сна: запрос к LLM, отправка ответа, сохранение и метрики"""
+        # Подготовка сообщений для LLM
+        user_prompt = f"Проанализируй этот сон: {user_message}"
+        context = None
+        if self.context_builder:
+            with tracer.span("context.build") as span:
+                context = self.context_builder.build(
+                    self.system_prompt, self.data_manager.get_current_session(user_id), user_message, user_prompt
+                )
+                span.set_attribute("tokens", context.tokens)
+            messages = context.messages
+        else:
             messages = [
                 {"role": "system", "content": self.system_prompt},
-                {"role": "user", "content": f"Проанализируй этот сон: {user_message}"}
+                {"role": "user", "content": user_prompt}
             ]
+        
+        # Бюджет на исходе — сначала самые дешёвые модели
+        economy = self.costs.should_economize(user_id)
+        if economy:
+            logger.info(f"Бюджет близок к исчерпанию — экономный выбор модели для пользователя {user_id}")
+        # Получение ответа от LLM (с поддержкой fallback)
+        try:
+            start_ts = datetime.now()
+            if Config.LLM_STREAMING:
+                renderer = TelegramStreamRenderer(message, edit_interval=Config.TELEGRAM_STREAM_EDIT_INTERVAL)
+                response_text, response_meta = await self.llm_client.generate_streaming(
+                    messages, renderer.feed, economy=economy
+                )
+                with tracer.span("telegram.send", streamed=True):
+                    await renderer.finish()
+            else:
+                response_text, response_meta = await self.llm_client.generate_with_fallback(messages, economy=economy)
+                with tracer.span("telegram.send"):
+                    await message.answer(response_text)
             
-            # Получение ответа от LLM (с поддержкой fallback)
-            try:
-                start_ts = datetime.now()
-                response_text, response_meta = await self.llm_client.generate_with_fallback(messages)
-                await message.answer(response_text)
-                
-                # Сохраняем ответ бота
-                self.data_manager.add_message(user_id, username, "assistant", response_text, metadata=response_meta)
-                
-                model_used = response_meta.get("model")
-                is_fallback = response_meta.get("fallback")
-                logger.info(f"Отправлен ответ пользователю {user_id}. Модель: {model_used}, fallback: {is_fallback}")
-                self.events.log_event("message_out", {"user_id": user_id, "model": model_used, "fallback": bool(is_fallback)})
-                # метрики
-                duration_ms = int((datetime.now() - start_ts).total_seconds() * 1000)
-                self.metrics.record_request(
-                    model=model_used,
-                    used_fallback=bool(is_fallback),
-                    success=True,
-                    response_time_ms=duration_ms,
-                    primary_attempt=not bool(is_fallback),
+            # Сохраняем ответ бота
+            self.data_manager.add_message(user_id, username, "assistant", response_text, metadata=response_meta)
+            # сводку выпавших из окна реплик строим уже после ответа, чтобы не задерживать его
+            if context and self.context_builder.needs_summary(context):
+                task = asyncio.create_task(self.context_builder.update_summary(context))
+                self._background_tasks.add(task)
+                task.add_done_callback(self._background_tasks.discard)
+            
+            model_used = response_meta.get("model")
+            is_fallback = response_meta.get("fallback")
+            is_cached = bool(response_meta.get("cached"))
+            # ответ из кэша ничего не стоил
+            cost_usd = 0.0 if is_cached else self.costs.record(user_id, response_meta)
+            logger.info(f"Отправлен ответ пользователю {user_id}. Модель: {model_used}, fallback: {is_fallback}, кэш: {is_cached}")
+            with tracer.span("events.log"):
+                self.events.log_event(
+                    "message_out",
+                    {
+                        "user_id": user_id,
+                        "model": model_used,
+                        "fallback": bool(is_fallback),
+                        "cached": is_cached,
+                        "cost_usd": round(cost_usd, 6),
+                        "economy": economy,
+                    },
                 )
-            except Exception as e:
-                # Специфичные сообщения об ошибках
-                if "rate limit" in str(e).lower():
-                    error_message = "Слишком много запросов. Подождите немного и попробуйте снова."
-                elif "api" in str(e).lower():
-                    error_message = "Проблема с сервисом. Попробуйте позже."
-                else:
-                    error_message = "Извините, произошла ошибка при обработке вашего сообщения. Попробуйте позже."
-                
-                await message.answer(error_message)
-                logger.error(f"Ошибка при обработке сообщения пользователя {user_id}: {e}")
-                self.events.log_event("error", {"user_id": user_id, "error": str(e)})
-
-        @self.dp.message(Command("stats"))
-        async def handle_stats_command(message: types.Message) -> None:
-            """Краткая статистика (только для администратора)"""
-            user_id = message.from_user.id
-            if not Config.is_admin(user_id):
-                # Тихо игнорируем
-                self.events.log_event("stats_denied", {"user_id": user_id})
-                return
-            stats = self.data_manager.get_statistics()
-            # Сжато: ключевые показатели + последние LLM-метрики из файла
-            from .metrics import MetricsManager
-            mm = MetricsManager()
-            m = mm.metrics
-            avg_ms = 0
-            if m["timings"]["response_ms_count"]:
-                avg_ms = int(m["timings"]["response_ms_sum"] / m["timings"]["response_ms_count"])  # noqa: E501
-            text = (
-                "📊 Статистика\n"
-                f"👥 Пользователи: {stats['total_users']}\n"
-                f"💬 Сессии: {stats['total_sessions']}\n"
-                f"📝 Сообщения: {stats['total_messages']}\n"
-                f"⚙️ Запросы LLM: {m['totals']['requests']}, ошибки: {m['totals']['errors']}\n"
-                f"🧠 Primary success: {m['llm']['primary_success']}, Fallback success: {m['llm']['fallback_success']}\n"  # noqa: E501
-                f"⏱️ Ср. время ответа: {avg_ms} мс\n"
+            # метрики
+            duration_ms = int((datetime.now() - start_ts).total_seconds() * 1000)
+            self.metrics.record_request(
+                model=model_used,
+                used_fallback=bool(is_fallback),
+                success=True,
+                response_time_ms=duration_ms,
+                primary_attempt=not bool(is_fallback),
+                ttft_ms=response_meta.get("ttft_ms"),
+                router=self.llm_client.router.snapshot(),
+                cache=self.llm_client.cache.stats() if self.llm_client.cache else None,
+                queue=self.scheduler.stats() if self.scheduler else None,
+                user_cache=self.data_manager.get_cache_stats(),
+                # ответ из кэша токенов не потратил
+                usage=None if is_cached else response_meta.get("usage"),
+                continuations=0 if is_cached else response_meta.get("continuations", 0),
             )
-            await message.answer(text)
-            self.events.log_event("stats_ok", {"user_id": user_id})
-    
-    async def start(self) -> None:
-        """Запуск бота"""
+            hedge = response_meta.get("hedge")
+            if hedge:
+                self.metrics.record_hedge(
+                    launched=hedge["launched"],
+                    cancelled=hedge["cancelled"],
+                    wasted_tokens=hedge["wasted_tokens"],
+                )
+        except Exception as e:
+            # Специфичные сообщения об ошибках
+            if "rate limit" in str(e).lower():
+                error_message = "Слишком много запросов. Подождите немного и попробуйте снова."
+            elif "api" in str(e).lower():
+                error_message = "Проблема с сервисом. Попробуйте позже."
+            else:
+                error_message = "Извините, произошла ошибка при обработке вашего сообщения. Попробуйте позже."
+            
+            await message.answer(error_message)
+            logger.error(f"Ошибка при обработке сообщения пользователя {user_id}: {e}")
+            tracer.set_attributes(error=str(e))
+            self.metrics.record_request(
+                model=None,
+                used_fallback=False,
+                success=False,
+                router=self.llm_client.router.snapshot(),
+                queue=self.scheduler.stats() if self.scheduler else None,
+                user_cache=self.data_manager.get_cache_stats(),
+            )
+            self.events.log_event("error", {"user_id": user_id, "error": str(e)})
+
+    def metrics_view(self) -> dict:
+        """Метрики для /stats: свои из памяти плюс последние сброшенные на диск у остальных воркеров"""
+        if self.worker_index is None:
+            return self.metrics.metrics
+        parts = [self.metrics.metrics]
+        for index in range(self.worker_count):
+            if index != self.worker_index:
+                parts.append(read_metrics_file(worker_path("data/metrics.json", index)))
+        return merge_metrics(parts)
+
+    async def _summarize_dialogue(self, previous_summary: str, turns: list, user_id: str) -> str:
+        """Сводка диалога для ContextBuilder: тот же бюджет и учёт расходов, что и у ответов"""
+        summary, meta = await self.llm_client.summarize_dialogue(
+            previous_summary, turns, economy=self.costs.should_economize(user_id)
+        )
+        self.costs.record(user_id, meta, request=False)
+        return summary
+
+    def costs_today(self) -> dict:
+        """Расходы за сегодня для /stats: свои плюс сброшенные на диск у остальных воркеров"""
+        if self.worker_index is None:
+            return self.costs.today()
+        parts = [self.costs.state]
+        for index in range(self.worker_count):
+            if index != self.worker_index:
+                parts.append(read_metrics_file(worker_path("data/costs.json", index)))
+        return self.costs.today(merge_metrics(parts))
+
+    def runtime_gauges(self) -> dict:
+        """Текущее состояние процесса для эндпоинта /metrics"""
+        gauges = {
+            "dreams_event_loop_lag_seconds": round(self.loop_lag.last_lag_s, 6),
+            "dreams_event_loop_lag_max_seconds": round(self.loop_lag.max_lag_s, 6),
+            "dreams_process_rss_bytes": process_rss_bytes(),
+            "dreams_persistence_pending": self.writer.stats()["pending"],
+            "dreams_updates_duplicate": self.deduplicator.duplicates,
+        }
+        if self.scheduler:
+            queue = self.scheduler.stats()
+            gauges["dreams_queue_depth"] = queue["depth"]
+            gauges["dreams_queue_in_flight"] = queue["in_flight"]
+            gauges["dreams_queue_rejected"] = queue["rejected"]
+        for name, size in storage_sizes("data").items():
+            gauges[f'dreams_storage_bytes{{file="{name}"}}'] = size
+        return gauges
+
+    async def _trace_message(self, handler, event, data):
+        with tracer.span("handle_message", user_id=str(event.from_user.id) if event.from_user else None):
+            return await handler(event, data)
+
+    async def _wait_for_data(self, handler, event, data):
+        await self.data_manager.wait_loaded()
+        return await handler(event, data)
+
+    async def _on_startup(self) -> None:
+        """Polling запущен: отчёт о времени старта, фоновая догрузка истории и тяжёлых модулей"""
+        startup_timer.mark("до polling")
+        logger.info(startup_timer.report())
+        self.events.log_event("startup", {"phases": startup_timer.phases()})
+        task = asyncio.create_task(self._finish_background_startup())
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+
+    async def _finish_background_startup(self) -> None:
+        await asyncio.to_thread(preload_heavy_modules)
+        await self.data_manager.wait_loaded()
+        elapsed = startup_timer.mark("фоновая загрузка")
+        logger.info(f"История и зависимости LLM загружены через {elapsed:.2f} с после старта процесса")
+        self.events.log_event("startup_complete", {"seconds": round(elapsed, 3)})
+
+    async def _consume_updates(self, update_queue) -> None:
+        """Режим воркера: обновления приходят из очереди входного процесса (None — остановка)"""
+        loop = asyncio.get_running_loop()
+        await self.dp.emit_startup(bot=self.bot)
+        in_flight: set = set()
+        try:
+            while True:
+                raw = await loop.run_in_executor(None, _queue_get, update_queue)
+                if raw is _IDLE:
+                    continue
+                if raw is None:
+                    break
+                task = asyncio.create_task(self.dp.feed_raw_update(self.bot, raw))
+                in_flight.add(task)
+                task.add_done_callback(in_flight.discard)
+            await asyncio.gather(*in_flight, return_exceptions=True)
+        finally:
+            await self.dp.emit_shutdown(bot=self.bot)
+
+    async def start(self, update_queue=None) -> None:
+        """Запуск бота (update_queue — очередь обновлений в режиме воркера)"""
         logger.info("Запуск бота...")
         try:
-            await self.dp.start_polling(self.bot)
+            await self.start_services()
+            if update_queue is not None:
+                await self._consume_updates(update_queue)
+            elif Config.BOT_MODE == "webhook":
+                await run_webhook(
+                    self.dp,
+                    self.bot,
+                    host=Config.WEBHOOK_HOST,
+                    port=Config.WEBHOOK_PORT,
+                    path=Config.WEBHOOK_PATH,
+                    secret_token=Config.WEBHOOK_SECRET or None,
+                    public_url=Config.WEBHOOK_URL,
+                    reuse_port=Config.WEBHOOK_REUSE_PORT,
+                )
+            else:
+                # polling и webhook взаимоисключающие: снимаем webhook, оставшийся от прошлого запуска
+                await self.bot.delete_webhook()
+                await self.dp.start_polling(self.bot)
         except Exception as e:
             logger.error(f"Ошибка при запуске бота: {e}")
-            raise 
\ No newline at end of file
+            raise
+        finally:
+            await self.shutdown()
+
+    async def start_services(self) -> None:
+        """Фоновые службы бота: очередь запросов, сброс метрик, эндпоинт /metrics"""
+        if self.scheduler:
+            self.scheduler.start()
+        self.metrics.start_autoflush()
+        self.costs.start_autoflush()
+        if self.metrics_server:
+            self.loop_lag.start()
+            await self.metrics_server.start()
+
+    async def shutdown(self) -> None:
+        """Graceful shutdown: останавливаем очередь, дожидаемся фоновой записи и сбрасываем журнал
+        данных в снимок, закрываем пул LLM
+        """
+        if self.metrics_server:
+            await self.metrics_server.stop()
+            await self.loop_lag.stop()
+        if self.scheduler:
+            await self.scheduler.stop()
+        for task in list(self._background_tasks):
+            task.cancel()
+        await asyncio.gather(*self._background_tasks, return_exceptions=True)
+        self.data_manager.close()
+        self.events.close()
+        await self.metrics.close()
+        await self.costs.close()
+        self.writer.close()
+        tracer.close()
+        await self.llm_client.close()
+        await self.bot.session.close()
@@ -0,0 +1,106 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_text(text: str) -> str:
+    """Нормализация для ключа кэша: регистр и пробелы не важны"""
+    return re.sub(r"\s+", " ", text or "").strip().lower()
+
+
+def make_cache_key(model: str, messages: list) -> str:
+    """Ключ кэша: хэш модели и нормализованных сообщений (системный промпт + текст сна)"""
+    digest = hashlib.sha256(model.encode("utf-8"))
+    for msg in messages:
+        digest.update(b"\x00" + msg.get("role", "").encode("utf-8") + b"\x00")
+        digest.update(normalize_text(msg.get("content", "")).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class ResponseCache:
+    """LRU-кэш ответов LLM с TTL и опциональным сохранением на диск"""
+
+    def __init__(
+        self,
+        *,
+        max_entries: int = 1000,
+        ttl_s: float = 86400.0,
+        path: Optional[str] = None,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.max_entries = max(1, max_entries)
+        self.ttl_s = ttl_s
+        self.path = path or None
+        self._clock = clock
+        self._entries: "OrderedDict[str, dict]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if self.path:
+            self._load()
+
+    def get(self, key: str) -> Optional[tuple[str, dict]]:
+        entry = self._entries.get(key)
+        if entry is not None and self._clock() - entry["created_at"] > self.ttl_s:
+            del self._entries[key]
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry["text"], dict(entry["meta"])
+
+    def put(self, key: str, text: str, meta: dict) -> None:
+        self._entries[key] = {"text": text, "meta": dict(meta), "created_at": self._clock()}
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, int]:
+        """Счётчики для метрик"""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": len(self._entries),
+        }
+
+    def _load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+        except Exception as e:
+            logger.warning(f"Не удалось прочитать кэш {self.path}: {e}")
+            return
+        now = self._clock()
+        # порядок в файле — от давно использованных к недавним
+        for key, entry in entries.items():
+            if now - entry.get("created_at", 0) <= self.ttl_s:
+                self._entries[key] = entry
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        logger.info(f"Загружен кэш ответов: {len(self._entries)} записей")
+
+    def save(self) -> None:
+        """Сохранить кэш на диск (если задан путь)"""
+        if not self.path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._entries, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logger.warning(f"Не удалось сохранить кэш {self.path}: {e}")
@@ -0,0 +1,44 @@
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class MessageCoalescer:
+    """Склейка сообщений, которые пользователь присылает подряд.
+    Telegram-клиенты режут длинный текст на части; фрагменты, пришедшие в течение
+    window_s секунд друг за другом, объединяются в один запрос к LLM.
+    """
+
+    def __init__(self, window_s: float = 2.0, max_wait_s: float = 10.0) -> None:
+        self.window_s = window_s
+        self.max_wait_s = max_wait_s
+        self._buffers: Dict[str, List[str]] = {}
+        self._deadlines: Dict[str, float] = {}
+
+    async def collect(self, user_id: str, text: str) -> Optional[List[str]]:
+        """Добавить фрагмент. Первый вызов ждёт окончания окна и возвращает все фрагменты;
+        последующие вызовы в пределах окна возвращают None — их текст уже учтён.
+        """
+        now = time.monotonic()
+        if user_id in self._buffers:
+            self._buffers[user_id].append(text)
+            self._deadlines[user_id] = now + self.window_s
+            return None
+        self._buffers[user_id] = [text]
+        self._deadlines[user_id] = now + self.window_s
+        started = now
+        try:
+            while True:
+                # каждый новый фрагмент продлевает окно, но не дольше max_wait_s
+                deadline = min(self._deadlines[user_id], started + self.max_wait_s)
+                delay = deadline - time.monotonic()
+                if delay <= 0:
+                    break
+                await asyncio.sleep(delay)
+            return self._buffers[user_id]
+        finally:
+            self._buffers.pop(user_id, None)
+            self._deadlines.pop(user_id, None)
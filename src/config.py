@@ -4,6 +4,23 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+
+def _env_int(name: str, default: int) -> int:
+    """Целое из окружения; при некорректном значении — значение по умолчанию"""
+    try:
+        return int(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    """Число с плавающей точкой из окружения; при ошибке — значение по умолчанию"""
+    try:
+        return float(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
 class Config:
     """Конфигурация приложения из переменных окружения"""
     
@@ -26,7 +43,125 @@ class Config:
         LLM_MAX_TOKENS = int(os.getenv("LLM_MAX_TOKENS", "1200"))
     except ValueError:
         LLM_MAX_TOKENS = 1200
-    LLM_BASE_URL = "https://openrouter.ai/api/v1"
+    LLM_BASE_URL = os.getenv("LLM_BASE_URL", "https://openrouter.ai/api/v1")
+    # Пул HTTP-соединений к OpenRouter и ограничение параллельных запросов
+    LLM_MAX_CONCURRENCY = _env_int("LLM_MAX_CONCURRENCY", 16)
+    LLM_MAX_CONNECTIONS = _env_int("LLM_MAX_CONNECTIONS", 20)
+    LLM_MAX_KEEPALIVE_CONNECTIONS = _env_int("LLM_MAX_KEEPALIVE_CONNECTIONS", 10)
+    LLM_KEEPALIVE_EXPIRY = _env_float("LLM_KEEPALIVE_EXPIRY", 30.0)
+    LLM_TIMEOUT = _env_float("LLM_TIMEOUT", 60.0)
+    # Как часто сбрасывать метрики из памяти в data/metrics.json, секунды
+    METRICS_FLUSH_INTERVAL = _env_float("METRICS_FLUSH_INTERVAL", 10.0)
+    # HTTP-эндпоинт /metrics в формате Prometheus (по умолчанию выключен, слушает только localhost)
+    METRICS_HTTP_ENABLED = os.getenv("METRICS_HTTP_ENABLED", "false").lower() == "true"
+    METRICS_HTTP_HOST = os.getenv("METRICS_HTTP_HOST", "127.0.0.1")
+    METRICS_HTTP_PORT = _env_int("METRICS_HTTP_PORT", 9108)
+    # Трассировка горячего пути: спаны в формате OTLP/JSON в локальный файл (отчёт — /traces)
+    TRACING_ENABLED = os.getenv("TRACING_ENABLED", "false").lower() == "true"
+    TRACING_PATH = os.getenv("TRACING_PATH", "data/traces.jsonl")
+    TRACING_SAMPLE_RATE = _env_float("TRACING_SAMPLE_RATE", 1.0)
+    # Максимальный размер одной части /export (лимит Telegram на документ — 50 МБ)
+    EXPORT_MAX_PART_BYTES = _env_int("EXPORT_MAX_PART_BYTES", 45 * 1024 * 1024)
+    # /profile: предел длительности профилирования и период выборки стеков
+    PROFILER_MAX_SECONDS = _env_int("PROFILER_MAX_SECONDS", 60)
+    PROFILER_INTERVAL_MS = _env_int("PROFILER_INTERVAL_MS", 10)
+    # Цены моделей, USD за 1M токенов: "модель=prompt:completion,..." (модели без цены считаются бесплатными)
+    LLM_PRICES = os.getenv("LLM_PRICES", "")
+    # Дневные бюджеты, USD (0 — без ограничения): на весь бот и на одного пользователя.
+    # С доли LLM_BUDGET_THRESHOLD бюджета запросы идут сначала в самые дешёвые модели
+    LLM_DAILY_BUDGET_USD = _env_float("LLM_DAILY_BUDGET_USD", 0.0)
+    LLM_USER_DAILY_BUDGET_USD = _env_float("LLM_USER_DAILY_BUDGET_USD", 0.0)
+    LLM_BUDGET_THRESHOLD = _env_float("LLM_BUDGET_THRESHOLD", 0.8)
+    COSTS_RETENTION_DAYS = _env_int("COSTS_RETENTION_DAYS", 31)
+    # Кэш ответов LLM: TTL в секундах, размер LRU, файл для сохранения между перезапусками (пусто — только память)
+    LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+    LLM_CACHE_TTL = _env_float("LLM_CACHE_TTL", 86400.0)
+    LLM_CACHE_MAX_ENTRIES = _env_int("LLM_CACHE_MAX_ENTRIES", 1000)
+    LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "")
+    # Роутер моделей: circuit breaker и понижение деградировавших моделей в порядке кандидатов
+    LLM_ROUTER_ENABLED = os.getenv("LLM_ROUTER_ENABLED", "true").lower() == "true"
+    LLM_ROUTER_WINDOW = _env_int("LLM_ROUTER_WINDOW", 50)
+    LLM_ROUTER_MIN_SAMPLES = _env_int("LLM_ROUTER_MIN_SAMPLES", 10)
+    LLM_ROUTER_SLOW_P95_MS = _env_int("LLM_ROUTER_SLOW_P95_MS", 0)  # 0 — не учитывать задержку
+    LLM_BREAKER_FAILURES = _env_int("LLM_BREAKER_FAILURES", 3)
+    LLM_BREAKER_ERROR_RATE = _env_float("LLM_BREAKER_ERROR_RATE", 0.5)
+    LLM_BREAKER_COOLDOWN = _env_float("LLM_BREAKER_COOLDOWN", 60.0)
+    # Hedging: параллельный запуск следующей модели, если текущая не ответила к дедлайну.
+    # Дедлайн — квантиль LLM_HEDGE_QUANTILE недавних задержек модели,
+    # пока замеров меньше LLM_HEDGE_MIN_SAMPLES — фиксированный LLM_HEDGE_DELAY_MS
+    LLM_HEDGING = os.getenv("LLM_HEDGING", "false").lower() == "true"
+    LLM_HEDGE_QUANTILE = _env_float("LLM_HEDGE_QUANTILE", 0.9)
+    LLM_HEDGE_DELAY_MS = _env_int("LLM_HEDGE_DELAY_MS", 8000)
+    LLM_HEDGE_MIN_SAMPLES = _env_int("LLM_HEDGE_MIN_SAMPLES", 10)
+    # Склейка сообщений, присланных подряд: окно тишины и максимальное ожидание, секунды.
+    # По умолчанию выключена: окно добавляется к задержке каждого ответа, даже на одиночное сообщение
+    MESSAGE_COALESCE_WINDOW = _env_float("MESSAGE_COALESCE_WINDOW", 0.0)
+    MESSAGE_COALESCE_MAX_WAIT = _env_float("MESSAGE_COALESCE_MAX_WAIT", 10.0)
+    # Очередь запросов к LLM: воркеры, предел очереди, с какой позиции сообщать пользователю об ожидании
+    SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "true").lower() == "true"
+    SCHEDULER_WORKERS = _env_int("SCHEDULER_WORKERS", 8)
+    SCHEDULER_MAX_QUEUE = _env_int("SCHEDULER_MAX_QUEUE", 200)
+    SCHEDULER_NOTIFY_POSITION = _env_int("SCHEDULER_NOTIFY_POSITION", 3)
+    # Потоковый вывод ответа с постепенным редактированием сообщения в Telegram
+    LLM_STREAMING = os.getenv("LLM_STREAMING", "false").lower() == "true"
+    TELEGRAM_STREAM_EDIT_INTERVAL = _env_float("TELEGRAM_STREAM_EDIT_INTERVAL", 1.0)
+
+    # Сессия закрывается, если пользователь молчал дольше этого времени, секунды (0 — одна сессия навсегда)
+    SESSION_IDLE_TIMEOUT = _env_float("SESSION_IDLE_TIMEOUT", 1800.0)
+    # LRU текущих сессий активных пользователей поверх SQLite (0 — без кэша)
+    USER_CACHE_MAX_USERS = _env_int("USER_CACHE_MAX_USERS", 1000)
+    USER_CACHE_MAX_BYTES = _env_int("USER_CACHE_MAX_BYTES", 64 * 1024 * 1024)
+    # Контекст диалога: последние реплики сессии в пределах бюджета токенов, более ранние — сводкой.
+    # По умолчанию выключен: меняет состав запроса к LLM и добавляет фоновые вызовы для сводок
+    CONTEXT_ENABLED = os.getenv("CONTEXT_ENABLED", "false").lower() == "true"
+    CONTEXT_MAX_TOKENS = _env_int("CONTEXT_MAX_TOKENS", 3000)
+    CONTEXT_SUMMARY_ENABLED = os.getenv("CONTEXT_SUMMARY_ENABLED", "false").lower() == "true"
+    CONTEXT_SUMMARY_MAX_TOKENS = _env_int("CONTEXT_SUMMARY_MAX_TOKENS", 300)
+    CONTEXT_SUMMARY_CACHE_SIZE = _env_int("CONTEXT_SUMMARY_CACHE_SIZE", 1000)
+
+    # Адрес Bot API (пусто — api.telegram.org), например локальный telegram-bot-api сервер
+    TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "")
+    # Приём обновлений: polling (локальный запуск) или webhook на локальном aiohttp-сервере за ingress
+    BOT_MODE = os.getenv("BOT_MODE", "polling").lower()
+    WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+    WEBHOOK_PORT = _env_int("WEBHOOK_PORT", 8080)
+    WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram/webhook")
+    WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+    WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+    WEBHOOK_REUSE_PORT = os.getenv("WEBHOOK_REUSE_PORT", "false").lower() == "true"
+    UPDATE_DEDUP_SIZE = _env_int("UPDATE_DEDUP_SIZE", 10000)
+
+    # Многопроцессный режим: число воркеров (1 — один процесс) и размер очереди обновлений каждого
+    WORKERS = _env_int("WORKERS", 1)
+    WORKER_QUEUE_SIZE = _env_int("WORKER_QUEUE_SIZE", 1000)
+
+    # Быстрый старт: история загружается в фоне, polling начинается сразу
+    FAST_START = os.getenv("FAST_START", "true").lower() == "true"
+
+    # Фоновая запись data/events.jsonl и data/app.jsonl: пакетный сброс и ротация
+    LOG_BATCH_SIZE = _env_int("LOG_BATCH_SIZE", 100)
+    LOG_FLUSH_INTERVAL = _env_float("LOG_FLUSH_INTERVAL", 1.0)
+    LOG_ROTATE_BYTES = _env_int("LOG_ROTATE_BYTES", 50 * 1024 * 1024)
+    LOG_ROTATE_INTERVAL = _env_float("LOG_ROTATE_INTERVAL", 0.0)
+    LOG_BACKUP_COUNT = _env_int("LOG_BACKUP_COUNT", 5)
+    LOG_COMPRESS = os.getenv("LOG_COMPRESS", "true").lower() == "true"
+
+    # Хранилище истории: journal (снимок + журнал JSONL), json (полная перезапись файла) или sqlite
+    DATA_STORAGE_BACKEND = os.getenv("DATA_STORAGE_BACKEND", "journal").lower()
+    # Через сколько записей журнала делать компактизацию в снимок
+    DATA_JOURNAL_COMPACT_EVERY = _env_int("DATA_JOURNAL_COMPACT_EVERY", 500)
+
+    @classmethod
+    def get_log_writer_options(cls) -> dict:
+        """Параметры фоновой записи JSONL-логов"""
+        return {
+            "batch_size": cls.LOG_BATCH_SIZE,
+            "flush_interval": cls.LOG_FLUSH_INTERVAL,
+            "max_bytes": cls.LOG_ROTATE_BYTES,
+            "rotate_interval": cls.LOG_ROTATE_INTERVAL,
+            "backup_count": cls.LOG_BACKUP_COUNT,
+            "compress": cls.LOG_COMPRESS,
+        }
 
     @classmethod
     def get_fallback_models(cls) -> list[str]:
@@ -57,6 +192,30 @@ class Config:
             except ValueError:
                 raise ValueError("ADMIN_USER_ID должен быть числом")
 
+        # Проверка бэкенда хранилища
+        storage_backend = os.getenv("DATA_STORAGE_BACKEND", "journal").lower()
+        if storage_backend not in ("journal", "json", "sqlite"):
+            raise ValueError("DATA_STORAGE_BACKEND должен быть одним из: ['journal', 'json', 'sqlite']")
+
+        # Проверка режима приёма обновлений
+        bot_mode = os.getenv("BOT_MODE", "polling").lower()
+        if bot_mode not in ("polling", "webhook"):
+            raise ValueError("BOT_MODE должен быть одним из: ['polling', 'webhook']")
+        if bot_mode == "webhook" and not os.getenv("WEBHOOK_SECRET"):
+            raise ValueError("Для BOT_MODE=webhook нужен WEBHOOK_SECRET (проверка заголовка X-Telegram-Bot-Api-Secret-Token)")
+
+        # Несколько процессов пишут в одно хранилище безопасно только через транзакции SQLite
+        workers = os.getenv("WORKERS", "1")
+        if not workers.isdigit() or int(workers) < 1:
+            raise ValueError("WORKERS должен быть целым числом >= 1")
+        if int(workers) > 1 and storage_backend != "sqlite":
+            raise ValueError("Для WORKERS > 1 нужен DATA_STORAGE_BACKEND=sqlite")
+        # с SO_REUSEPORT обновление (и повтор Telegram) попадает в любой из процессов на порту:
+        # дедупликация, склейка, очередь и кэш пользователя разъезжаются по ним, а шардирование
+        # по user_id в воркеры обходится — несколько процессов поднимаются только через WORKERS
+        if int(workers) > 1 and os.getenv("WEBHOOK_REUSE_PORT", "false").lower() == "true":
+            raise ValueError("WEBHOOK_REUSE_PORT несовместим с WORKERS > 1: обновления раздаёт входной процесс")
+
         # Проверка настроек LLM
         openrouter_key = os.getenv("OPENROUTER_API_KEY")
         if not openrouter_key:
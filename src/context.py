@@ -0,0 +1,162 @@
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+from .cache import normalize_text
+
+logger = logging.getLogger(__name__)
+
+# Служебные токены на каждое сообщение в chat-формате (роль, разделители)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# (предыдущая сводка, новые реплики, user_id) -> новая сводка
+Summarizer = Callable[[str, List[dict], str], Awaitable[str]]
+
+
+def estimate_tokens(text: str) -> int:
+    """Грубая локальная оценка числа токенов без токенизатора модели.
+    Для BPE-токенизаторов кириллица занимает заметно больше токенов на символ, чем латиница:
+    ~2.5 символа на токен против ~4.
+    """
+    if not text:
+        return 0
+    cyrillic = sum(1 for ch in text if "Ѐ" <= ch <= "ӿ")
+    return int(cyrillic / 2.5 + (len(text) - cyrillic) / 4) + 1
+
+
+def message_tokens(message: dict) -> int:
+    return estimate_tokens(message.get("content", "")) + MESSAGE_OVERHEAD_TOKENS
+
+
+@dataclass
+class ContextWindow:
+    """Результат сборки контекста: сообщения для LLM и что осталось досуммаризировать"""
+
+    messages: List[dict]
+    session_key: Optional[Tuple[str, str]] = None
+    turns: List[dict] = field(default_factory=list)
+    window_start: int = 0  # первая реплика, вошедшая в контекст целиком
+    summary_covered: int = 0  # сколько первых реплик покрывает использованная сводка
+    tokens: int = 0
+
+
+class ContextBuilder:
+    """Контекст диалога в пределах бюджета токенов.
+    Последние реплики текущей сессии идут как есть; более ранние заменяются сводкой,
+    которая обновляется инкрементально (старая сводка + выпавшие реплики) и кэшируется по сессии.
+    """
+
+    def __init__(self, max_tokens: int = 2000, summarizer: Optional[Summarizer] = None, cache_size: int = 1000) -> None:
+        self.max_tokens = max_tokens
+        self.summarizer = summarizer
+        self.cache_size = max(1, cache_size)
+        # (user_id, session_id) -> (число покрытых реплик, текст сводки)
+        self._summaries: "OrderedDict[Tuple[str, str], Tuple[int, str]]" = OrderedDict()
+        self._updating: set = set()
+
+    @staticmethod
+    def previous_turns(history: Optional[dict], user_message: str) -> Tuple[Optional[Tuple[str, str]], List[dict]]:
+        """Реплики последней сессии до текущего сообщения пользователя (оно уже сохранено в истории).
+        Более ранние копии того же сообщения (сон прислан повторно) вместе с ответами на них
+        пропускаются: иначе модель видит сон дважды.
+        """
+        if not history or not history.get("sessions"):
+            return None, []
+        session = history["sessions"][-1]
+        messages = session.get("messages", [])
+        end = len(messages)
+        for idx in range(len(messages) - 1, -1, -1):
+            if messages[idx].get("role") == "user" and messages[idx].get("content") == user_message:
+                end = idx
+                break
+        resent = normalize_text(user_message)
+        turns = []
+        skip_answer = False
+        for m in messages[:end]:
+            if m["role"] == "user" and normalize_text(m["content"]) == resent:
+                skip_answer = True
+                continue
+            if skip_answer and m["role"] == "assistant":
+                skip_answer = False
+                continue
+            skip_answer = False
+            turns.append({"role": m["role"], "content": m["content"]})
+        return (history.get("user_id"), session.get("session_id")), turns
+
+    def build(self, system_prompt: str, history: Optional[dict], user_message: str, user_prompt: str) -> ContextWindow:
+        """Собрать [system, (сводка), последние реплики..., текущий запрос]"""
+        system = {"role": "system", "content": system_prompt}
+        current = {"role": "user", "content": user_prompt}
+        key, turns = self.previous_turns(history, user_message)
+        budget = self.max_tokens - message_tokens(system) - message_tokens(current)
+        start = self._fit(turns, 0, budget)
+
+        summary_message = None
+        covered = 0
+        if start > 0 and key in self._summaries:
+            covered, summary_text = self._summaries[key]
+            self._summaries.move_to_end(key)
+            summary_message = {
+                "role": "system",
+                "content": f"Краткое содержание начала этого диалога:\n{summary_text}",
+            }
+            # реплики, уже вошедшие в сводку, повторно не отправляем
+            start = self._fit(turns, min(covered, len(turns)), budget - message_tokens(summary_message))
+
+        messages = [system]
+        if summary_message:
+            messages.append(summary_message)
+        messages.extend(turns[start:])
+        messages.append(current)
+        return ContextWindow(
+            messages=messages,
+            session_key=key,
+            turns=turns,
+            window_start=start,
+            summary_covered=covered,
+            tokens=sum(message_tokens(m) for m in messages),
+        )
+
+    @staticmethod
+    def _fit(turns: List[dict], lower: int, budget: int) -> int:
+        """Индекс первой реплики: самые свежие реплики из turns[lower:], помещающиеся в бюджет"""
+        start = len(turns)
+        used = 0
+        for idx in range(len(turns) - 1, lower - 1, -1):
+            used += message_tokens(turns[idx])
+            if used > budget:
+                break
+            start = idx
+        return start
+
+    def needs_summary(self, window: ContextWindow) -> bool:
+        """Часть реплик не попала ни в окно, ни в сводку"""
+        return (
+            self.summarizer is not None
+            and window.session_key is not None
+            and window.window_start > window.summary_covered
+            and window.session_key not in self._updating
+        )
+
+    async def update_summary(self, window: ContextWindow) -> None:
+        """Дописать в сводку сессии реплики, выпавшие из окна (вызывается после ответа пользователю)"""
+        if not self.needs_summary(window):
+            return
+        key = window.session_key
+        self._updating.add(key)
+        try:
+            covered, previous = self._summaries.get(key, (0, ""))
+            dropped = window.turns[covered:window.window_start]
+            if not dropped:
+                return
+            summary = await self.summarizer(previous, dropped, key[0])
+            self._summaries[key] = (window.window_start, summary.strip())
+            self._summaries.move_to_end(key)
+            while len(self._summaries) > self.cache_size:
+                self._summaries.popitem(last=False)
+            logger.info(f"Сводка сессии {key[1]} обновлена: покрыто реплик {window.window_start}")
+        except Exception as e:
+            logger.warning(f"Не удалось обновить сводку диалога: {e}")
+        finally:
+            self._updating.discard(key)
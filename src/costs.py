@@ -0,0 +1,185 @@
+"""
+Учёт токенов и стоимости запросов к LLM: по дням, моделям и пользователям, с дневными бюджетами.
+Цены задаются в конфигурации (USD за 1M токенов prompt/completion), итоги обновляются
+инкрементально на каждый ответ и периодически сбрасываются в data/costs.json.
+"""
+
+import json
+import logging
+import os
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from .persistence import BackgroundWriter, PeriodicFlusher
+
+logger = logging.getLogger(__name__)
+
+Prices = Dict[str, Tuple[float, float]]
+
+
+def parse_prices(spec: str) -> Prices:
+    """'openai/gpt-4o=2.5:10,openai/gpt-4o-mini=0.15:0.6' -> {модель: (prompt, completion)} USD за 1M токенов"""
+    prices: Prices = {}
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        try:
+            model, rates = item.rsplit("=", 1)
+            prompt, completion = rates.split(":")
+            prices[model.strip()] = (float(prompt), float(completion))
+        except ValueError:
+            logger.warning(f"Некорректная цена модели в LLM_PRICES: {item}")
+    return prices
+
+
+def request_cost(prices: Prices, model: Optional[str], usage: Optional[dict]) -> float:
+    """Стоимость одного ответа в USD; модель без цены считается бесплатной"""
+    if not usage or model not in prices:
+        return 0.0
+    prompt_price, completion_price = prices[model]
+    prompt = int(usage.get("prompt_tokens") or 0)
+    completion = int(usage.get("completion_tokens") or 0)
+    return (prompt * prompt_price + completion * completion_price) / 1_000_000
+
+
+def cheapest_first(models: List[str], prices: Prices) -> List[str]:
+    """Кандидаты по возрастанию цены (prompt + completion), порядок равных сохраняется.
+    Модель без цены, как и в учёте (request_cost), считается бесплатной и идёт первой.
+    """
+    return sorted(models, key=lambda m: sum(prices.get(m, (0.0, 0.0))))
+
+
+def response_charges(meta: dict) -> List[Tuple[Optional[str], Optional[dict]]]:
+    """Все оплаченные вызовы ответа: сам ответ (с догенерациями) и отброшенные «сухие» ответы других моделей"""
+    charges = [(meta.get("model"), meta.get("usage"))]
+    for item in meta.get("discarded", []):
+        charges.append((item.get("model"), item.get("usage")))
+    return charges
+
+
+def _new_bucket() -> Dict[str, float]:
+    return {"requests": 0, "prompt_tokens": 0, "completion_tokens": 0, "cost_usd": 0.0}
+
+
+def _add(bucket: Dict[str, float], usage: dict, cost: float, requests: int) -> None:
+    bucket["requests"] += requests
+    bucket["prompt_tokens"] += int(usage.get("prompt_tokens") or 0)
+    bucket["completion_tokens"] += int(usage.get("completion_tokens") or 0)
+    bucket["cost_usd"] = round(bucket["cost_usd"] + cost, 8)
+
+
+class CostTracker(PeriodicFlusher):
+    """Итоги по дням: {"days": {"YYYY-MM-DD": {"total": ..., "models": {...}, "users": {...}}}}.
+    daily_budget / user_daily_budget — дневные бюджеты процесса и пользователя в USD (0 — без ограничения);
+    с доли threshold бюджета запросы переводятся на более дешёвые модели.
+    Запись на диск — как у метрик (PeriodicFlusher): раз в flush_interval секунд при изменениях, через writer.
+    """
+
+    flush_key_prefix = "costs"
+
+    def __init__(
+        self,
+        prices: Prices,
+        *,
+        daily_budget: float = 0.0,
+        user_daily_budget: float = 0.0,
+        threshold: float = 0.8,
+        path: str = "data/costs.json",
+        flush_interval: float = 10.0,
+        writer: Optional[BackgroundWriter] = None,
+        retention_days: int = 31,
+        clock: Callable[[], datetime] = datetime.now,
+    ) -> None:
+        self.prices = prices
+        self.daily_budget = daily_budget
+        self.user_daily_budget = user_daily_budget
+        self.threshold = threshold
+        self.path = path
+        self.flush_interval = flush_interval
+        self.writer = writer
+        self.retention_days = max(1, retention_days)
+        self._clock = clock
+        self._state: Optional[dict] = None
+        self._init_flusher()
+        self._unpriced_warned: set = set()
+
+    @property
+    def state(self) -> dict:
+        if self._state is None:
+            self._state = self._load()
+        return self._state
+
+    def _load(self) -> dict:
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    return json.load(f)
+            except Exception as e:
+                logger.warning(f"Не удалось прочитать {self.path}: {e}")
+        return {"days": {}, "updated_at": None}
+
+    def _today_key(self) -> str:
+        return self._clock().strftime("%Y-%m-%d")
+
+    def _day(self, key: str) -> dict:
+        days = self.state["days"]
+        day = days.get(key)
+        if day is None:
+            day = days[key] = {"total": _new_bucket(), "models": {}, "users": {}}
+            # старые дни отбрасываем, чтобы файл не рос бесконечно
+            for old in sorted(days)[:-self.retention_days]:
+                del days[old]
+        return day
+
+    def record(self, user_id: str, meta: dict, request: bool = True) -> float:
+        """Учесть ответ LLM (meta из LLMClient); вернуть его стоимость в USD.
+        request=False — служебный вызов (сводка диалога): токены и стоимость учитываются,
+        но в число запросов пользователя и итога он не входит.
+        """
+        day = self._day(self._today_key())
+        user = day["users"].setdefault(str(user_id), _new_bucket())
+        total_cost = 0.0
+        for index, (model, usage) in enumerate(response_charges(meta)):
+            if not usage or not model:
+                continue
+            if model not in self.prices and model not in self._unpriced_warned:
+                self._unpriced_warned.add(model)
+                logger.warning(f"Нет цены для модели {model} (LLM_PRICES) — её стоимость считается нулевой")
+            cost = request_cost(self.prices, model, usage)
+            # запрос пользователя один, сколько бы моделей ни ответило
+            requests = 1 if index == 0 and request else 0
+            _add(day["total"], usage, cost, requests)
+            _add(day["models"].setdefault(model, _new_bucket()), usage, cost, 1)
+            _add(user, usage, cost, requests)
+            total_cost += cost
+        self._mark_dirty()
+        return total_cost
+
+    def today(self, state: Optional[dict] = None) -> dict:
+        """Итоги за сегодня — свои или из переданного состояния (например, суммы по воркерам)"""
+        state = self.state if state is None else state
+        return state.get("days", {}).get(self._today_key(), {"total": _new_bucket(), "models": {}, "users": {}})
+
+    def budget_pressure(self, user_id: Optional[str] = None) -> float:
+        """Доля израсходованного дневного бюджета (наибольшая из общего и пользовательского)"""
+        day = self.today()
+        pressure = 0.0
+        if self.daily_budget > 0:
+            pressure = day["total"]["cost_usd"] / self.daily_budget
+        if self.user_daily_budget > 0 and user_id is not None:
+            user = day["users"].get(str(user_id))
+            if user:
+                pressure = max(pressure, user["cost_usd"] / self.user_daily_budget)
+        return pressure
+
+    def should_economize(self, user_id: Optional[str] = None) -> bool:
+        return (self.daily_budget > 0 or self.user_daily_budget > 0) and self.budget_pressure(user_id) >= self.threshold
+
+    def _serialize(self) -> str:
+        self.state["updated_at"] = self._clock().isoformat()
+        return json.dumps(self.state, ensure_ascii=False)
+
+
+def top_by_cost(buckets: Dict[str, dict], limit: int = 3) -> Iterable[Tuple[str, dict]]:
+    return sorted(buckets.items(), key=lambda item: item[1]["cost_usd"], reverse=True)[:limit]
@@ -1,121 +1,204 @@
+import asyncio
 import json
 import logging
 import os
+import threading
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Iterator, List, Optional
 from .config import Config
+from .persistence import BackgroundWriter
+from .storage import create_storage
+from .tracing import tracer
+from .user_cache import UserLRUCache
 
 logger = logging.getLogger(__name__)
 
 class DataManager:
     """Менеджер для работы с данными пользователей и истории диалогов"""
     
-    def __init__(self):
-        """Инициализация менеджера данных"""
-        self.data_file = "data/conversations.json"
-        self.users_data: Dict[str, dict] = {}
+    def __init__(
+        self,
+        data_file: str = "data/conversations.json",
+        backend: Optional[str] = None,
+        writer: Optional[BackgroundWriter] = None,
+        lazy_load: bool = False,
+    ):
+        """Инициализация менеджера данных.
+        writer — фоновый поток записи; без него сохранение идёт синхронно в вызывающем потоке.
+        lazy_load — загружать историю в фоновом потоке; обращения к данным ждут окончания загрузки.
+        """
+        self.data_file = data_file
+        self.writer = writer
         self._ensure_data_directory()
-        self._load_data()
+        backend = backend or Config.DATA_STORAGE_BACKEND
+        # LRU активных пользователей имеет смысл только для SQLite: остальные бэкенды держат в памяти всё
+        self.user_cache: Optional[UserLRUCache] = None
+        if backend == "sqlite" and Config.USER_CACHE_MAX_USERS > 0:
+            self.user_cache = UserLRUCache(
+                max_users=Config.USER_CACHE_MAX_USERS,
+                max_bytes=Config.USER_CACHE_MAX_BYTES,
+            )
+        self._storage = create_storage(
+            backend,
+            self.data_file,
+            compact_every=Config.DATA_JOURNAL_COMPACT_EVERY,
+            writer=writer,
+            cache=self.user_cache,
+        )
+        self._loaded = threading.Event()
+        if lazy_load:
+            threading.Thread(target=self._background_load, name="data-load", daemon=True).start()
+        else:
+            self._load_data()
+            self._loaded.set()
         logger.info("DataManager инициализирован")
+
+    @property
+    def storage(self):
+        """Хранилище; при фоновой загрузке — после её окончания"""
+        self._loaded.wait()
+        return self._storage
+
+    def is_loaded(self) -> bool:
+        return self._loaded.is_set()
+
+    async def wait_loaded(self) -> None:
+        """Дождаться фоновой загрузки, не блокируя event loop"""
+        if not self._loaded.is_set():
+            await asyncio.to_thread(self._loaded.wait)
+
+    def _background_load(self) -> None:
+        try:
+            self._load_data()
+        finally:
+            self._loaded.set()
     
     def _ensure_data_directory(self) -> None:
         """Создание директории для данных если не существует"""
-        os.makedirs("data", exist_ok=True)
+        os.makedirs(os.path.dirname(self.data_file) or ".", exist_ok=True)
     
     def _load_data(self) -> None:
-        """Загрузка данных из JSON файла"""
+        """Загрузка данных: снимок + журнал или подключение к БД"""
         try:
-            if os.path.exists(self.data_file):
-                with open(self.data_file, 'r', encoding='utf-8') as file:
-                    self.users_data = json.load(file)
-                logger.info(f"Загружены данные для {len(self.users_data)} пользователей")
-            else:
-                self.users_data = {}
-                logger.info("Создан новый файл данных")
+            self._storage.load()
+            logger.info(f"Загружены данные для {self._storage.statistics()['total_users']} пользователей")
         except Exception as e:
             logger.error(f"Ошибка при загрузке данных: {e}")
-            self.users_data = {}
     
     def _save_data(self) -> None:
-        """Сохранение данных в JSON файл"""
+        """Полное сохранение данных (снимок)"""
         try:
-            with open(self.data_file, 'w', encoding='utf-8') as file:
-                json.dump(self.users_data, file, ensure_ascii=False, indent=2)
+            self.storage.save()
             logger.info("Данные сохранены")
         except Exception as e:
             logger.error(f"Ошибка при сохранении данных: {e}")
+
+    def _write_record(self, record: dict) -> None:
+        """Записать изменение в хранилище"""
+        try:
+            self.storage.write(record)
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении данных: {e}")
+
+    def flush(self) -> None:
+        """Дождаться записи на диск всех изменений, поставленных в фоновый поток"""
+        if self.writer is not None:
+            self.writer.flush()
+
+    def close(self) -> None:
+        """Финальная компактизация/закрытие хранилища при остановке бота"""
+        self.flush()
+        try:
+            self.storage.close()
+        except Exception as e:
+            logger.error(f"Ошибка при закрытии хранилища: {e}")
     
+    @tracer.traced("data.add_message")
     def add_message(self, user_id: str, username: str, role: str, content: str, metadata: Optional[dict] = None) -> None:
         """Добавление сообщения в историю пользователя
         metadata — произвольные дополнительные данные (модель, fallback, usage и т.д.)
         """
-        if user_id not in self.users_data:
-            self.users_data[user_id] = {
-                "user_id": user_id,
-                "username": username,
-                "created_at": datetime.now().isoformat(),
-                "sessions": []
-            }
+        tracer.set_attributes(role=role)
+        now_dt = datetime.now()
+        now = now_dt.isoformat()
+        # Новая сессия — если её нет или пользователь молчал дольше SESSION_IDLE_TIMEOUT
+        last = self.storage.last_session(user_id)
+        if last is not None and not self._session_expired(last[1], now_dt):
+            session_id = last[0]
+        else:
+            session_id = f"session_{now_dt.strftime('%Y%m%d_%H%M%S')}"
         
-        # Создаем новую сессию если её нет
-        if not self.users_data[user_id]["sessions"]:
-            session_id = f"session_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-            self.users_data[user_id]["sessions"].append({
-                "session_id": session_id,
-                "messages": [],
-                "created_at": datetime.now().isoformat()
-            })
-        
-        # Добавляем сообщение в текущую сессию
-        current_session = self.users_data[user_id]["sessions"][-1]
         message = {
             "role": role,
             "content": content,
-            "timestamp": datetime.now().isoformat()
+            "timestamp": now
         }
         if metadata:
             message["metadata"] = metadata
-        current_session["messages"].append(message)
-        
+        # user_created_at/session_created_at используются только при создании пользователя/сессии
+        self._write_record({
+            "op": "message",
+            "user_id": user_id,
+            "username": username,
+            "user_created_at": now,
+            "session_id": session_id,
+            "session_created_at": now,
+            "message": message,
+        })
         logger.info(f"Добавлено сообщение пользователю {user_id}")
-        self._save_data()
     
+    @staticmethod
+    def _session_expired(last_message_at: Optional[str], now: datetime) -> bool:
+        if Config.SESSION_IDLE_TIMEOUT <= 0 or not last_message_at:
+            return False
+        try:
+            idle = (now - datetime.fromisoformat(last_message_at)).total_seconds()
+        except ValueError:
+            return False
+        return idle > Config.SESSION_IDLE_TIMEOUT
+
+    def get_current_session(self, user_id: str) -> Optional[dict]:
+        """Пользователь только с текущей (последней) сессией — для построения контекста"""
+        return self.storage.get_current_session(user_id)
+
+    def get_session_summaries(self, user_id: str) -> List[dict]:
+        """Сессии пользователя без сообщений: число сообщений, токены, модели, время последнего сообщения"""
+        return self.storage.session_summaries(user_id)
+
     def get_user_history(self, user_id: str) -> Optional[dict]:
         """Получение истории пользователя"""
-        return self.users_data.get(user_id)
+        return self.storage.get_user(user_id)
     
     def clear_user_history(self, user_id: str) -> None:
         """Очистка истории пользователя"""
-        if user_id in self.users_data:
-            self.users_data[user_id]["sessions"] = []
+        if self.storage.last_session_id(user_id) is not None:
+            self._write_record({"op": "clear", "user_id": user_id})
             logger.info(f"История пользователя {user_id} очищена")
-            self._save_data()
+    
+    def iter_user_histories(self, user_ids: Optional[list] = None) -> Iterator[dict]:
+        """Поток историй пользователей (всех или указанных) — без сборки общего дампа в памяти.
+        Вызывается из потока экспорта: хранилище отдаёт копии / читает через своё соединение.
+        """
+        yield from self.storage.iter_users(user_ids)
     
     def export_all_history(self) -> str:
         """Экспорт всей истории в JSON строку"""
         try:
+            users = {user["user_id"]: user for user in self.storage.iter_users()}
             export_data = {
                 "exported_at": datetime.now().isoformat(),
-                "total_users": len(self.users_data),
-                "users": self.users_data
+                "total_users": len(users),
+                "users": users
             }
             return json.dumps(export_data, ensure_ascii=False, indent=2)
         except Exception as e:
             logger.error(f"Ошибка при экспорте данных: {e}")
             return "{}"
     
+    def get_cache_stats(self) -> Optional[dict]:
+        """Попадания/промахи LRU активных пользователей (None, если кэш не используется)"""
+        return self.user_cache.stats() if self.user_cache else None
+
     def get_statistics(self) -> dict:
-        """Получение статистики использования"""
-        total_messages = 0
-        total_sessions = 0
-        
-        for user_data in self.users_data.values():
-            for session in user_data.get("sessions", []):
-                total_sessions += 1
-                total_messages += len(session.get("messages", []))
-        
-        return {
-            "total_users": len(self.users_data),
-            "total_sessions": total_sessions,
-            "total_messages": total_messages
-        } 
\ No newline at end of file
+        """Получение статистики использования (счётчики ведутся инкрементально)"""
+        return self.storage.statistics()
@@ -0,0 +1,109 @@
+import gzip
+import json
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Iterable, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Лимит Telegram на документ от бота — 50 МБ; оставляем запас
+DEFAULT_MAX_PART_BYTES = 45 * 1024 * 1024
+
+
+def parse_export_args(text: str) -> dict:
+    """Разбор аргументов /export: from=YYYY-MM-DD to=YYYY-MM-DD users=ID,ID.
+    Дата в to включается целиком; с указанием времени (to=YYYY-MM-DDTHH:MM) граница исключается.
+    """
+    params = {"since": None, "until": None, "user_ids": None}
+    for token in text.split()[1:]:
+        key, _, value = token.partition("=")
+        if key == "from":
+            params["since"] = datetime.fromisoformat(value).isoformat()
+        elif key == "to":
+            until = datetime.fromisoformat(value)
+            # to=YYYY-MM-DD — включительно: граница — начало следующего дня
+            if len(value) == 10:
+                until += timedelta(days=1)
+            params["until"] = until.isoformat()
+        elif key == "users":
+            params["user_ids"] = [u.strip() for u in value.split(",") if u.strip()]
+        else:
+            raise ValueError(f"Неизвестный параметр экспорта: {token}")
+    return params
+
+
+def filter_user(user: dict, since: Optional[str] = None, until: Optional[str] = None) -> Optional[dict]:
+    """Оставить только сообщения в диапазоне [since, until) по ISO-меткам времени.
+    Если после фильтрации сообщений не осталось — вернуть None.
+    """
+    if not since and not until:
+        return user
+    sessions = []
+    for session in user.get("sessions", []):
+        messages = [
+            m for m in session.get("messages", [])
+            if (not since or m.get("timestamp", "") >= since) and (not until or m.get("timestamp", "") < until)
+        ]
+        if messages:
+            sessions.append({**session, "messages": messages})
+    if not sessions:
+        return None
+    return {**user, "sessions": sessions}
+
+
+def iter_export_users(
+    users: Iterable[dict], since: Optional[str] = None, until: Optional[str] = None
+) -> Iterator[dict]:
+    """Поток пользователей для экспорта с учётом фильтра по датам"""
+    for user in users:
+        filtered = filter_user(user, since, until)
+        if filtered is not None:
+            yield filtered
+
+
+def write_export_parts(
+    users: Iterable[dict],
+    out_dir: str,
+    *,
+    max_part_bytes: int = DEFAULT_MAX_PART_BYTES,
+    prefix: Optional[str] = None,
+) -> List[str]:
+    """Потоково записать пользователей в gzip-файлы JSONL (один пользователь — одна строка).
+    Когда сжатый файл превышает max_part_bytes, начинается следующая часть.
+    Первая строка каждой части — заголовок с датой выгрузки и номером части.
+    """
+    prefix = prefix or f"export_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    exported_at = datetime.now().isoformat()
+    paths: List[str] = []
+    raw = None
+    gz = None
+
+    def open_part() -> None:
+        nonlocal raw, gz
+        path = os.path.join(out_dir, f"{prefix}_part{len(paths) + 1}.jsonl.gz")
+        paths.append(path)
+        raw = open(path, "wb")
+        gz = gzip.GzipFile(fileobj=raw, mode="wb")
+        header = {"exported_at": exported_at, "part": len(paths)}
+        gz.write((json.dumps(header, ensure_ascii=False) + "\n").encode("utf-8"))
+
+    def close_part() -> None:
+        gz.close()
+        raw.close()
+
+    open_part()
+    users_in_part = 0
+    try:
+        for user in users:
+            line = (json.dumps(user, ensure_ascii=False) + "\n").encode("utf-8")
+            # raw.tell() — сжатые байты на диске; несжатая длина строки — оценка сверху для её вклада
+            if users_in_part and raw.tell() + len(line) > max_part_bytes:
+                close_part()
+                open_part()
+                users_in_part = 0
+            gz.write(line)
+            users_in_part += 1
+    finally:
+        close_part()
+    return paths
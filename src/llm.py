@@ -1,21 +1,100 @@
 import logging
 import asyncio
 import os
-from openai import OpenAI
-from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Optional
+from .cache import ResponseCache, make_cache_key
 from .config import Config
+from .context import message_tokens
+from .costs import cheapest_first, parse_prices
+from .router import ModelRouter
+from .tracing import tracer
 
 logger = logging.getLogger(__name__)
 
+# openai (вместе с httpx и pydantic) импортируется при первом обращении к LLM
+# или фоново после старта polling — это заметная часть времени запуска
+AsyncOpenAI = None
+
+
+def _async_openai_class():
+    global AsyncOpenAI
+    if AsyncOpenAI is None:
+        from openai import AsyncOpenAI as client_class
+        AsyncOpenAI = client_class
+    return AsyncOpenAI
+
+
+def preload_heavy_modules() -> None:
+    """Импортировать тяжёлые зависимости заранее (вызывается в отдельном потоке)"""
+    _async_openai_class()
+
+
+# Колбэк для потокового режима: получает очередной кусок текста ответа
+DeltaCallback = Callable[[str], Awaitable[None]]
+CONTINUE_PROMPT = "Продолжи предыдущий ответ кратко (1 абзац). Не повторяй уже сказанное."
+SUMMARY_PROMPT = (
+    "Сожми диалог пользователя с толкователем снов в краткую сводку (до 5 предложений): "
+    "какие сны рассказаны, ключевые образы и эмоции, какие выводы уже сделаны. Пиши по-русски, без вступлений."
+)
+
+
+def _add_usage(meta: dict, usage) -> None:
+    """Суммировать usage (основной ответ + догенерации) в meta["usage"]"""
+    total = meta.setdefault("usage", {})
+    for key in ("prompt_tokens", "completion_tokens", "total_tokens"):
+        value = getattr(usage, key, None)
+        if value is not None:
+            total[key] = int(total.get(key) or 0) + int(value)
+
+def _charge(meta: dict) -> dict:
+    """Оплаченный, но не отданный пользователю ответ: модель и расход токенов"""
+    return {"model": meta.get("model"), "usage": meta.get("usage")}
+
+
+def _cancelled_charge(model: str, prompt_tokens: int) -> dict:
+    """Запрос, отменённый hedging-ом на лету: провайдер уже принял промпт, точного usage нет —
+    учитываем оценку промпта (сгенерированная до отмены часть ответа не видна и не учитывается)
+    """
+    return {
+        "model": model,
+        "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": 0, "total_tokens": prompt_tokens},
+        "cancelled": True,
+    }
+
+
 class LLMClient:
     """Клиент для работы с LLM через OpenRouter"""
     
     def __init__(self):
         """Инициализация клиента LLM"""
-        self.client = OpenAI(
-            base_url=Config.LLM_BASE_URL,
-            api_key=Config.OPENROUTER_API_KEY
+        # HTTP-клиент создаётся при первом запросе (см. свойство client)
+        self.http_client = None
+        self._client = None
+        # Ограничение числа одновременных запросов к провайдеру
+        self._semaphore = asyncio.Semaphore(max(1, Config.LLM_MAX_CONCURRENCY))
+        # Последние задержки успешных ответов по моделям (для дедлайна hedging)
+        self._latencies: Dict[str, Deque[int]] = {}
+        # Здоровье моделей: circuit breaker и динамический порядок кандидатов
+        self.router = ModelRouter(
+            window=Config.LLM_ROUTER_WINDOW,
+            failure_threshold=Config.LLM_BREAKER_FAILURES,
+            error_rate_threshold=Config.LLM_BREAKER_ERROR_RATE,
+            min_samples=Config.LLM_ROUTER_MIN_SAMPLES,
+            cooldown_s=Config.LLM_BREAKER_COOLDOWN,
+            slow_p95_ms=Config.LLM_ROUTER_SLOW_P95_MS,
         )
+        # Цены моделей: при приближении к бюджету кандидаты перебираются от дешёвых к дорогим
+        self.prices = parse_prices(Config.LLM_PRICES)
+        # Кэш ответов для повторно присланных снов
+        self.cache: Optional[ResponseCache] = None
+        if Config.LLM_CACHE_ENABLED:
+            self.cache = ResponseCache(
+                max_entries=Config.LLM_CACHE_MAX_ENTRIES,
+                ttl_s=Config.LLM_CACHE_TTL,
+                path=Config.LLM_CACHE_PATH,
+            )
         logger.info(f"LLM клиент инициализирован с моделью {Config.LLM_PRIMARY_MODEL}")
         try:
             fallbacks_for_log = Config.get_fallback_models() if Config.LLM_FALLBACK_ENABLED else []
@@ -23,41 +102,61 @@ class LLMClient:
             fallbacks_for_log = []
         logger.info(f"LLM primary: {Config.LLM_PRIMARY_MODEL}; fallbacks: {fallbacks_for_log}")
     
-    @retry(
-        stop=stop_after_attempt(3),
-        wait=wait_exponential(multiplier=1, min=4, max=10),
-        retry=retry_if_exception_type((Exception,))
-    )
-    async def get_response(self, messages: list) -> str:
-        """Получение ответа от LLM с retry логикой"""
-        try:
-            logger.info(f"Отправка запроса к LLM, модель: {Config.LLM_PRIMARY_MODEL}")
-            
-            response = self.client.chat.completions.create(
-                model=Config.LLM_PRIMARY_MODEL,
-                messages=messages,
-                max_tokens=Config.LLM_MAX_TOKENS,
-                temperature=0.7
+    @property
+    def client(self):
+        """AsyncOpenAI поверх одного общего пула keep-alive соединений на весь процесс"""
+        if self._client is None:
+            import httpx
+            self.http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=Config.LLM_MAX_CONNECTIONS,
+                    max_keepalive_connections=Config.LLM_MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=Config.LLM_KEEPALIVE_EXPIRY,
+                ),
+                timeout=Config.LLM_TIMEOUT,
             )
-            
-            response_text = response.choices[0].message.content
-            logger.info(f"Получен ответ от LLM: {len(response_text)} символов")
-            
-            return response_text
-            
-        except Exception as e:
-            logger.error(f"Ошибка при обращении к LLM: {e}")
-            raise  # Пробрасываем исключение для retry
+            self._client = _async_openai_class()(
+                base_url=Config.LLM_BASE_URL,
+                api_key=Config.OPENROUTER_API_KEY,
+                http_client=self.http_client,
+            )
+        return self._client
+
+    async def _create_completion(self, model: str, messages: list, max_tokens: int, span_name: str = "llm.completion"):
+        """Неблокирующий вызов chat.completions с учётом лимита параллельности"""
+        with tracer.span(span_name, model=model, max_tokens=max_tokens) as span:
+            waited = time.perf_counter()
+            async with self._semaphore:
+                span.set_attribute("semaphore_wait_ms", int((time.perf_counter() - waited) * 1000))
+                response = await self.client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    max_tokens=max_tokens,
+                    temperature=0.7
+                )
+            if response.choices:
+                span.set_attribute("finish_reason", getattr(response.choices[0], "finish_reason", None))
+            usage = getattr(response, "usage", None)
+            if usage:
+                span.set_attribute("completion_tokens", getattr(usage, "completion_tokens", None))
+            return response
+
+    async def close(self) -> None:
+        """Закрыть пул HTTP-соединений и сохранить кэш ответов"""
+        if self.cache:
+            self.cache.save()
+        if self._client is not None:
+            await self._client.close()
 
     async def get_response_with_model(self, model: str, messages: list) -> tuple[str, dict]:
         """Отправить запрос в указанную модель; вернуть (text, meta)"""
         logger.info(f"Отправка запроса к LLM, модель: {model}")
-        response = self.client.chat.completions.create(
-            model=model,
-            messages=messages,
-            max_tokens=Config.LLM_MAX_TOKENS,
-            temperature=0.7
-        )
+        started = time.perf_counter()
+        try:
+            response = await self._create_completion(model, messages, Config.LLM_MAX_TOKENS)
+        except Exception:
+            self.router.record_failure(model)
+            raise
         response_text = response.choices[0].message.content
         finish_reason = getattr(response.choices[0], "finish_reason", None)
         usage = getattr(response, "usage", None)
@@ -81,18 +180,15 @@ class LLMClient:
             try:
                 augmented_messages = list(messages)
                 augmented_messages.append({"role": "assistant", "content": response_text})
-                augmented_messages.append({
-                    "role": "user",
-                    "content": "Продолжи предыдущий ответ кратко (1 абзац). Не повторяй уже сказанное."
-                })
+                augmented_messages.append({"role": "user", "content": CONTINUE_PROMPT})
                 for i in range(2):  # максимум 2 догенерации
-                    cont = self.client.chat.completions.create(
-                        model=model,
-                        messages=augmented_messages,
-                        max_tokens=max(200, int(0.3 * Config.LLM_MAX_TOKENS)),
-                        temperature=0.7
+                    cont = await self._create_completion(
+                        model, augmented_messages, max(200, int(0.3 * Config.LLM_MAX_TOKENS)), "llm.continuation"
                     )
                     cont_text = cont.choices[0].message.content
+                    # догенерация оплачивается так же, как основной ответ
+                    if getattr(cont, "usage", None):
+                        _add_usage(meta, cont.usage)
                     response_text += ("\n" + cont_text)
                     meta["continued"] = True
                     meta["continuations"] = meta.get("continuations", 0) + 1
@@ -102,8 +198,19 @@ class LLMClient:
                     augmented_messages.append({"role": "assistant", "content": cont_text})
             except Exception as _:
                 pass
+        meta["latency_ms"] = int((time.perf_counter() - started) * 1000)
+        self._latencies.setdefault(model, deque(maxlen=100)).append(meta["latency_ms"])
+        self.router.record_success(model, meta["latency_ms"], finish_reason)
         return response_text, meta
 
+    def _hedge_delay(self, model: str) -> float:
+        """Дедлайн до запуска следующей модели: квантиль недавних задержек модели, секунды"""
+        samples = sorted(self._latencies.get(model, ()))
+        if len(samples) < Config.LLM_HEDGE_MIN_SAMPLES:
+            return Config.LLM_HEDGE_DELAY_MS / 1000
+        idx = min(len(samples) - 1, int(Config.LLM_HEDGE_QUANTILE * len(samples)))
+        return samples[idx] / 1000
+
     def _looks_too_dry_or_off(self, text: str) -> bool:
         """Простая эвристика качества: слишком коротко, нет структуры, или повтор правил"""
         if not text or len(text.strip()) < 80:
@@ -119,34 +226,352 @@ class LLMClient:
         has_structure = ("ключевые символы" in lowered) or ("практический вывод" in lowered)
         return not has_structure
 
-    async def generate_with_fallback(self, messages: list) -> tuple[str, dict]:
+    def _cache_key(self, messages: list) -> Optional[str]:
+        """Ключ кэша: системный промпт + текущий запрос с текстом сна.
+        Запросы с историей диалога или сводкой не кэшируются: ответ опирается на реплики
+        конкретного пользователя и не должен достаться другому с тем же текстом сна
+        """
+        if not self.cache:
+            return None
+        if len(messages) > 2 or any(m.get("role") != "system" for m in messages[:-1]):
+            return None
+        return make_cache_key(Config.LLM_PRIMARY_MODEL, messages)
+
+    def _cache_get(self, key: Optional[str]) -> Optional[tuple[str, dict]]:
+        if not key:
+            return None
+        cached = self.cache.get(key)
+        if cached:
+            logger.info("Ответ LLM взят из кэша")
+            cached[1]["cached"] = True
+        return cached
+
+    def _cache_put(self, key: Optional[str], text: str, meta: dict) -> None:
+        # «сухие» ответы не кэшируем, чтобы при повторе был шанс получить нормальный
+        if key and not self._looks_too_dry_or_off(text):
+            # разовые сведения о конкретном вызове в кэш не переносим
+            self.cache.put(key, text, {k: v for k, v in meta.items() if k not in ("hedge", "ttft_ms", "discarded")})
+
+    async def _attempt(self, model: str, messages: list) -> tuple[str, dict]:
+        """Запрос к одному кандидату в отдельном спане (llm.primary / llm.fallback)"""
+        name = "llm.primary" if model == Config.LLM_PRIMARY_MODEL else "llm.fallback"
+        with tracer.span(name, model=model) as span:
+            text, meta = await self.get_response_with_model(model, messages)
+            span.set_attribute("continuations", meta.get("continuations", 0))
+            return text, meta
+
+    @tracer.traced("llm.generate")
+    async def generate_with_fallback(self, messages: list, economy: bool = False) -> tuple[str, dict]:
+        """Ответ из кэша, иначе primary → fallback (последовательно или с hedging); вернуть (text, meta).
+        economy — бюджет на исходе: сначала самые дешёвые модели и без hedging (он удваивает расход).
+        """
+        cache_key = self._cache_key(messages)
+        cached = self._cache_get(cache_key)
+        if cached:
+            tracer.set_attributes(cached=True)
+            return cached
+        if economy:
+            tracer.set_attributes(economy=True)
+        if Config.LLM_HEDGING and not economy:
+            text, meta = await self.generate_hedged(messages)
+        else:
+            text, meta = await self._generate_sequential(messages, economy)
+        # ответ дешёвой модели в режиме экономии не кэшируем: иначе он достанется и обычным запросам
+        if not economy:
+            self._cache_put(cache_key, text, meta)
+        return text, meta
+
+    async def _generate_sequential(self, messages: list, economy: bool = False) -> tuple[str, dict]:
         """Сначала primary, при ошибке/сухости — перебираем fallback-модели (если включены)"""
+        first_result: Optional[tuple[str, dict]] = None
+        for idx, model in enumerate(self._candidate_models(economy)):
+            try:
+                text, meta = await self._attempt(model, messages)
+            except Exception as e:
+                logger.error(f"{model} ошибка: {e}")
+                continue
+            self._mark_fallback(meta)
+            # проверку «сухости» проходит только первый ответ; ответ следующей модели принимаем как есть
+            if first_result is None and idx == 0 and self._looks_too_dry_or_off(text):
+                logger.warning(f"Ответ {model} выглядит сухим/без структуры — пробуем fallback(и)")
+                first_result = (text, meta)
+                continue
+            if first_result is not None:
+                # отброшенный «сухой» ответ тоже оплачен
+                meta["discarded"] = [_charge(first_result[1])]
+            return text, meta
+
+        if first_result and first_result[0]:
+            return first_result
+        raise RuntimeError("Не удалось получить ответ ни от primary, ни от fallback моделей")
+
+    async def summarize_dialogue(self, previous_summary: str, turns: list, economy: bool = False) -> tuple[str, dict]:
+        """Инкрементальная сводка: предыдущая сводка + новые реплики → (новая сводка, meta с model/usage).
+        economy — бюджет на исходе: сводку строит самая дешёвая модель.
+        """
+        dialogue = "\n".join(
+            f"{'Пользователь' if t['role'] == 'user' else 'Бот'}: {t['content']}" for t in turns
+        )
+        content = f"Текущая сводка:\n{previous_summary}\n\nНовые реплики:\n{dialogue}" if previous_summary else dialogue
+        messages = [
+            {"role": "system", "content": SUMMARY_PROMPT},
+            {"role": "user", "content": content},
+        ]
+        last_error: Optional[Exception] = None
+        for model in self._candidate_models(economy):
+            started = time.perf_counter()
+            try:
+                response = await self._create_completion(
+                    model, messages, Config.CONTEXT_SUMMARY_MAX_TOKENS, "llm.summary"
+                )
+            except Exception as e:
+                logger.warning(f"Сводка диалога: {model} ошибка: {e}")
+                # исход вызова учитывает и роутер: он мог выдать этому запросу пробную попытку half-open
+                self.router.record_failure(model)
+                last_error = e
+                continue
+            self.router.record_success(
+                model, int((time.perf_counter() - started) * 1000), getattr(response.choices[0], "finish_reason", None)
+            )
+            meta = {"model": model}
+            if getattr(response, "usage", None):
+                _add_usage(meta, response.usage)
+            return response.choices[0].message.content or "", meta
+        raise RuntimeError(f"Не удалось построить сводку диалога: {last_error}")
+
+    async def generate_hedged(self, messages: list) -> tuple[str, dict]:
+        """Hedging: если модель не ответила к дедлайну, параллельно запускаем следующую.
+        Берём первый ответ, прошедший проверку на «сухость», остальные запросы отменяем.
+        """
+        models = self._candidate_models()
+        running: Dict[asyncio.Task, int] = {}
+        next_idx = 0
+        dry_result: Optional[tuple[str, dict]] = None
+        wasted_tokens = 0
+        dry_metas: list = []
+
+        def launch() -> None:
+            nonlocal next_idx
+            model = models[next_idx]
+            task = asyncio.create_task(self._attempt(model, messages))
+            running[task] = next_idx
+            next_idx += 1
+
+        launch()
         try:
-            primary_text, primary_meta = await self.get_response_with_model(Config.LLM_PRIMARY_MODEL, messages)
-            if not self._looks_too_dry_or_off(primary_text):
-                return primary_text, primary_meta
-            logger.warning("Ответ primary выглядит сухим/без структуры — пробуем fallback(и)")
-        except Exception as primary_error:
-            logger.error(f"Primary ошибка: {primary_error}")
-
-        fallbacks = []
+            while running:
+                timeout = None
+                if next_idx < len(models):
+                    timeout = self._hedge_delay(models[next_idx - 1])
+                done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    logger.warning(f"Hedging: {models[next_idx - 1]} не ответила за {timeout:.2f} с, запускаем {models[next_idx]}")
+                    launch()
+                    continue
+                for task in done:
+                    idx = running.pop(task)
+                    try:
+                        text, meta = task.result()
+                    except Exception as e:
+                        logger.error(f"Hedging: {models[idx]} ошибка: {e}")
+                        continue
+                    self._mark_fallback(meta)
+                    if not self._looks_too_dry_or_off(text):
+                        # ещё идущие запросы отменяем, но промпт по ним уже оплачен
+                        prompt_tokens = sum(message_tokens(m) for m in messages)
+                        cancelled = [_cancelled_charge(models[i], prompt_tokens) for i in running.values()]
+                        meta["hedge"] = {
+                            "launched": next_idx,
+                            "winner_index": idx,
+                            "cancelled": len(cancelled),
+                            "wasted_tokens": wasted_tokens + prompt_tokens * len(cancelled),
+                        }
+                        discarded = [_charge(m) for m in dry_metas] + cancelled
+                        if discarded:
+                            meta["discarded"] = discarded
+                        return text, meta
+                    logger.warning(f"Hedging: ответ {models[idx]} выглядит сухим/без структуры")
+                    wasted_tokens += int((meta.get("usage") or {}).get("total_tokens") or 0)
+                    dry_metas.append(meta)
+                    if dry_result is None:
+                        dry_result = (text, meta)
+                # все запущенные завершились неудачно — сразу пробуем следующую модель
+                if not running and next_idx < len(models):
+                    launch()
+        finally:
+            for task in running:
+                task.cancel()
+
+        if dry_result:
+            text, meta = dry_result
+            others = [_charge(m) for m in dry_metas if m is not meta]
+            if others:
+                meta["discarded"] = others
+            meta["hedge"] = {
+                "launched": next_idx,
+                "winner_index": models.index(meta["model"]),
+                "cancelled": 0,
+                "wasted_tokens": wasted_tokens - int((meta.get("usage") or {}).get("total_tokens") or 0),
+            }
+            return text, meta
+        raise RuntimeError("Не удалось получить ответ ни от primary, ни от fallback моделей")
+
+    def _candidate_models(self, economy: bool = False) -> list[str]:
+        """Primary + fallback-модели; при включённом роутере — в порядке их здоровья.
+        economy — сначала дешёвые модели (по таблице цен), роутер по-прежнему убирает больные в конец.
+        """
+        models = [Config.LLM_PRIMARY_MODEL] + [m for m in self._fallback_models() if m != Config.LLM_PRIMARY_MODEL]
+        if economy:
+            models = cheapest_first(models, self.prices)
+        if Config.LLM_ROUTER_ENABLED:
+            return self.router.order(models)
+        return models
+
+    def _mark_fallback(self, meta: dict) -> None:
+        """Отметить в meta, что ответ дала не primary-модель"""
+        fallbacks = self._fallback_models()
+        if meta["model"] != Config.LLM_PRIMARY_MODEL and meta["model"] in fallbacks:
+            meta["fallback"] = True
+            meta["fallback_index"] = fallbacks.index(meta["model"])
+
+    def _fallback_models(self) -> list[str]:
+        """Список fallback-моделей, если fallback включён"""
         try:
-            fallbacks = Config.get_fallback_models() if Config.LLM_FALLBACK_ENABLED else []
+            return Config.get_fallback_models() if Config.LLM_FALLBACK_ENABLED else []
         except Exception:
-            fallbacks = []
+            return []
+
+    async def _stream_completion(
+        self,
+        model: str,
+        messages: list,
+        max_tokens: int,
+        on_delta: DeltaCallback,
+        meta: dict,
+        started: float,
+        span_name: str = "llm.stream",
+    ) -> tuple[str, Optional[str]]:
+        """Один потоковый вызов: куски текста уходят в on_delta; вернуть (text, finish_reason)"""
+        with tracer.span(span_name, model=model, max_tokens=max_tokens) as span:
+            text, finish_reason = await self._stream_completion_once(
+                model, messages, max_tokens, on_delta, meta, started
+            )
+            span.set_attribute("finish_reason", finish_reason)
+            span.set_attribute("ttft_ms", meta.get("ttft_ms"))
+            return text, finish_reason
+
+    async def _stream_completion_once(
+        self, model: str, messages: list, max_tokens: int, on_delta: DeltaCallback, meta: dict, started: float
+    ) -> tuple[str, Optional[str]]:
+        parts: list[str] = []
+        finish_reason = None
+        async with self._semaphore:
+            stream = await self.client.chat.completions.create(
+                model=model,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=0.7,
+                stream=True,
+                stream_options={"include_usage": True},
+            )
+            async for chunk in stream:
+                usage = getattr(chunk, "usage", None)
+                if usage:
+                    _add_usage(meta, usage)
+                if not chunk.choices:
+                    continue
+                choice = chunk.choices[0]
+                delta = getattr(choice.delta, "content", None)
+                if delta:
+                    if "ttft_ms" not in meta:
+                        meta["ttft_ms"] = int((time.perf_counter() - started) * 1000)
+                    parts.append(delta)
+                    await on_delta(delta)
+                if choice.finish_reason:
+                    finish_reason = choice.finish_reason
+        return "".join(parts), finish_reason
+
+    async def stream_with_model(self, model: str, messages: list, on_delta: DeltaCallback) -> tuple[str, dict]:
+        """Потоковый ответ указанной модели (с автопродолжением); вернуть (text, meta)"""
+        logger.info(f"Потоковый запрос к LLM, модель: {model}")
+        started = time.perf_counter()
+        meta = {
+            "model": model,
+            "fallback": False,
+            "finish_reason": None,
+            "continued": False,
+            "continuations": 0,
+            "streamed": True,
+        }
+        response_text, finish_reason = await self._stream_completion(
+            model, messages, Config.LLM_MAX_TOKENS, on_delta, meta, started
+        )
+        meta["finish_reason"] = finish_reason
+        if finish_reason == "length":
+            try:
+                augmented_messages = list(messages)
+                augmented_messages.append({"role": "assistant", "content": response_text})
+                augmented_messages.append({"role": "user", "content": CONTINUE_PROMPT})
+                for _ in range(2):  # максимум 2 догенерации, как и в обычном режиме
+                    await on_delta("\n")
+                    cont_text, fr = await self._stream_completion(
+                        model,
+                        augmented_messages,
+                        max(200, int(0.3 * Config.LLM_MAX_TOKENS)),
+                        on_delta,
+                        meta,
+                        started,
+                        "llm.continuation",
+                    )
+                    response_text += "\n" + cont_text
+                    meta["continued"] = True
+                    meta["continuations"] += 1
+                    if fr != "length":
+                        break
+                    augmented_messages.append({"role": "assistant", "content": cont_text})
+            except Exception as e:
+                logger.warning(f"Ошибка потоковой догенерации ({model}): {e}")
+        logger.info(f"Потоковый ответ от LLM: {len(response_text)} символов, TTFT {meta.get('ttft_ms')} мс")
+        return response_text, meta
+
+    @tracer.traced("llm.generate")
+    async def generate_streaming(
+        self, messages: list, on_delta: DeltaCallback, economy: bool = False
+    ) -> tuple[str, dict]:
+        """Потоковый режим: primary, затем fallback-модели — пока пользователю ещё ничего не показано.
+        Проверку «сухости» здесь не делаем: текст уже отображается по мере генерации.
+        """
+        cache_key = self._cache_key(messages)
+        cached = self._cache_get(cache_key)
+        if cached:
+            tracer.set_attributes(cached=True)
+            await on_delta(cached[0])
+            return cached
+        emitted = False
 
-        for idx, fb_model in enumerate(fallbacks):
+        async def tracking_delta(delta: str) -> None:
+            nonlocal emitted
+            emitted = True
+            await on_delta(delta)
+
+        for model in self._candidate_models(economy):
+            started = time.perf_counter()
             try:
-                fb_text, fb_meta = await self.get_response_with_model(fb_model, messages)
-                fb_meta["fallback"] = True
-                fb_meta["fallback_index"] = idx
-                return fb_text, fb_meta
-            except Exception as fb_error:
-                logger.error(f"Fallback[{idx}] {fb_model} ошибка: {fb_error}")
-
-        if 'primary_text' in locals() and primary_text:
-            return primary_text, primary_meta
-        raise RuntimeError("Не удалось получить ответ ни от primary, ни от fallback моделей")
+                with tracer.span("llm.primary" if model == Config.LLM_PRIMARY_MODEL else "llm.fallback", model=model):
+                    text, meta = await self.stream_with_model(model, messages, tracking_delta)
+            except Exception as e:
+                self.router.record_failure(model)
+                # после начала вывода переключать модель уже нельзя
+                if emitted:
+                    raise
+                logger.error(f"Ошибка потокового запроса к {model}: {e}")
+                continue
+            self.router.record_success(model, int((time.perf_counter() - started) * 1000), meta["finish_reason"])
+            self._mark_fallback(meta)
+            if not economy:
+                self._cache_put(cache_key, text, meta)
+            return text, meta
+        raise RuntimeError("Не удалось получить потоковый ответ ни от primary, ни от fallback моделей")
     
     def create_system_prompt(self) -> str:
         """Создание системного промпта для бота"""
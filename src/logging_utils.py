@@ -1,17 +1,164 @@
+import glob
+import gzip
 import json
 import logging
 import os
-from datetime import datetime
-from typing import Any, Dict, Optional
+import queue
+import shutil
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+_STOP = object()
+
+
+class JSONLWriter:
+    """Фоновая запись строк JSONL: очередь + поток-писатель.
+    Строки копятся в пакет и сбрасываются на диск, когда набралось batch_size строк
+    или прошло flush_interval секунд. Файл ротируется по размеру (max_bytes) и/или
+    по времени (rotate_interval); старые части сжимаются в .gz, хранится backup_count частей.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        *,
+        batch_size: int = 100,
+        flush_interval: float = 1.0,
+        max_bytes: int = 50 * 1024 * 1024,
+        rotate_interval: float = 0.0,
+        backup_count: int = 5,
+        compress: bool = True,
+        max_queue: int = 10000,
+    ) -> None:
+        # абсолютный путь: поток-писатель открывает файл позже и не должен зависеть от смены cwd
+        self.path = os.path.abspath(path)
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.rotate_interval = rotate_interval
+        self.backup_count = backup_count
+        self.compress = compress
+        self.dropped = 0
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize=max_queue)
+        self._file = None
+        self._opened_at = 0.0
+        self._thread = threading.Thread(
+            target=self._run, name=f"jsonl-writer:{os.path.basename(path)}", daemon=True
+        )
+        self._thread.start()
+
+    def write(self, line: str) -> None:
+        """Поставить строку в очередь (не блокирует; при переполнении строка теряется)"""
+        try:
+            self._queue.put_nowait(line)
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self, timeout: Optional[float] = 5.0) -> bool:
+        """Дождаться записи на диск (с fsync) всего, что уже поставлено в очередь"""
+        if not self._thread.is_alive():
+            return False
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self, timeout: Optional[float] = 5.0) -> None:
+        """Записать остаток очереди и остановить поток-писатель"""
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join(timeout)
+
+    def _run(self) -> None:
+        batch: List[str] = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                item = None
+            if isinstance(item, str):
+                batch.append(item)
+                if len(batch) < self.batch_size and time.monotonic() < deadline:
+                    continue
+            self._write_batch(batch)
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            if isinstance(item, threading.Event):
+                self._fsync()
+                item.set()
+            elif item is _STOP:
+                if self._file is not None:
+                    self._fsync()
+                    self._file.close()
+                    self._file = None
+                return
+
+    def _write_batch(self, batch: List[str]) -> None:
+        if not batch:
+            return
+        try:
+            if self._file is None:
+                self._open()
+            elif self._should_rotate():
+                self._rotate()
+            self._file.write("".join(line + "\n" for line in batch))
+            self._file.flush()
+        except Exception as e:
+            logging.getLogger(__name__).warning(f"Не удалось записать {len(batch)} строк в {self.path}: {e}")
+
+    def _fsync(self) -> None:
+        """Явный flush()/close() гарантирует, что данные дошли до диска"""
+        if self._file is not None:
+            try:
+                os.fsync(self._file.fileno())
+            except OSError as e:
+                logging.getLogger(__name__).warning(f"fsync {self.path} не удался: {e}")
+
+    def _open(self) -> None:
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._opened_at = time.time()
+
+    def _should_rotate(self) -> bool:
+        if self.max_bytes > 0 and self._file.tell() >= self.max_bytes:
+            return True
+        return self.rotate_interval > 0 and time.time() - self._opened_at >= self.rotate_interval
+
+    def _rotated_name(self) -> str:
+        """Имя части с микросекундами (несколько ротаций в одну секунду не затирают друг друга);
+        фиксированная ширина метки сохраняет хронологический порядок при сортировке имён
+        """
+        stamp = datetime.now()
+        while True:
+            rotated = f"{self.path}.{stamp.strftime('%Y%m%d-%H%M%S-%f')}"
+            if not os.path.exists(rotated) and not os.path.exists(rotated + ".gz"):
+                return rotated
+            stamp += timedelta(microseconds=1)
+
+    def _rotate(self) -> None:
+        self._file.close()
+        self._file = None
+        rotated = self._rotated_name()
+        os.replace(self.path, rotated)
+        if self.compress:
+            with open(rotated, "rb") as src, gzip.open(rotated + ".gz", "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(rotated)
+        # хранить только backup_count последних частей
+        backups = sorted(glob.glob(f"{glob.escape(self.path)}.*"))
+        for old in backups[: max(0, len(backups) - self.backup_count)]:
+            os.remove(old)
+        self._open()
 
 
 class JSONEventLogger:
-    """Простой JSONL-логгер событий в файл data/events.jsonl"""
+    """JSONL-логгер событий в файл data/events.jsonl; запись идёт в фоновом потоке пакетами"""
 
-    def __init__(self, path: str = "data/events.jsonl") -> None:
+    def __init__(self, path: str = "data/events.jsonl", **writer_options: Any) -> None:
         self.path = path
-        os.makedirs(os.path.dirname(self.path), exist_ok=True)
-        self._logger = logging.getLogger(__name__)
+        self.writer = JSONLWriter(path, **writer_options)
 
     def log_event(self, event: str, payload: Optional[Dict[str, Any]] = None) -> None:
         record = {
@@ -19,11 +166,13 @@ class JSONEventLogger:
             "event": event,
             "payload": payload or {},
         }
-        try:
-            with open(self.path, "a", encoding="utf-8") as f:
-                f.write(json.dumps(record, ensure_ascii=False) + "\n")
-        except Exception as e:
-            self._logger.warning(f"Не удалось записать событие в {self.path}: {e}")
+        self.writer.write(json.dumps(record, ensure_ascii=False))
+
+    def flush(self) -> None:
+        self.writer.flush()
+
+    def close(self) -> None:
+        self.writer.close()
 
 
 class JSONLogFormatter(logging.Formatter):
@@ -41,16 +190,35 @@ class JSONLogFormatter(logging.Formatter):
         return json.dumps(payload, ensure_ascii=False)
 
 
-def setup_structured_file_logging(path: str = "data/app.jsonl", level: int = logging.INFO) -> None:
-    """Добавить file handler с JSONL форматом, не меняя консольный вывод"""
-    os.makedirs(os.path.dirname(path), exist_ok=True)
-    handler = logging.FileHandler(path, encoding="utf-8")
-    handler.setLevel(level)
-    handler.setFormatter(JSONLogFormatter())
+class JSONLWriterHandler(logging.Handler):
+    """logging-handler, который отдаёт отформатированные записи в JSONLWriter"""
+
+    def __init__(self, writer: JSONLWriter) -> None:
+        super().__init__()
+        self.writer = writer
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            self.writer.write(self.format(record))
+        except Exception:
+            self.handleError(record)
+
+    def flush(self) -> None:
+        self.writer.flush()
+
+    def close(self) -> None:
+        self.writer.close()
+        super().close()
+
+
+def setup_structured_file_logging(path: str = "data/app.jsonl", level: int = logging.INFO, **writer_options: Any) -> None:
+    """Добавить фоновый handler с JSONL форматом, не меняя консольный вывод"""
     root = logging.getLogger()
     # предотвращаем дублирование при повторном вызове
     for h in root.handlers:
-        if isinstance(h, logging.FileHandler) and getattr(h, 'baseFilename', '') == os.path.abspath(path):
+        if isinstance(h, JSONLWriterHandler) and os.path.abspath(h.writer.path) == os.path.abspath(path):
             return
+    handler = JSONLWriterHandler(JSONLWriter(path, **writer_options))
+    handler.setLevel(level)
+    handler.setFormatter(JSONLogFormatter())
     root.addHandler(handler)
-
@@ -1,19 +1,141 @@
+import bisect
 import json
 import os
 import logging
 from datetime import datetime
-from typing import Dict, Optional
+from typing import Dict, List, Optional
+
+from .persistence import BackgroundWriter, PeriodicFlusher
 
 logger = logging.getLogger(__name__)
 
+# Границы бакетов гистограммы задержек, мс (последний бакет — всё, что больше)
+LATENCY_BUCKETS_MS = [50, 100, 250, 500, 1000, 2000, 3000, 5000, 8000, 13000, 20000, 30000, 60000]
+
+
+def new_histogram() -> Dict[str, object]:
+    return {"buckets": [0] * (len(LATENCY_BUCKETS_MS) + 1), "count": 0, "sum": 0, "max": 0}
+
+
+def observe(histogram: Dict[str, object], value_ms: int) -> None:
+    """Учесть значение в гистограмме с фиксированными бакетами"""
+    histogram["buckets"][bisect.bisect_left(LATENCY_BUCKETS_MS, value_ms)] += 1
+    histogram["count"] += 1
+    histogram["sum"] += int(value_ms)
+    # максимум нужен для хвоста за последней границей бакетов
+    histogram["max"] = max(int(histogram.get("max") or 0), int(value_ms))
+
+
+def histogram_percentile(histogram: Dict[str, object], q: float) -> Optional[int]:
+    """Оценка квантиля по гистограмме: верхняя граница бакета, где накопленная доля достигает q"""
+    count = histogram.get("count", 0)
+    if not count:
+        return None
+    threshold = q * count
+    cumulative = 0
+    buckets: List[int] = histogram["buckets"]
+    for idx, bucket_count in enumerate(buckets):
+        cumulative += bucket_count
+        if cumulative >= threshold:
+            if idx < len(LATENCY_BUCKETS_MS):
+                return LATENCY_BUCKETS_MS[idx]
+            break
+    # у последнего бакета верхней границы нет — отдаём наблюдённый максимум
+    # (в файлах метрик старого формата его нет — тогда последнюю известную границу)
+    return max(LATENCY_BUCKETS_MS[-1], int(histogram.get("max") or 0))
+
+
+def percentiles_from(metrics: Dict[str, object], model: Optional[str] = None) -> Dict[str, Optional[int]]:
+    """p50/p95/p99 времени ответа по словарю метрик, мс (общие или по модели)"""
+    if model:
+        histogram = metrics["llm"].get("latency", {}).get(model)
+    else:
+        histogram = metrics["timings"].get("histogram")
+    histogram = histogram or new_histogram()
+    return {f"p{int(q * 100)}": histogram_percentile(histogram, q) for q in (0.5, 0.95, 0.99)}
+
+
+# Снимки состояния процесса, которые нельзя складывать: берутся у самого нагруженного воркера
+_SNAPSHOT_KEYS = {"router"}
+
+
+def _merge_value(total, value, key: str):
+    if isinstance(value, bool) or value is None:
+        return total if total is not None else value
+    if isinstance(value, (int, float)):
+        if total is None:
+            return value
+        return max(total, value) if "max" in key else total + value
+    if isinstance(value, list):
+        if isinstance(total, list) and len(total) == len(value):
+            return [_merge_value(a, b, key) for a, b in zip(total, value)]
+        return total if total is not None else list(value)
+    if isinstance(value, dict):
+        merged = dict(total) if isinstance(total, dict) else {}
+        for k, v in value.items():
+            merged[k] = _merge_value(merged.get(k), v, k)
+        return merged
+    # строки (created_at/updated_at) — ISO-метки: берём более позднюю
+    if key == "created_at":
+        return min(total, value) if total else value
+    return max(total, value) if total else value
 
-class MetricsManager:
-    """Простая метрика в JSON-файле без внешних зависимостей"""
 
-    def __init__(self, path: str = "data/metrics.json") -> None:
+def merge_metrics(parts: List[Dict[str, object]]) -> Dict[str, object]:
+    """Сложить метрики нескольких воркеров: счётчики и бакеты гистограмм суммируются,
+    максимумы берутся по максимуму, состояние роутера — у воркера с наибольшим числом запросов.
+    """
+    parts = [p for p in parts if p]
+    if not parts:
+        return {}
+    busiest = max(parts, key=lambda p: p.get("totals", {}).get("requests", 0))
+    merged: Dict[str, object] = {}
+    for part in parts:
+        for key, value in part.items():
+            if key == "llm":
+                value = {k: v for k, v in value.items() if k not in _SNAPSHOT_KEYS}
+            merged[key] = _merge_value(merged.get(key), value, key)
+    for key in _SNAPSHOT_KEYS:
+        if key in busiest.get("llm", {}):
+            merged["llm"][key] = busiest["llm"][key]
+    return merged
+
+
+def read_metrics_file(path: str) -> Dict[str, object]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+class MetricsManager(PeriodicFlusher):
+    """Метрики в памяти с периодическим сбросом в JSON-файл без внешних зависимостей.
+    Запись не происходит на каждый запрос: файл обновляется раз в flush_interval секунд
+    (при наличии изменений) и при остановке бота. С writer сама запись идёт в фоновом потоке.
+    """
+
+    flush_key_prefix = "metrics"
+
+    def __init__(
+        self,
+        path: str = "data/metrics.json",
+        flush_interval: float = 10.0,
+        writer: Optional[BackgroundWriter] = None,
+    ) -> None:
         self.path = path
+        self.flush_interval = flush_interval
+        self.writer = writer
+        self._init_flusher()
         os.makedirs(os.path.dirname(self.path), exist_ok=True)
-        self.metrics: Dict[str, object] = self._load()
+        # файл читается при первом обращении к метрикам, а не при создании бота
+        self._metrics: Optional[Dict[str, object]] = None
+
+    @property
+    def metrics(self) -> Dict[str, object]:
+        if self._metrics is None:
+            self._metrics = self._load()
+        return self._metrics
 
     def _load(self) -> Dict[str, object]:
         if os.path.exists(self.path):
@@ -40,17 +162,15 @@ class MetricsManager:
             "timings": {
                 "response_ms_sum": 0,
                 "response_ms_count": 0,
+                "ttft_ms_sum": 0,
+                "ttft_ms_count": 0,
             },
             "updated_at": None,
         }
 
-    def _save(self) -> None:
-        try:
-            self.metrics["updated_at"] = datetime.now().isoformat()
-            with open(self.path, "w", encoding="utf-8") as f:
-                json.dump(self.metrics, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            logger.warning(f"Не удалось сохранить {self.path}: {e}")
+    def _serialize(self) -> str:
+        self.metrics["updated_at"] = datetime.now().isoformat()
+        return json.dumps(self.metrics, ensure_ascii=False, indent=2)
 
     def record_request(
         self,
@@ -60,6 +180,13 @@ class MetricsManager:
         success: bool,
         response_time_ms: Optional[int] = None,
         primary_attempt: bool = True,
+        ttft_ms: Optional[int] = None,
+        router: Optional[Dict[str, dict]] = None,
+        cache: Optional[Dict[str, int]] = None,
+        queue: Optional[Dict[str, int]] = None,
+        user_cache: Optional[Dict[str, int]] = None,
+        usage: Optional[Dict[str, Optional[int]]] = None,
+        continuations: int = 0,
     ) -> None:
         # totals
         self.metrics["totals"]["requests"] += 1
@@ -82,10 +209,62 @@ class MetricsManager:
             per_model = self.metrics["llm"].setdefault("per_model", {})
             per_model[model] = int(per_model.get(model, 0)) + 1
 
-        # timings
+        # timings: сумма/счётчик для среднего + гистограммы для p50/p95/p99 (общая и по моделям)
         if response_time_ms is not None:
-            self.metrics["timings"]["response_ms_sum"] += int(response_time_ms)
-            self.metrics["timings"]["response_ms_count"] += 1
+            timings = self.metrics["timings"]
+            timings["response_ms_sum"] += int(response_time_ms)
+            timings["response_ms_count"] += 1
+            observe(timings.setdefault("histogram", new_histogram()), response_time_ms)
+            if model:
+                per_model_latency = self.metrics["llm"].setdefault("latency", {})
+                observe(per_model_latency.setdefault(model, new_histogram()), response_time_ms)
+        # время до первого токена (только потоковый режим)
+        if ttft_ms is not None:
+            timings = self.metrics["timings"]
+            timings["ttft_ms_sum"] = int(timings.get("ttft_ms_sum", 0)) + int(ttft_ms)
+            timings["ttft_ms_count"] = int(timings.get("ttft_ms_count", 0)) + 1
+
+        # токены из meta["usage"] — всего и по моделям
+        if usage:
+            tokens = self.metrics.setdefault("tokens", {"prompt": 0, "completion": 0, "total": 0, "per_model": {}})
+            model_tokens = tokens["per_model"].setdefault(model or "unknown", {"prompt": 0, "completion": 0, "total": 0})
+            for key in ("prompt", "completion", "total"):
+                value = int(usage.get(f"{key}_tokens") or 0)
+                tokens[key] += value
+                model_tokens[key] += value
+        # догенерации при finish_reason == "length"
+        if continuations:
+            llm = self.metrics["llm"]
+            llm["continued_requests"] = int(llm.get("continued_requests", 0)) + 1
+            llm["continuations"] = int(llm.get("continuations", 0)) + int(continuations)
+
+        # состояние роутера моделей (error rate, p50/p95, circuit breaker)
+        if router is not None:
+            self.metrics["llm"]["router"] = router
+        # счётчики кэша ответов (hits/misses/evictions/size)
+        if cache is not None:
+            self.metrics["llm"]["cache"] = cache
+        # очередь запросов: глубина, ожидание, отказы
+        if queue is not None:
+            self.metrics["queue"] = queue
+        # LRU активных пользователей поверх хранилища
+        if user_cache is not None:
+            self.metrics["user_cache"] = user_cache
+
+        self._mark_dirty()
+
+    def latency_percentiles(self, model: Optional[str] = None) -> Dict[str, Optional[int]]:
+        """p50/p95/p99 времени ответа, мс (общие или по модели)"""
+        return percentiles_from(self.metrics, model)
 
-        self._save()
+    def record_hedge(self, *, launched: int, cancelled: int, wasted_tokens: int) -> None:
+        """Учёт hedging: сколько моделей запущено параллельно и сколько токенов ушло впустую"""
+        hedging = self.metrics["llm"].setdefault(
+            "hedging", {"requests": 0, "extra_launches": 0, "cancelled": 0, "wasted_tokens": 0}
+        )
+        hedging["requests"] += 1
+        hedging["extra_launches"] += max(0, launched - 1)
+        hedging["cancelled"] += cancelled
+        hedging["wasted_tokens"] += wasted_tokens
+        self._mark_dirty()
 
@@ -0,0 +1,47 @@
+"""
+Разовая миграция истории из data/conversations.json (+ журнал) в SQLite.
+
+Запуск: python -m src.migrate [--source data/conversations.json] [--target data/conversations.db]
+"""
+
+import argparse
+import logging
+import os
+import sys
+
+from .storage import JournalStorage, SQLiteStorage
+
+logger = logging.getLogger(__name__)
+
+
+def migrate_json_to_sqlite(source: str, target: str) -> int:
+    """Перенести снимок и журнал в SQLite; вернуть число перенесённых сообщений"""
+    if os.path.exists(target):
+        raise ValueError(f"Файл {target} уже существует — миграция выполняется один раз")
+    json_storage = JournalStorage(source)
+    json_storage.load()
+    sqlite_storage = SQLiteStorage(target)
+    sqlite_storage.load()
+    try:
+        imported = sqlite_storage.import_users(json_storage.users_data)
+    finally:
+        sqlite_storage.close()
+    logger.info(f"Перенесено сообщений: {imported}, пользователей: {len(json_storage.users_data)}")
+    return imported
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Миграция истории диалогов из JSON в SQLite")
+    parser.add_argument("--source", default="data/conversations.json")
+    parser.add_argument("--target", default="data/conversations.db")
+    args = parser.parse_args()
+    try:
+        migrate_json_to_sqlite(args.source, args.target)
+    except ValueError as e:
+        logging.error(f"Ошибка миграции: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
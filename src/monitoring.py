@@ -0,0 +1,191 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Callable, Dict, List, Optional
+
+from aiohttp import web
+
+from .metrics import LATENCY_BUCKETS_MS
+
+logger = logging.getLogger(__name__)
+
+GaugeCollector = Callable[[], Dict[str, float]]
+
+
+class EventLoopLagMonitor:
+    """Замер задержки event loop: насколько позже запланированного просыпается sleep"""
+
+    def __init__(self, interval: float = 0.5) -> None:
+        self.interval = interval
+        self.last_lag_s = 0.0
+        self.max_lag_s = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.last_lag_s = max(0.0, time.perf_counter() - started - self.interval)
+            self.max_lag_s = max(self.max_lag_s, self.last_lag_s)
+
+
+def process_rss_bytes() -> int:
+    """Текущий RSS процесса (Linux: /proc; иначе — пиковый RSS из resource)"""
+    try:
+        with open("/proc/self/status", "r", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    except Exception:
+        return 0
+
+
+def storage_sizes(data_dir: str = "data") -> Dict[str, int]:
+    """Размеры файлов в каталоге данных, байты"""
+    sizes: Dict[str, int] = {}
+    try:
+        for entry in os.scandir(data_dir):
+            if entry.is_file():
+                sizes[entry.name] = entry.stat().st_size
+    except OSError:
+        pass
+    return sizes
+
+
+def _label(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+
+def _histogram_lines(name: str, histogram: dict, labels: str = "") -> List[str]:
+    lines = []
+    cumulative = 0
+    sep = "," if labels else ""
+    for bound, count in zip(LATENCY_BUCKETS_MS, histogram["buckets"]):
+        cumulative += count
+        lines.append(f'{name}_bucket{{{labels}{sep}le="{bound / 1000}"}} {cumulative}')
+    lines.append(f'{name}_bucket{{{labels}{sep}le="+Inf"}} {histogram["count"]}')
+    suffix = f"{{{labels}}}" if labels else ""
+    lines.append(f"{name}_sum{suffix} {histogram['sum'] / 1000}")
+    lines.append(f"{name}_count{suffix} {histogram['count']}")
+    return lines
+
+
+def render_prometheus(metrics: dict, gauges: Optional[Dict[str, float]] = None) -> str:
+    """Метрики MetricsManager и дополнительные gauge в текстовом формате Prometheus"""
+    lines: List[str] = []
+    totals = metrics.get("totals", {})
+    llm = metrics.get("llm", {})
+
+    lines.append("# TYPE dreams_requests_total counter")
+    lines.append(f'dreams_requests_total{{status="success"}} {totals.get("success", 0)}')
+    lines.append(f'dreams_requests_total{{status="error"}} {totals.get("errors", 0)}')
+
+    # сэмплы одного семейства в текстовом формате должны идти подряд, после его # TYPE
+    lines.append("# TYPE dreams_llm_attempts_total counter")
+    for kind in ("primary", "fallback"):
+        lines.append(f'dreams_llm_attempts_total{{kind="{kind}"}} {llm.get(f"{kind}_attempts", 0)}')
+    lines.append("# TYPE dreams_llm_success_total counter")
+    for kind in ("primary", "fallback"):
+        lines.append(f'dreams_llm_success_total{{kind="{kind}"}} {llm.get(f"{kind}_success", 0)}')
+
+    lines.append("# TYPE dreams_llm_model_requests_total counter")
+    for model, count in llm.get("per_model", {}).items():
+        lines.append(f'dreams_llm_model_requests_total{{model="{_label(model)}"}} {count}')
+
+    histogram = metrics.get("timings", {}).get("histogram")
+    if histogram:
+        lines.append("# TYPE dreams_response_seconds histogram")
+        lines.extend(_histogram_lines("dreams_response_seconds", histogram))
+    if llm.get("latency"):
+        lines.append("# TYPE dreams_llm_response_seconds histogram")
+        for model, model_histogram in llm["latency"].items():
+            lines.extend(_histogram_lines("dreams_llm_response_seconds", model_histogram, f'model="{_label(model)}"'))
+
+    tokens = metrics.get("tokens")
+    if tokens:
+        lines.append("# TYPE dreams_llm_tokens_total counter")
+        for model, model_tokens in tokens.get("per_model", {}).items():
+            for kind in ("prompt", "completion"):
+                lines.append(
+                    f'dreams_llm_tokens_total{{model="{_label(model)}",type="{kind}"}} {model_tokens.get(kind, 0)}'
+                )
+    lines.append("# TYPE dreams_llm_continuations_total counter")
+    lines.append(f"dreams_llm_continuations_total {llm.get('continuations', 0)}")
+
+    cache = llm.get("cache")
+    if cache:
+        lines.append("# TYPE dreams_cache_requests_total counter")
+        lines.append(f'dreams_cache_requests_total{{result="hit"}} {cache["hits"]}')
+        lines.append(f'dreams_cache_requests_total{{result="miss"}} {cache["misses"]}')
+
+    user_cache = metrics.get("user_cache")
+    if user_cache:
+        lines.append("# TYPE dreams_user_cache_requests_total counter")
+        lines.append(f'dreams_user_cache_requests_total{{result="hit"}} {user_cache["hits"]}')
+        lines.append(f'dreams_user_cache_requests_total{{result="miss"}} {user_cache["misses"]}')
+        lines.append("# TYPE dreams_user_cache_evictions_total counter")
+        lines.append(f"dreams_user_cache_evictions_total {user_cache['evictions']}")
+        lines.append("# TYPE dreams_user_cache_bytes gauge")
+        lines.append(f"dreams_user_cache_bytes {user_cache['bytes']}")
+
+    router = llm.get("router") or {}
+    if router:
+        lines.append("# TYPE dreams_model_error_rate gauge")
+        for model, health in router.items():
+            lines.append(f'dreams_model_error_rate{{model="{_label(model)}"}} {health["error_rate"]}')
+        lines.append("# TYPE dreams_model_circuit_open gauge")
+        for model, health in router.items():
+            lines.append(f'dreams_model_circuit_open{{model="{_label(model)}"}} {int(health["state"] == "open")}')
+
+    declared = set()
+    for name, value in (gauges or {}).items():
+        metric_name = name.split("{", 1)[0]
+        if metric_name not in declared:
+            declared.add(metric_name)
+            lines.append(f"# TYPE {metric_name} gauge")
+        lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    """Лёгкий HTTP-эндпоинт /metrics в процессе бота (aiohttp уже есть в зависимостях aiogram)"""
+
+    def __init__(self, metrics_source: Callable[[], dict], gauges: GaugeCollector, host: str, port: int) -> None:
+        self.metrics_source = metrics_source
+        self.gauges = gauges
+        self.host = host
+        self.port = port
+        self._runner: Optional[web.AppRunner] = None
+
+    async def _handle_metrics(self, request: web.Request) -> web.Response:
+        body = render_prometheus(self.metrics_source(), self.gauges())
+        return web.Response(text=body, content_type="text/plain", charset="utf-8")
+
+    async def start(self) -> None:
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle_metrics)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logger.info(f"Эндпоинт метрик: http://{self.host}:{self.port}/metrics")
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
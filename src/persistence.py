@@ -0,0 +1,164 @@
+import asyncio
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def atomic_write_text(path: str, text: str, *, fsync: bool = True) -> None:
+    """Записать файл через временный файл и os.replace; с fsync данные переживут падение ОС"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+        if fsync:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class BackgroundWriter:
+    """Отдельный поток для блокирующей записи на диск.
+    Задания ставятся по ключу: если задание с тем же ключом ещё ждёт выполнения,
+    повторная отметка «данные изменились» не добавляет работы — несколько изменений
+    сохраняются одной записью.
+    """
+
+    def __init__(self, name: str = "persistence-writer") -> None:
+        self.name = name
+        self._cond = threading.Condition()
+        self._pending: "OrderedDict[str, Callable[[], None]]" = OrderedDict()
+        self._busy = False
+        self._stopped = False
+        self._thread: Optional[threading.Thread] = None
+        self.scheduled = 0
+        self.coalesced = 0
+        self.failed = 0
+
+    def _ensure_thread(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+
+    def schedule(self, key: str, job: Callable[[], None]) -> None:
+        """Поставить задание; задание с тем же ключом, ещё не начатое, заменяется"""
+        with self._cond:
+            if self._stopped:
+                raise RuntimeError("BackgroundWriter уже остановлен")
+            if key in self._pending:
+                self.coalesced += 1
+            else:
+                self.scheduled += 1
+            self._pending[key] = job
+            self._ensure_thread()
+            self._cond.notify_all()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Дождаться выполнения всех поставленных заданий"""
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._pending and not self._busy, timeout)
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """Выполнить оставшиеся задания и остановить поток"""
+        self.flush(timeout)
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending or self._stopped)
+                if not self._pending:
+                    return
+                key, job = self._pending.popitem(last=False)
+                self._busy = True
+            try:
+                job()
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Ошибка фоновой записи ({key}): {e}")
+            finally:
+                with self._cond:
+                    self._busy = False
+                    self._cond.notify_all()
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            return {
+                "pending": len(self._pending),
+                "scheduled": self.scheduled,
+                "coalesced": self.coalesced,
+                "failed": self.failed,
+            }
+
+
+class PeriodicFlusher:
+    """Периодический сброс состояния в файл: изменения отмечаются _mark_dirty(), а на диск
+    попадают раз в flush_interval секунд и при close(). Снимок сериализуется в вызывающем
+    потоке (состояние меняется только в event loop), запись и fsync — в потоке writer;
+    ещё не записанный снимок заменяется более свежим.
+    Наследник задаёт path, flush_interval, writer, вызывает _init_flusher() и реализует _serialize().
+    """
+
+    path: str
+    flush_interval: float
+    writer: Optional[BackgroundWriter]
+    flush_key_prefix = "state"
+
+    def _init_flusher(self) -> None:
+        self._dirty = False
+        self._payload: Optional[str] = None
+        self._flush_task: Optional[asyncio.Task] = None
+
+    def _serialize(self) -> str:
+        raise NotImplementedError
+
+    def _mark_dirty(self) -> None:
+        """Отметить изменения; на диск они попадут при следующем flush()"""
+        self._dirty = True
+
+    def flush(self) -> None:
+        """Записать состояние в файл, если были изменения"""
+        if not self._dirty:
+            return
+        self._dirty = False
+        self._payload = self._serialize()
+        if self.writer is None:
+            self._write_payload()
+        else:
+            self.writer.schedule(f"{self.flush_key_prefix}:{self.path}", self._write_payload)
+
+    def _write_payload(self) -> None:
+        payload = self._payload
+        if payload is None:
+            return
+        try:
+            atomic_write_text(self.path, payload)
+        except Exception as e:
+            self._dirty = True
+            logger.warning(f"Не удалось сохранить {self.path}: {e}")
+
+    def start_autoflush(self) -> None:
+        """Запустить периодический сброс на диск (нужен работающий event loop)"""
+        if self._flush_task is None and self.flush_interval > 0:
+            self._flush_task = asyncio.create_task(self._autoflush())
+
+    async def _autoflush(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            self.flush()
+
+    async def close(self) -> None:
+        """Остановить периодический сброс и записать последние изменения"""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+            self._flush_task = None
+        self.flush()
+        if self.writer is not None:
+            await asyncio.to_thread(self.writer.flush)
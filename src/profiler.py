@@ -0,0 +1,175 @@
+"""
+Профилирование работающего процесса по команде администратора, без перезапуска:
+- стеки: поток-семплер снимает sys._current_frames() всех потоков, а на event loop
+  периодически снимаются стеки ожидающих asyncio-задач; результат — collapsed stacks
+  (формат flamegraph.pl / speedscope / https://www.speedscope.app);
+- аллокации: tracemalloc на время окна, топ мест по приросту памяти.
+"""
+
+import asyncio
+import os
+import sys
+import threading
+import tracemalloc
+from collections import Counter
+from types import FrameType
+from typing import List, Optional, Tuple
+
+MODES = ("cpu", "mem")
+# Корень проекта: пути файлов проекта в стеках — относительные, библиотек — короткие
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def parse_profile_args(text: str, default_seconds: int = 10, max_seconds: int = 60) -> Tuple[int, str]:
+    """'/profile 15 mem' -> (15, 'mem'); по умолчанию — стеки за default_seconds"""
+    seconds, mode = default_seconds, "cpu"
+    for arg in text.split()[1:]:
+        if arg.isdigit():
+            seconds = int(arg)
+        elif arg.lower() in MODES:
+            mode = arg.lower()
+        else:
+            raise ValueError(f"Неизвестный параметр: {arg}")
+    if not 1 <= seconds <= max_seconds:
+        raise ValueError(f"Длительность — от 1 до {max_seconds} с")
+    return seconds, mode
+
+
+def _short_path(filename: str) -> str:
+    if filename.startswith(_ROOT):
+        return os.path.relpath(filename, _ROOT)
+    return os.path.basename(filename)
+
+
+def _label(frame: FrameType, lineno: Optional[int] = None) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({_short_path(code.co_filename)}:{lineno or frame.f_lineno})"
+
+
+def frame_labels(frame: Optional[FrameType]) -> List[str]:
+    """Стек от корня к листу"""
+    labels = []
+    while frame is not None:
+        labels.append(_label(frame))
+        frame = frame.f_back
+    labels.reverse()
+    return labels
+
+
+class SamplingProfiler:
+    """Семплирующий профилировщик: отдельный поток раз в interval секунд снимает стеки всех потоков.
+    Накладные расходы — один обход стеков под GIL на выборку; на event loop добавляется
+    только редкий обход asyncio-задач (sample_tasks).
+    """
+
+    def __init__(self, interval: float = 0.01) -> None:
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.task_samples = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="dreams-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = [f"thread {names.get(ident, ident)}"] + frame_labels(frame)
+                self.stacks[";".join(stack)] += 1
+            self.samples += 1
+
+    async def sample_tasks(self, interval: float) -> None:
+        """Где стоят asyncio-задачи: в стеках потоков event loop виден лишь select(), а ожидание
+        LLM, Telegram или очереди — это приостановленные корутины
+        """
+        current = asyncio.current_task()
+        while not self._stop.is_set():
+            for task in asyncio.all_tasks():
+                if task is current or task.done():
+                    continue
+                coro = task.get_coro()
+                name = getattr(coro, "__qualname__", type(coro).__name__)
+                # get_stack у приостановленной корутины — кадры с текущей строкой ожидания
+                stack = ["asyncio", f"task {name}"] + [_label(frame) for frame in task.get_stack()]
+                self.stacks[";".join(stack)] += 1
+            self.task_samples += 1
+            await asyncio.sleep(interval)
+
+    def collapsed(self) -> str:
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common()) + "\n"
+
+    def summary(self, top: int = 5) -> str:
+        """Самые частые листовые кадры потоков (где реально тратится CPU)"""
+        leaves: Counter = Counter()
+        for stack, count in self.stacks.items():
+            if not stack.startswith("asyncio;"):
+                leaves[stack.rsplit(";", 1)[-1]] += count
+        total = sum(leaves.values()) or 1
+        lines = [f"Выборок: {self.samples} (потоки), {self.task_samples} (asyncio-задачи)"]
+        for label, count in leaves.most_common(top):
+            lines.append(f"{count / total * 100:.1f}% {label}")
+        return "\n".join(lines)
+
+
+async def profile_stacks(seconds: float, interval: float = 0.01) -> SamplingProfiler:
+    """Снять стеки потоков и asyncio-задач за seconds секунд"""
+    profiler = SamplingProfiler(interval)
+    profiler.start()
+    # задачи обходим реже потоков: обход идёт на самом event loop
+    tasks_sampler = asyncio.create_task(profiler.sample_tasks(max(interval * 5, 0.05)))
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        await asyncio.to_thread(profiler.stop)
+        await tasks_sampler
+    return profiler
+
+
+async def profile_allocations(seconds: float, top: int = 25, frames: int = 10) -> str:
+    """Топ мест аллокаций по приросту памяти за seconds секунд (tracemalloc включается на время окна)"""
+    started_here = not tracemalloc.is_tracing()
+    if started_here:
+        tracemalloc.start(frames)
+    try:
+        before = await asyncio.to_thread(tracemalloc.take_snapshot)
+        await asyncio.sleep(seconds)
+        after = await asyncio.to_thread(tracemalloc.take_snapshot)
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        if started_here:
+            tracemalloc.stop()
+
+    filters = [
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        tracemalloc.Filter(False, "<unknown>"),
+    ]
+    before, after = before.filter_traces(filters), after.filter_traces(filters)
+    lines = [
+        f"Окно {seconds} с, отслеживается {current / 1024 / 1024:.1f} МБ (пик {peak / 1024 / 1024:.1f} МБ)",
+        "",
+        "Прирост по строкам:",
+    ]
+    for stat in after.compare_to(before, "lineno")[:top]:
+        frame = stat.traceback[0]
+        lines.append(
+            f"{stat.size_diff / 1024:+.1f} КБ ({stat.count_diff:+} блоков), всего {stat.size / 1024:.1f} КБ — "
+            f"{_short_path(frame.filename)}:{frame.lineno}"
+        )
+    lines += ["", "Стеки крупнейших мест:"]
+    for index, stat in enumerate(after.compare_to(before, "traceback")[:5], start=1):
+        lines.append(f"#{index}: {stat.size_diff / 1024:+.1f} КБ ({stat.count_diff:+} блоков)")
+        lines.extend(stat.traceback.format(limit=frames))
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,171 @@
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Callable, Deque, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def _percentile(sorted_values: List[int], q: float) -> Optional[int]:
+    if not sorted_values:
+        return None
+    idx = min(len(sorted_values) - 1, int(q * len(sorted_values)))
+    return sorted_values[idx]
+
+
+@dataclass
+class ModelHealth:
+    """Скользящая статистика модели и состояние её circuit breaker"""
+
+    window: int
+    # (успех, задержка мс, обрезан ли ответ по длине)
+    samples: Deque[tuple] = field(default_factory=deque)
+    consecutive_failures: int = 0
+    opened_at: Optional[float] = None
+    # когда выдана пробная попытка half-open (None — не выдана)
+    trial_started_at: Optional[float] = None
+
+    def add(self, ok: bool, latency_ms: Optional[int], length_cut: bool) -> None:
+        self.samples.append((ok, latency_ms, length_cut))
+        while len(self.samples) > self.window:
+            self.samples.popleft()
+        self.consecutive_failures = 0 if ok else self.consecutive_failures + 1
+
+    @property
+    def error_rate(self) -> float:
+        if not self.samples:
+            return 0.0
+        return sum(1 for ok, _, _ in self.samples if not ok) / len(self.samples)
+
+    @property
+    def length_rate(self) -> float:
+        ok_samples = [cut for ok, _, cut in self.samples if ok]
+        if not ok_samples:
+            return 0.0
+        return sum(1 for cut in ok_samples if cut) / len(ok_samples)
+
+    def latency(self, q: float) -> Optional[int]:
+        return _percentile(sorted(ms for ok, ms, _ in self.samples if ok and ms is not None), q)
+
+
+class ModelRouter:
+    """Маршрутизация по здоровью моделей: circuit breaker + понижение деградировавших.
+    Порядок из конфигурации сохраняется, пока модели здоровы; модели с открытым
+    breaker-ом или высокой долей ошибок/задержкой уходят в конец списка.
+    """
+
+    def __init__(
+        self,
+        *,
+        window: int = 50,
+        failure_threshold: int = 3,
+        error_rate_threshold: float = 0.5,
+        min_samples: int = 10,
+        cooldown_s: float = 60.0,
+        slow_p95_ms: int = 0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.window = window
+        self.failure_threshold = failure_threshold
+        self.error_rate_threshold = error_rate_threshold
+        self.min_samples = min_samples
+        self.cooldown_s = cooldown_s
+        self.slow_p95_ms = slow_p95_ms
+        self._clock = clock
+        self.models: Dict[str, ModelHealth] = {}
+
+    def _health(self, model: str) -> ModelHealth:
+        if model not in self.models:
+            self.models[model] = ModelHealth(window=self.window)
+        return self.models[model]
+
+    def record_success(self, model: str, latency_ms: Optional[int], finish_reason: Optional[str] = None) -> None:
+        health = self._health(model)
+        health.add(True, latency_ms, finish_reason == "length")
+        if health.opened_at is not None:
+            logger.info(f"Circuit breaker для {model} закрыт")
+        health.opened_at = None
+        health.trial_started_at = None
+
+    def record_failure(self, model: str) -> None:
+        health = self._health(model)
+        health.add(False, None, False)
+        too_many_errors = len(health.samples) >= self.min_samples and health.error_rate >= self.error_rate_threshold
+        trial = health.trial_started_at is not None
+        if trial or health.consecutive_failures >= self.failure_threshold or too_many_errors:
+            if health.opened_at is None or trial:
+                logger.warning(f"Circuit breaker для {model} открыт на {self.cooldown_s:.0f} с")
+            health.opened_at = self._clock()
+            health.trial_started_at = None
+
+    def state(self, model: str) -> str:
+        """closed | open | half_open"""
+        health = self.models.get(model)
+        if health is None or health.opened_at is None:
+            return "closed"
+        if self._clock() - health.opened_at >= self.cooldown_s:
+            return "half_open"
+        return "open"
+
+    def allow(self, model: str) -> bool:
+        """Можно ли сейчас отправлять запрос в модель (half-open: забирает единственную пробную попытку)"""
+        state = self.state(model)
+        if state == "half_open":
+            return self._claim_trial(model)
+        return state == "closed"
+
+    def _claim_trial(self, model: str) -> bool:
+        """Одна пробная попытка после остывания. Если выданная попытка так и не завершилась
+        (запрос обслужила модель раньше в списке), через cooldown выдаётся новая.
+        """
+        health = self.models[model]
+        now = self._clock()
+        if health.trial_started_at is not None and now - health.trial_started_at < self.cooldown_s:
+            return False
+        health.trial_started_at = now
+        return True
+
+    def _is_degraded(self, model: str) -> bool:
+        health = self.models.get(model)
+        if health is None or len(health.samples) < self.min_samples:
+            return False
+        if health.error_rate >= self.error_rate_threshold:
+            return True
+        p95 = health.latency(0.95)
+        return bool(self.slow_p95_ms and p95 is not None and p95 >= self.slow_p95_ms)
+
+    def order(self, models: List[str]) -> List[str]:
+        """Отсортировать кандидатов: доступные и здоровые — вперёд, с сохранением порядка конфигурации.
+        Модель в half-open остаётся на своём месте только у запроса, получившего пробную попытку;
+        остальные запросы видят её в конце списка, как с открытым breaker-ом.
+        """
+        available: List[str] = []
+        blocked: List[str] = []
+        for m in models:
+            state = self.state(m)
+            if state == "closed" or (state == "half_open" and self._claim_trial(m)):
+                available.append(m)
+            else:
+                blocked.append(m)
+        healthy = [m for m in available if not self._is_degraded(m)]
+        degraded = sorted(
+            (m for m in available if self._is_degraded(m)),
+            key=lambda m: (self.models[m].error_rate, self.models[m].latency(0.95) or 0),
+        )
+        # если все breaker-ы открыты — всё равно пробуем, чем отказывать пользователю сразу
+        return healthy + degraded + blocked
+
+    def snapshot(self) -> Dict[str, dict]:
+        """Состояние роутера для метрик"""
+        return {
+            model: {
+                "state": self.state(model),
+                "samples": len(health.samples),
+                "error_rate": round(health.error_rate, 3),
+                "length_rate": round(health.length_rate, 3),
+                "p50_ms": health.latency(0.5),
+                "p95_ms": health.latency(0.95),
+            }
+            for model, health in self.models.items()
+        }
@@ -0,0 +1,129 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+JobFactory = Callable[[], Awaitable[Any]]
+
+
+class QueueFullError(Exception):
+    """Очередь запросов переполнена"""
+
+
+class RequestScheduler:
+    """Ограниченная очередь LLM-запросов с пулом воркеров и round-robin по пользователям.
+    Пользователь с десятью снами в очереди не задерживает остальных: воркеры
+    берут по одному заданию от каждого пользователя по кругу.
+    """
+
+    def __init__(self, workers: int = 8, max_queue: int = 200) -> None:
+        self.workers = max(1, workers)
+        self.max_queue = max(1, max_queue)
+        self._queues: Dict[str, Deque[tuple]] = {}
+        self._ready: Deque[str] = deque()  # пользователи с непустой очередью, в порядке обхода
+        self._available: Optional[asyncio.Semaphore] = None
+        self._tasks: List[asyncio.Task] = []
+        self.depth = 0
+        self.in_flight = 0
+        self.max_depth = 0
+        self.rejected = 0
+        self.wait_ms_sum = 0
+        self.wait_ms_count = 0
+        self.wait_ms_max = 0
+
+    def start(self) -> None:
+        """Запустить воркеры (нужен работающий event loop)"""
+        if self._tasks:
+            return
+        self._available = asyncio.Semaphore(0)
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        logger.info(f"Планировщик запущен: воркеров {self.workers}, очередь до {self.max_queue}")
+
+    async def stop(self) -> None:
+        """Остановить воркеры; незапущенные задания отменяются"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for queue in self._queues.values():
+            for _, future, _ in queue:
+                future.cancel()
+        self._queues.clear()
+        self._ready.clear()
+        self.depth = 0
+
+    def position_for(self, user_id: str) -> int:
+        """Оценка позиции (с 1) нового задания пользователя с учётом round-robin.
+        Перед ним выполнятся его собственные задания и не больше k+1 заданий каждого другого пользователя.
+        """
+        own = len(self._queues.get(user_id, ()))
+        others = sum(min(len(q), own + 1) for uid, q in self._queues.items() if uid != user_id)
+        return own + others + 1
+
+    async def submit(self, user_id: str, job: JobFactory) -> Any:
+        """Поставить задание в очередь и дождаться результата"""
+        if self.depth >= self.max_queue:
+            self.rejected += 1
+            raise QueueFullError(f"Очередь заполнена ({self.depth})")
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        queue = self._queues.get(user_id)
+        if queue is None:
+            queue = self._queues[user_id] = deque()
+            self._ready.append(user_id)
+        queue.append((job, future, time.monotonic()))
+        self.depth += 1
+        self.max_depth = max(self.max_depth, self.depth)
+        self._available.release()
+        return await future
+
+    def _next_job(self) -> tuple:
+        user_id = self._ready.popleft()
+        queue = self._queues[user_id]
+        item = queue.popleft()
+        if queue:
+            self._ready.append(user_id)
+        else:
+            del self._queues[user_id]
+        self.depth -= 1
+        return item
+
+    async def _worker(self, idx: int) -> None:
+        while True:
+            await self._available.acquire()
+            job, future, enqueued_at = self._next_job()
+            if future.cancelled():
+                continue
+            wait_ms = int((time.monotonic() - enqueued_at) * 1000)
+            self.wait_ms_sum += wait_ms
+            self.wait_ms_count += 1
+            self.wait_ms_max = max(self.wait_ms_max, wait_ms)
+            self.in_flight += 1
+            try:
+                result = await job()
+            except asyncio.CancelledError:
+                future.cancel()
+                raise
+            except Exception as e:
+                if not future.cancelled():
+                    future.set_exception(e)
+            else:
+                if not future.cancelled():
+                    future.set_result(result)
+            finally:
+                self.in_flight -= 1
+
+    def stats(self) -> Dict[str, int]:
+        """Состояние очереди для метрик"""
+        return {
+            "depth": self.depth,
+            "in_flight": self.in_flight,
+            "max_depth": self.max_depth,
+            "rejected": self.rejected,
+            "wait_ms_sum": self.wait_ms_sum,
+            "wait_ms_count": self.wait_ms_count,
+            "wait_ms_max": self.wait_ms_max,
+        }
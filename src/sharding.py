@@ -0,0 +1,62 @@
+import logging
+import os
+import queue
+import zlib
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from aiogram.types import Update
+
+logger = logging.getLogger(__name__)
+
+
+def shard_for(key: str, count: int) -> int:
+    """Номер воркера для ключа (user_id): стабилен между перезапусками, в отличие от hash()"""
+    return zlib.crc32(str(key).encode("utf-8")) % max(1, count)
+
+
+def worker_path(path: str, index: Optional[int]) -> str:
+    """Файл конкретного воркера: data/metrics.json -> data/metrics.worker2.json"""
+    if index is None:
+        return path
+    base, ext = os.path.splitext(path)
+    return f"{base}.worker{index}{ext}"
+
+
+def update_shard_key(update: Update) -> str:
+    """Ключ шардирования: отправитель обновления, иначе чат, иначе сам update_id"""
+    event = update.event
+    user = getattr(event, "from_user", None)
+    if user is not None:
+        return str(user.id)
+    chat = getattr(event, "chat", None)
+    if chat is not None:
+        return str(chat.id)
+    return str(update.update_id)
+
+
+class ShardRouter:
+    """Outer-middleware входного процесса: отдаёт обновление в очередь воркера по user_id.
+    Все обновления пользователя попадают в один и тот же процесс, поэтому его склейка сообщений,
+    очередь и кэш текущей сессии остаются согласованными.
+    """
+
+    def __init__(self, queues: List[Any]) -> None:
+        self.queues = queues
+        self.routed = [0] * len(queues)
+        self.dropped = 0
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any],
+    ) -> Any:
+        index = shard_for(update_shard_key(event), len(self.queues))
+        try:
+            self.queues[index].put_nowait(event.model_dump(mode="json", exclude_unset=True))
+            self.routed[index] += 1
+        except queue.Full:
+            self.dropped += 1
+            logger.warning(f"Очередь воркера {index} переполнена, обновление {event.update_id} отброшено")
+        # во входном процессе обработчиков нет
+        return None
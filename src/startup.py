@@ -0,0 +1,39 @@
+import logging
+import time
+from typing import Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Отсчёт от импорта этого модуля: main.py импортирует его первым
+_STARTED_AT = time.perf_counter()
+
+
+class StartupTimer:
+    """Замер этапов запуска: сколько прошло от старта процесса до каждой отметки"""
+
+    def __init__(self, started_at: float = _STARTED_AT) -> None:
+        self.started_at = started_at
+        self.marks: List[Tuple[str, float]] = []
+
+    def mark(self, phase: str) -> float:
+        """Отметить завершение этапа; вернуть секунды с начала запуска"""
+        elapsed = time.perf_counter() - self.started_at
+        self.marks.append((phase, elapsed))
+        return elapsed
+
+    def phases(self) -> Dict[str, float]:
+        """Длительность каждого этапа (от предыдущей отметки), секунды"""
+        result: Dict[str, float] = {}
+        previous = 0.0
+        for phase, elapsed in self.marks:
+            result[phase] = round(elapsed - previous, 3)
+            previous = elapsed
+        return result
+
+    def report(self) -> str:
+        total = self.marks[-1][1] if self.marks else 0.0
+        parts = ", ".join(f"{phase} {duration:.2f} с" for phase, duration in self.phases().items())
+        return f"Время запуска: {total:.2f} с ({parts})"
+
+
+startup_timer = StartupTimer()
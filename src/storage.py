@@ -0,0 +1,712 @@
+import copy
+import json
+import logging
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from .persistence import BackgroundWriter, atomic_write_text
+from .user_cache import UserLRUCache, message_size
+
+logger = logging.getLogger(__name__)
+
+# Служебный ключ снимка: номер последней записи журнала, уже вошедшей в снимок
+JOURNAL_SEQ_KEY = "_journal_seq"
+
+
+def new_session_stats() -> Dict[str, object]:
+    """Агрегаты сессии: считаются по мере добавления сообщений, чтобы не перебирать их потом"""
+    return {
+        "messages": 0,
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "total_tokens": 0,
+        "models": {},
+        "last_message_at": None,
+    }
+
+
+def update_session_stats(stats: Dict[str, object], message: dict) -> None:
+    """Учесть сообщение в агрегатах сессии (модель и usage берутся из metadata ответа)"""
+    stats["messages"] += 1
+    stats["last_message_at"] = message.get("timestamp")
+    metadata = message.get("metadata") or {}
+    model = metadata.get("model")
+    if model:
+        stats["models"][model] = stats["models"].get(model, 0) + 1
+    # ответ из кэша токенов не потратил
+    if not metadata.get("cached"):
+        usage = metadata.get("usage") or {}
+        for key in ("prompt_tokens", "completion_tokens", "total_tokens"):
+            stats[key] += int(usage.get(key) or 0)
+
+
+def session_stats_from_messages(messages: List[dict]) -> Dict[str, object]:
+    stats = new_session_stats()
+    for message in messages:
+        update_session_stats(stats, message)
+    return stats
+
+
+def session_summary(session: dict) -> dict:
+    """Сессия без сообщений: идентификатор, время создания и агрегаты"""
+    stats = session.get("stats") or session_stats_from_messages(session.get("messages", []))
+    return {"session_id": session.get("session_id"), "created_at": session.get("created_at"), **stats}
+
+
+def snapshot_copy(users_data: Dict[str, dict]) -> Dict[str, dict]:
+    """Копия данных для сериализации вне блокировки.
+    Сообщения после добавления не меняются — они разделяются с оригиналом;
+    копируются только контейнеры, которые меняет apply_record (пользователи, списки, агрегаты).
+    """
+    copied = {}
+    for user_id, user in users_data.items():
+        sessions = []
+        for session in user.get("sessions", []):
+            session = {**session, "messages": list(session.get("messages", []))}
+            if "stats" in session:
+                session["stats"] = {**session["stats"], "models": dict(session["stats"].get("models", {}))}
+            sessions.append(session)
+        copied[user_id] = {**user, "sessions": sessions}
+    return copied
+
+
+def apply_record(users_data: Dict[str, dict], record: dict) -> Dict[str, int]:
+    """Применить запись журнала к данным в памяти.
+    Используется и при обычной работе, и при воспроизведении журнала на старте.
+    Возвращает изменение счётчиков статистики (users/sessions/messages).
+    """
+    delta = {"users": 0, "sessions": 0, "messages": 0}
+    op = record.get("op")
+    user_id = record.get("user_id")
+    if op == "message":
+        user = users_data.get(user_id)
+        if user is None:
+            user = users_data[user_id] = {
+                "user_id": user_id,
+                "username": record.get("username"),
+                "created_at": record.get("user_created_at"),
+                "sessions": [],
+            }
+            delta["users"] += 1
+        sessions = user["sessions"]
+        if not sessions or sessions[-1].get("session_id") != record.get("session_id"):
+            sessions.append({
+                "session_id": record.get("session_id"),
+                "messages": [],
+                "created_at": record.get("session_created_at"),
+                "stats": new_session_stats(),
+            })
+            delta["sessions"] += 1
+        session = sessions[-1]
+        session["messages"].append(record["message"])
+        if "stats" not in session:
+            session["stats"] = session_stats_from_messages(session["messages"])
+        else:
+            update_session_stats(session["stats"], record["message"])
+        delta["messages"] += 1
+    elif op == "clear":
+        if user_id in users_data:
+            sessions = users_data[user_id]["sessions"]
+            delta["sessions"] -= len(sessions)
+            delta["messages"] -= sum(len(s.get("messages", [])) for s in sessions)
+            users_data[user_id]["sessions"] = []
+    else:
+        logger.warning(f"Неизвестная операция журнала: {op}")
+    return delta
+
+
+class JSONFileStorage:
+    """Прежний формат: весь словарь пользователей переписывается в один JSON-файл.
+    Данные целиком держатся в памяти, счётчики статистики ведутся инкрементально.
+    С writer запись на диск уходит в фоновый поток; изменения между записями сливаются в одну.
+    """
+
+    def __init__(self, path: str, writer: Optional[BackgroundWriter] = None) -> None:
+        self.path = path
+        self.writer = writer
+        self.users_data: Dict[str, dict] = {}
+        self._stats = {"users": 0, "sessions": 0, "messages": 0}
+        self._snapshot_seq = 0
+        # изменения в памяти и сериализация снимка в потоке-писателе не должны пересекаться
+        self._lock = threading.RLock()
+
+    def load(self) -> None:
+        self.users_data = self._read_snapshot()
+        self._recount()
+
+    def _read_snapshot(self) -> Dict[str, dict]:
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        self._snapshot_seq = int(data.pop(JOURNAL_SEQ_KEY, 0) or 0)
+        return data
+
+    def _recount(self) -> None:
+        sessions = [s for u in self.users_data.values() for s in u.get("sessions", [])]
+        # снимки старого формата: агрегаты сессий строятся один раз при загрузке
+        for session in sessions:
+            if "stats" not in session:
+                session["stats"] = session_stats_from_messages(session.get("messages", []))
+        self._stats = {
+            "users": len(self.users_data),
+            "sessions": len(sessions),
+            "messages": sum(len(s.get("messages", [])) for s in sessions),
+        }
+
+    def write(self, record: dict) -> None:
+        """Применить запись и сохранить изменения"""
+        with self._lock:
+            for key, value in apply_record(self.users_data, record).items():
+                self._stats[key] += value
+        self._persist(record)
+
+    def _persist(self, record: dict) -> None:
+        if self.writer is None:
+            self.save()
+        else:
+            self.writer.schedule(f"snapshot:{self.path}", self.save)
+
+    def _snapshot_text(self) -> str:
+        # под блокировкой — только дешёвая копия ссылок; сериализация не задерживает write() на event loop
+        with self._lock:
+            data = snapshot_copy(self.users_data)
+        return json.dumps(data, ensure_ascii=False, indent=2)
+
+    def save(self) -> None:
+        # запись через временный файл, чтобы не оставить обрезанный JSON при падении
+        atomic_write_text(self.path, self._snapshot_text())
+
+    def close(self) -> None:
+        pass
+
+    def get_user(self, user_id: str) -> Optional[dict]:
+        return self.users_data.get(user_id)
+
+    def last_session_id(self, user_id: str) -> Optional[str]:
+        user = self.users_data.get(user_id)
+        if not user or not user["sessions"]:
+            return None
+        return user["sessions"][-1]["session_id"]
+
+    def last_session(self, user_id: str) -> Optional[Tuple[str, Optional[str]]]:
+        """(session_id, время последнего сообщения) последней сессии пользователя"""
+        user = self.users_data.get(user_id)
+        if not user or not user["sessions"]:
+            return None
+        session = user["sessions"][-1]
+        return session["session_id"], session["stats"]["last_message_at"]
+
+    def get_current_session(self, user_id: str) -> Optional[dict]:
+        user = self.users_data.get(user_id)
+        if user is None:
+            return None
+        return {**user, "sessions": user["sessions"][-1:]}
+
+    def session_summaries(self, user_id: str) -> List[dict]:
+        user = self.users_data.get(user_id)
+        return [session_summary(s) for s in user["sessions"]] if user else []
+
+    def iter_users(self, user_ids: Optional[List[str]] = None) -> Iterator[dict]:
+        """Пользователи (все или указанные) для экспорта в отдельном потоке: каждый копируется
+        под блокировкой, пока event loop продолжает дописывать историю в живые словари
+        """
+        with self._lock:
+            user_ids = list(self.users_data) if user_ids is None else list(user_ids)
+        for user_id in user_ids:
+            with self._lock:
+                user = self.users_data.get(user_id)
+                user = copy.deepcopy(user) if user is not None else None
+            if user is not None:
+                yield user
+
+    def statistics(self) -> Dict[str, int]:
+        return {
+            "total_users": self._stats["users"],
+            "total_sessions": self._stats["sessions"],
+            "total_messages": self._stats["messages"],
+        }
+
+
+class JournalStorage(JSONFileStorage):
+    """Снимок (тот же conversations.json) + журнал изменений в JSONL.
+    Каждое сообщение дописывается одной строкой в журнал, полный снимок
+    пишется только при компактизации — раз в compact_every записей и при остановке.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        journal_path: Optional[str] = None,
+        compact_every: int = 500,
+        writer: Optional[BackgroundWriter] = None,
+    ) -> None:
+        super().__init__(path, writer)
+        self.journal_path = journal_path or os.path.splitext(path)[0] + ".journal.jsonl"
+        self.compact_every = max(1, compact_every)
+        self._pending = 0
+        self._seq = 0  # номер последней записи журнала
+        self._buffer: List[str] = []  # строки журнала, ещё не переданные на диск
+
+    def load(self) -> None:
+        self.users_data = self._read_snapshot()
+        self._seq = self._snapshot_seq
+        replayed = skipped = 0
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # недописанная последняя строка после аварийной остановки
+                        logger.warning(f"Пропущена повреждённая строка журнала {self.journal_path}")
+                        continue
+                    seq = record.get("seq")
+                    # запись уже в снимке: сбой между записью снимка и очисткой журнала
+                    if seq is not None and seq <= self._snapshot_seq:
+                        skipped += 1
+                        continue
+                    apply_record(self.users_data, record)
+                    replayed += 1
+                    if seq is not None:
+                        self._seq = max(self._seq, seq)
+        self._pending = replayed
+        self._recount()
+        if replayed:
+            logger.info(f"Из журнала воспроизведено записей: {replayed}")
+        if skipped:
+            logger.warning(f"Пропущено записей журнала, уже вошедших в снимок: {skipped}")
+
+    def write(self, record: dict) -> None:
+        """Применить запись и дописать её в журнал с очередным номером.
+        Номер выдаётся под той же блокировкой, что и изменение данных, поэтому снимок
+        с отметкой seq содержит ровно записи с номерами не больше неё.
+        """
+        with self._lock:
+            self._seq += 1
+            record = {**record, "seq": self._seq}
+            for key, value in apply_record(self.users_data, record).items():
+                self._stats[key] += value
+            self._buffer.append(json.dumps(record, ensure_ascii=False))
+            self._pending += 1
+            compact_due = self._pending >= self.compact_every
+        if self.writer is None:
+            self._append_buffered(fsync=False)
+            if compact_due:
+                self.compact()
+            return
+        # все строки, накопленные до запуска задания, уйдут одной записью с одним fsync
+        self.writer.schedule(f"journal:{self.journal_path}", self._append_buffered)
+        if compact_due:
+            self.writer.schedule(f"compact:{self.path}", self.compact)
+
+    def _append_buffered(self, fsync: bool = True) -> None:
+        with self._lock:
+            lines, self._buffer = self._buffer, []
+        if not lines:
+            return
+        with open(self.journal_path, "a", encoding="utf-8") as f:
+            f.write("".join(line + "\n" for line in lines))
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+
+    def save(self) -> None:
+        self.compact()
+
+    def compact(self) -> None:
+        """Записать снимок и обнулить журнал"""
+        with self._lock:
+            data = snapshot_copy(self.users_data)
+            data[JOURNAL_SEQ_KEY] = self._seq
+            # строки, не успевшие попасть в журнал, уже учтены в снимке
+            self._buffer = []
+            self._pending = 0
+        atomic_write_text(self.path, json.dumps(data, ensure_ascii=False, indent=2))
+        # журнал очищаем только после успешной записи снимка; если процесс упадёт между этими
+        # шагами, при загрузке записи с seq не больше отметки снимка будут пропущены
+        open(self.journal_path, "w", encoding="utf-8").close()
+        logger.info("Журнал данных компактизирован в снимок")
+
+    def close(self) -> None:
+        if self._pending or self._buffer:
+            self.compact()
+
+
+class SQLiteStorage:
+    """SQLite (WAL) с таблицами users/sessions/messages и счётчиками статистики.
+    История не держится в памяти, статистика читается из одной строки таблицы stats.
+    С cache текущие сессии активных пользователей держатся в LRU и обновляются при записи.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS users (
+        user_id TEXT PRIMARY KEY,
+        username TEXT,
+        created_at TEXT
+    );
+    CREATE TABLE IF NOT EXISTS sessions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id TEXT NOT NULL,
+        session_id TEXT NOT NULL,
+        created_at TEXT,
+        message_count INTEGER NOT NULL DEFAULT 0,
+        prompt_tokens INTEGER NOT NULL DEFAULT 0,
+        completion_tokens INTEGER NOT NULL DEFAULT 0,
+        total_tokens INTEGER NOT NULL DEFAULT 0,
+        models TEXT NOT NULL DEFAULT '{}',
+        last_message_at TEXT,
+        UNIQUE (user_id, session_id)
+    );
+    CREATE TABLE IF NOT EXISTS messages (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id TEXT NOT NULL,
+        session_id TEXT NOT NULL,
+        role TEXT NOT NULL,
+        content TEXT NOT NULL,
+        timestamp TEXT NOT NULL,
+        metadata TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_sessions_user ON sessions (user_id, id);
+    CREATE INDEX IF NOT EXISTS idx_messages_user_ts ON messages (user_id, timestamp);
+    CREATE INDEX IF NOT EXISTS idx_messages_session ON messages (user_id, session_id, id);
+    CREATE TABLE IF NOT EXISTS stats (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        total_users INTEGER NOT NULL DEFAULT 0,
+        total_sessions INTEGER NOT NULL DEFAULT 0,
+        total_messages INTEGER NOT NULL DEFAULT 0
+    );
+    INSERT OR IGNORE INTO stats (id) VALUES (1);
+    """
+
+    # колонки агрегатов, добавленные в sessions позже (для баз, созданных до них)
+    SESSION_STATS_COLUMNS = {
+        "message_count": "INTEGER NOT NULL DEFAULT 0",
+        "prompt_tokens": "INTEGER NOT NULL DEFAULT 0",
+        "completion_tokens": "INTEGER NOT NULL DEFAULT 0",
+        "total_tokens": "INTEGER NOT NULL DEFAULT 0",
+        "models": "TEXT NOT NULL DEFAULT '{}'",
+        "last_message_at": "TEXT",
+    }
+
+    def __init__(self, path: str, cache: Optional[UserLRUCache] = None) -> None:
+        self.path = path
+        self.cache = cache
+        self.conn: Optional[sqlite3.Connection] = None
+
+    def load(self) -> None:
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(self.SCHEMA)
+        self.conn.commit()
+        self._migrate_session_stats()
+
+    def _migrate_session_stats(self) -> None:
+        existing = {row[1] for row in self.conn.execute("PRAGMA table_info(sessions)")}
+        missing = [name for name in self.SESSION_STATS_COLUMNS if name not in existing]
+        if not missing:
+            return
+        with self.conn:
+            for name in missing:
+                self.conn.execute(f"ALTER TABLE sessions ADD COLUMN {name} {self.SESSION_STATS_COLUMNS[name]}")
+            sessions = self.conn.execute("SELECT user_id, session_id FROM sessions").fetchall()
+            for user_id, session_id in sessions:
+                messages = []
+                for role, timestamp, metadata in self.conn.execute(
+                    "SELECT role, timestamp, metadata FROM messages WHERE user_id = ? AND session_id = ? ORDER BY id",
+                    (user_id, session_id),
+                ):
+                    messages.append({"role": role, "timestamp": timestamp, "metadata": json.loads(metadata) if metadata else None})
+                self._store_session_stats(user_id, session_id, session_stats_from_messages(messages))
+        logger.info(f"Агрегаты сессий пересчитаны для {len(sessions)} сессий")
+
+    def _store_session_stats(self, user_id: str, session_id: str, stats: dict) -> None:
+        self.conn.execute(
+            "UPDATE sessions SET message_count = ?, prompt_tokens = ?, completion_tokens = ?, total_tokens = ?, "
+            "models = ?, last_message_at = ? WHERE user_id = ? AND session_id = ?",
+            (
+                stats["messages"],
+                stats["prompt_tokens"],
+                stats["completion_tokens"],
+                stats["total_tokens"],
+                json.dumps(stats["models"], ensure_ascii=False),
+                stats["last_message_at"],
+                user_id,
+                session_id,
+            ),
+        )
+
+    def write(self, record: dict) -> None:
+        op = record.get("op")
+        user_id = record.get("user_id")
+        with self.conn:
+            if op == "message":
+                self._insert_message(user_id, record)
+            elif op == "clear":
+                sessions = self.conn.execute(
+                    "SELECT COUNT(*) FROM sessions WHERE user_id = ?", (user_id,)
+                ).fetchone()[0]
+                messages = self.conn.execute(
+                    "SELECT COUNT(*) FROM messages WHERE user_id = ?", (user_id,)
+                ).fetchone()[0]
+                self.conn.execute("DELETE FROM messages WHERE user_id = ?", (user_id,))
+                self.conn.execute("DELETE FROM sessions WHERE user_id = ?", (user_id,))
+                self.conn.execute(
+                    "UPDATE stats SET total_sessions = total_sessions - ?, total_messages = total_messages - ? WHERE id = 1",
+                    (sessions, messages),
+                )
+            else:
+                logger.warning(f"Неизвестная операция записи: {op}")
+        if self.cache is not None:
+            self._update_cache(record)
+
+    def _update_cache(self, record: dict) -> None:
+        """Применить запись к закэшированной текущей сессии, не перечитывая её из БД"""
+        user_id = record.get("user_id")
+        if record.get("op") != "message":
+            self.cache.invalidate(user_id)
+            return
+        cached = self.cache.peek(user_id)
+        if cached is None:
+            return
+        message = record["message"]
+        sessions = cached["sessions"]
+        if sessions and sessions[-1]["session_id"] == record.get("session_id"):
+            sessions[-1]["messages"].append(message)
+            self.cache.grow(user_id, message_size(message))
+        else:
+            # началась новая сессия — предыдущая из памяти уходит
+            cached["sessions"] = [{
+                "session_id": record.get("session_id"),
+                "messages": [message],
+                "created_at": record.get("session_created_at"),
+            }]
+            self.cache.put(user_id, cached)
+
+    def _insert_message(self, user_id: str, record: dict) -> None:
+        cur = self.conn.execute(
+            "INSERT OR IGNORE INTO users (user_id, username, created_at) VALUES (?, ?, ?)",
+            (user_id, record.get("username"), record.get("user_created_at")),
+        )
+        new_users = cur.rowcount
+        cur = self.conn.execute(
+            "INSERT OR IGNORE INTO sessions (user_id, session_id, created_at) VALUES (?, ?, ?)",
+            (user_id, record.get("session_id"), record.get("session_created_at")),
+        )
+        new_sessions = cur.rowcount
+        message = record["message"]
+        metadata = message.get("metadata")
+        self.conn.execute(
+            "INSERT INTO messages (user_id, session_id, role, content, timestamp, metadata) VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                user_id,
+                record.get("session_id"),
+                message["role"],
+                message["content"],
+                message["timestamp"],
+                json.dumps(metadata, ensure_ascii=False) if metadata else None,
+            ),
+        )
+        self.conn.execute(
+            "UPDATE stats SET total_users = total_users + ?, total_sessions = total_sessions + ?, "
+            "total_messages = total_messages + 1 WHERE id = 1",
+            (new_users, new_sessions),
+        )
+        stats = self._session_stats(user_id, record.get("session_id"))
+        update_session_stats(stats, message)
+        self._store_session_stats(user_id, record.get("session_id"), stats)
+
+    def _session_stats(self, user_id: str, session_id: str) -> dict:
+        row = self.conn.execute(
+            "SELECT session_id, created_at, message_count, prompt_tokens, completion_tokens, total_tokens, models, "
+            "last_message_at FROM sessions WHERE user_id = ? AND session_id = ?",
+            (user_id, session_id),
+        ).fetchone()
+        return self._summary_from_row(row) if row else new_session_stats()
+
+    @staticmethod
+    def _summary_from_row(row: tuple) -> dict:
+        session_id, created_at, messages, prompt, completion, total, models, last_message_at = row
+        return {
+            "session_id": session_id,
+            "created_at": created_at,
+            "messages": messages,
+            "prompt_tokens": prompt,
+            "completion_tokens": completion,
+            "total_tokens": total,
+            "models": json.loads(models or "{}"),
+            "last_message_at": last_message_at,
+        }
+
+    def import_users(self, users: Dict[str, dict]) -> int:
+        """Массовый импорт данных в формате conversations.json (одна транзакция)"""
+        imported = 0
+        with self.conn:
+            for user in users.values():
+                for session in user.get("sessions", []):
+                    for message in session.get("messages", []):
+                        self._insert_message(user["user_id"], {
+                            "username": user.get("username"),
+                            "user_created_at": user.get("created_at"),
+                            "session_id": session.get("session_id"),
+                            "session_created_at": session.get("created_at"),
+                            "message": message,
+                        })
+                        imported += 1
+                if not user.get("sessions"):
+                    cur = self.conn.execute(
+                        "INSERT OR IGNORE INTO users (user_id, username, created_at) VALUES (?, ?, ?)",
+                        (user["user_id"], user.get("username"), user.get("created_at")),
+                    )
+                    self.conn.execute(
+                        "UPDATE stats SET total_users = total_users + ? WHERE id = 1", (cur.rowcount,)
+                    )
+        return imported
+
+    def save(self) -> None:
+        self.conn.commit()
+
+    def close(self) -> None:
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def get_user(self, user_id: str) -> Optional[dict]:
+        row = self.conn.execute(
+            "SELECT user_id, username, created_at FROM users WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return self._build_user(row)
+
+    def _build_user(self, row: tuple, conn: Optional[sqlite3.Connection] = None) -> dict:
+        conn = conn or self.conn
+        user_id, username, created_at = row
+        sessions: Dict[str, dict] = {}
+        for session_id, session_created_at in conn.execute(
+            "SELECT session_id, created_at FROM sessions WHERE user_id = ? ORDER BY id", (user_id,)
+        ):
+            sessions[session_id] = {"session_id": session_id, "messages": [], "created_at": session_created_at}
+        for session_id, role, content, timestamp, metadata in conn.execute(
+            "SELECT session_id, role, content, timestamp, metadata FROM messages WHERE user_id = ? ORDER BY id",
+            (user_id,),
+        ):
+            message = {"role": role, "content": content, "timestamp": timestamp}
+            if metadata:
+                message["metadata"] = json.loads(metadata)
+            if session_id in sessions:
+                sessions[session_id]["messages"].append(message)
+        return {"user_id": user_id, "username": username, "created_at": created_at, "sessions": list(sessions.values())}
+
+    def last_session_id(self, user_id: str) -> Optional[str]:
+        row = self.conn.execute(
+            "SELECT session_id FROM sessions WHERE user_id = ? ORDER BY id DESC LIMIT 1", (user_id,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def last_session(self, user_id: str) -> Optional[Tuple[str, Optional[str]]]:
+        cached = self.cache.peek(user_id) if self.cache is not None else None
+        if cached is not None and cached["sessions"] and cached["sessions"][-1]["messages"]:
+            session = cached["sessions"][-1]
+            return session["session_id"], session["messages"][-1].get("timestamp")
+        row = self.conn.execute(
+            "SELECT session_id, last_message_at FROM sessions WHERE user_id = ? ORDER BY id DESC LIMIT 1", (user_id,)
+        ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def get_current_session(self, user_id: str) -> Optional[dict]:
+        """Пользователь только с последней сессией — без чтения всей истории"""
+        if self.cache is None:
+            return self._read_current_session(user_id)
+        user = self.cache.get(user_id)
+        if user is None:
+            user = self._read_current_session(user_id)
+            if user is not None:
+                self.cache.put(user_id, user)
+        return user
+
+    def _read_current_session(self, user_id: str) -> Optional[dict]:
+        user = self.conn.execute(
+            "SELECT user_id, username, created_at FROM users WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        if user is None:
+            return None
+        last = self.conn.execute(
+            "SELECT session_id, created_at FROM sessions WHERE user_id = ? ORDER BY id DESC LIMIT 1", (user_id,)
+        ).fetchone()
+        sessions = []
+        if last is not None:
+            messages = []
+            for role, content, timestamp, metadata in self.conn.execute(
+                "SELECT role, content, timestamp, metadata FROM messages WHERE user_id = ? AND session_id = ? ORDER BY id",
+                (user_id, last[0]),
+            ):
+                message = {"role": role, "content": content, "timestamp": timestamp}
+                if metadata:
+                    message["metadata"] = json.loads(metadata)
+                messages.append(message)
+            sessions.append({"session_id": last[0], "messages": messages, "created_at": last[1]})
+        return {"user_id": user[0], "username": user[1], "created_at": user[2], "sessions": sessions}
+
+    def session_summaries(self, user_id: str) -> List[dict]:
+        rows = self.conn.execute(
+            "SELECT session_id, created_at, message_count, prompt_tokens, completion_tokens, total_tokens, models, "
+            "last_message_at FROM sessions WHERE user_id = ? ORDER BY id",
+            (user_id,),
+        ).fetchall()
+        return [self._summary_from_row(row) for row in rows]
+
+    def iter_users(self, user_ids: Optional[List[str]] = None) -> Iterator[dict]:
+        # отдельное соединение на чтение (WAL не блокирует запись): экспорт может идти в другом потоке;
+        # история собирается по одному пользователю за раз
+        conn = sqlite3.connect(self.path)
+        try:
+            if user_ids is None:
+                rows = conn.execute("SELECT user_id, username, created_at FROM users ORDER BY rowid").fetchall()
+            else:
+                rows = []
+                for user_id in user_ids:
+                    row = conn.execute(
+                        "SELECT user_id, username, created_at FROM users WHERE user_id = ?", (user_id,)
+                    ).fetchone()
+                    if row is not None:
+                        rows.append(row)
+            for row in rows:
+                yield self._build_user(row, conn)
+        finally:
+            conn.close()
+
+    def statistics(self) -> Dict[str, int]:
+        users, sessions, messages = self.conn.execute(
+            "SELECT total_users, total_sessions, total_messages FROM stats WHERE id = 1"
+        ).fetchone()
+        return {"total_users": users, "total_sessions": sessions, "total_messages": messages}
+
+
+def create_storage(
+    backend: str,
+    path: str,
+    compact_every: int = 500,
+    writer: Optional[BackgroundWriter] = None,
+    cache: Optional[UserLRUCache] = None,
+):
+    """Выбрать хранилище по имени бэкенда из конфигурации.
+    path — путь к conversations.json; файлы журнала и БД лежат рядом с ним.
+    writer — фоновый поток записи для файловых бэкендов.
+    cache — LRU активных пользователей для SQLite (файловые бэкенды и так держат всё в памяти).
+    """
+    if backend == "json":
+        return JSONFileStorage(path, writer=writer)
+    if backend == "journal":
+        return JournalStorage(path, compact_every=compact_every, writer=writer)
+    if backend == "sqlite":
+        # транзакция SQLite короткая (WAL, synchronous=NORMAL — без fsync на коммит) и должна быть видна
+        # следующему чтению — пишем синхронно, на event loop, без фонового writer
+        return SQLiteStorage(os.path.splitext(path)[0] + ".db", cache=cache)
+    raise ValueError(f"Неизвестный бэкенд хранилища: {backend}")
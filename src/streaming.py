@@ -0,0 +1,79 @@
+import asyncio
+import logging
+import time
+from typing import List, Optional
+
+from aiogram import types
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+
+logger = logging.getLogger(__name__)
+
+# Лимит длины текста одного сообщения Telegram
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+
+class TelegramStreamRenderer:
+    """Постепенный вывод потокового ответа LLM в Telegram.
+    Первое сообщение отправляется с первым куском текста, дальше оно редактируется
+    не чаще edit_interval секунд. При превышении лимита Telegram текст переносится
+    в новое сообщение.
+    """
+
+    def __init__(self, message: types.Message, edit_interval: float = 1.0, limit: int = TELEGRAM_MESSAGE_LIMIT) -> None:
+        self.source = message
+        self.edit_interval = edit_interval
+        self.limit = limit
+        self.sent_messages: List[types.Message] = []
+        self._current: Optional[types.Message] = None
+        self._text = ""  # текст текущего (последнего) сообщения
+        self._shown = ""  # то, что уже отображено в текущем сообщении
+        self._next_edit_at = 0.0
+
+    async def feed(self, delta: str) -> None:
+        """Добавить кусок текста и при необходимости обновить сообщение"""
+        self._text += delta
+        while len(self._text) > self.limit:
+            cut = self._split_point(self._text)
+            head, self._text = self._text[:cut], self._text[cut:].lstrip()
+            await self._render(head, final=True)
+            self._current = None
+            self._shown = ""
+        if self._current is None or time.monotonic() >= self._next_edit_at:
+            await self._render(self._text)
+
+    async def finish(self) -> None:
+        """Дописать остаток текста после окончания потока"""
+        await self._render(self._text, final=True)
+
+    def _split_point(self, text: str) -> int:
+        """Граница переноса: последний перевод строки или пробел в пределах лимита"""
+        for sep in ("\n", " "):
+            idx = text.rfind(sep, 0, self.limit)
+            if idx > self.limit // 2:
+                return idx
+        return self.limit
+
+    async def _render(self, text: str, final: bool = False) -> None:
+        if not text.strip() or text == self._shown:
+            return
+        while True:
+            try:
+                if self._current is None:
+                    self._current = await self.source.answer(text)
+                    self.sent_messages.append(self._current)
+                else:
+                    await self._current.edit_text(text)
+                self._shown = text
+                self._next_edit_at = time.monotonic() + self.edit_interval
+                return
+            except TelegramRetryAfter as e:
+                # промежуточные правки просто откладываем, финальные — дожидаемся
+                logger.warning(f"Лимит правок Telegram, повтор через {e.retry_after} с")
+                self._next_edit_at = time.monotonic() + e.retry_after
+                if not final:
+                    return
+                await asyncio.sleep(e.retry_after)
+            except TelegramBadRequest as e:
+                # например, "message is not modified"
+                logger.debug(f"Правка сообщения пропущена: {e}")
+                return
@@ -0,0 +1,316 @@
+"""
+Лёгкая трассировка горячего пути: вложенные спаны (обработка сообщения → очередь → LLM-вызовы,
+догенерации, fallback → отправка в Telegram → запись истории) пишутся в локальный файл
+в формате OTLP/JSON (одна строка ExportTraceServiceRequest на трассу) через фоновый JSONLWriter.
+
+Отчёт «куда уходит время» по файлу и его ротированным частям: python -m src.tracing data/traces.jsonl
+"""
+
+import contextvars
+import functools
+import glob
+import gzip
+import inspect
+import json
+import logging
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+from .logging_utils import JSONLWriter
+
+logger = logging.getLogger(__name__)
+
+# Коды статуса OTLP
+STATUS_UNSET = 0
+STATUS_ERROR = 2
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "attributes", "start_ns", "end_ns", "_started", "error")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], attributes: Dict[str, Any]) -> None:
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.start_ns = time.time_ns()
+        # длительность — по монотонным часам, абсолютное время — только для отметки начала
+        self._started = time.perf_counter_ns()
+        self.end_ns = 0
+        self.error: Optional[str] = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def finish(self) -> None:
+        self.end_ns = self.start_ns + (time.perf_counter_ns() - self._started)
+
+    def to_otlp(self) -> dict:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in self.attributes.items() if v is not None],
+            "status": {"code": STATUS_ERROR, "message": self.error} if self.error else {"code": STATUS_UNSET},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+class _NoopSpan:
+    """Спан выключенной трассировки или трассы, не попавшей в выборку"""
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+
+
+def _otlp_value(value: Any) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        # int64 в OTLP/JSON передаётся строкой
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class Tracer:
+    """Трассировщик процесса. По умолчанию выключен: span() почти ничего не стоит.
+    Спаны трассы копятся в памяти и пишутся одной строкой, когда закрывается корневой;
+    спаны, закончившиеся позже корня (фоновые задачи), пишутся отдельными строками.
+    """
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self.sample_rate = 1.0
+        self.service_name = "dreams-bot"
+        self._writer: Optional[JSONLWriter] = None
+        self._open_traces: Dict[str, List[Span]] = {}
+        self.exported = 0
+
+    def configure(
+        self, path: str, *, sample_rate: float = 1.0, service_name: str = "dreams-bot", **writer_options
+    ) -> None:
+        self.close()
+        self._writer = JSONLWriter(path, **writer_options)
+        self.sample_rate = max(0.0, min(1.0, sample_rate))
+        self.service_name = service_name
+        self.enabled = True
+
+    def close(self) -> None:
+        self.enabled = False
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        self._open_traces.clear()
+
+    def flush(self) -> None:
+        if self._writer is not None:
+            self._writer.flush()
+
+    def current(self) -> Optional[Span]:
+        return _current_span.get()
+
+    def set_attributes(self, **attributes: Any) -> None:
+        """Добавить атрибуты текущему спану (если трассировка идёт)"""
+        span = _current_span.get()
+        if span is not None:
+            for key, value in attributes.items():
+                span.set_attribute(key, value)
+
+    @contextmanager
+    def span(self, name: str, parent: Optional[Span] = None, **attributes: Any) -> Iterator[Any]:
+        """Спан вокруг блока кода; родитель — текущий спан контекста (или явный parent)"""
+        if not self.enabled:
+            yield NOOP_SPAN
+            return
+        parent = parent if parent is not None else _current_span.get()
+        if parent is NOOP_SPAN or (parent is None and random.random() >= self.sample_rate):
+            # трасса не попала в выборку — вложенные спаны тоже не пишем
+            token = _current_span.set(NOOP_SPAN)
+            try:
+                yield NOOP_SPAN
+            finally:
+                _current_span.reset(token)
+            return
+        if parent is None:
+            span = Span(name, os.urandom(16).hex(), None, attributes)
+            self._open_traces[span.trace_id] = []
+        else:
+            span = Span(name, parent.trace_id, parent.span_id, attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            # в том числе отмена (hedging отменяет проигравшие запросы)
+            span.error = f"{type(e).__name__}: {e}" if str(e) else type(e).__name__
+            raise
+        finally:
+            _current_span.reset(token)
+            span.finish()
+            self._finish(span)
+
+    def _finish(self, span: Span) -> None:
+        pending = self._open_traces.get(span.trace_id)
+        if span.parent_id is None:
+            spans = self._open_traces.pop(span.trace_id, [])
+            spans.append(span)
+            self._export(spans)
+        elif pending is not None:
+            pending.append(span)
+        else:
+            self._export([span])
+
+    def _export(self, spans: List[Span]) -> None:
+        if self._writer is None:
+            return
+        request = {
+            "resourceSpans": [{
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": self.service_name}}]},
+                "scopeSpans": [{"scope": {"name": "dreams-bot"}, "spans": [s.to_otlp() for s in spans]}],
+            }]
+        }
+        self._writer.write(json.dumps(request, ensure_ascii=False, separators=(",", ":")))
+        self.exported += len(spans)
+
+    def traced(self, name: str) -> Callable:
+        """Декоратор: вызов функции (обычной или корутины) — спан с именем name"""
+
+        def decorator(func: Callable) -> Callable:
+            if inspect.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def async_wrapper(*args, **kwargs):
+                    with self.span(name):
+                        return await func(*args, **kwargs)
+
+                return async_wrapper
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return func(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def bind(self, job: Callable[[], Any]) -> Callable[[], Any]:
+        """Фабрика корутины, которая выполнится в чужой задаче (воркер очереди) с текущим спаном как родителем"""
+        parent = _current_span.get()
+        if parent is None:
+            return job
+
+        async def run():
+            token = _current_span.set(parent)
+            try:
+                return await job()
+            finally:
+                _current_span.reset(token)
+
+        return run
+
+
+tracer = Tracer()
+
+
+def _open_text(path: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, "r", encoding="utf-8")
+
+
+def trace_files(path: str) -> List[str]:
+    """Файл трасс вместе с ротированными частями (в том числе .gz), от старых к новым"""
+    return sorted(glob.glob(f"{glob.escape(path)}.*")) + [path]
+
+
+def read_spans(paths: Iterable[str]) -> List[dict]:
+    """Спаны из файлов трасс (OTLP/JSON построчно, в том числе ротированные .gz)"""
+    spans = []
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        with _open_text(path) as f:
+            for line in f:
+                try:
+                    request = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                for resource in request.get("resourceSpans", []):
+                    for scope in resource.get("scopeSpans", []):
+                        spans.extend(scope.get("spans", []))
+    return spans
+
+
+def summarize_spans(spans: List[dict]) -> List[dict]:
+    """Агрегат по имени спана: число, суммарное и «собственное» время (без дочерних), p50/p99, доля.
+    Доля считается от суммарного времени корневых спанов.
+    """
+    durations: Dict[str, float] = {}
+    children_ms: Dict[str, float] = defaultdict(float)
+    for span in spans:
+        duration = (int(span["endTimeUnixNano"]) - int(span["startTimeUnixNano"])) / 1e6
+        durations[span["spanId"]] = duration
+        if span.get("parentSpanId"):
+            children_ms[span["parentSpanId"]] += duration
+
+    by_name: Dict[str, dict] = {}
+    root_total = 0.0
+    for span in spans:
+        duration = durations[span["spanId"]]
+        if not span.get("parentSpanId"):
+            root_total += duration
+        row = by_name.setdefault(span["name"], {"name": span["name"], "count": 0, "errors": 0, "total_ms": 0.0,
+                                                "self_ms": 0.0, "durations": []})
+        row["count"] += 1
+        row["errors"] += span.get("status", {}).get("code") == STATUS_ERROR
+        row["total_ms"] += duration
+        # параллельные дочерние (hedging) могут в сумме быть длиннее родителя
+        row["self_ms"] += max(0.0, duration - children_ms.get(span["spanId"], 0.0))
+        row["durations"].append(duration)
+
+    rows = []
+    for row in by_name.values():
+        ordered = sorted(row.pop("durations"))
+        row["p50_ms"] = round(ordered[int(0.5 * (len(ordered) - 1))], 1)
+        row["p99_ms"] = round(ordered[int(0.99 * (len(ordered) - 1))], 1)
+        row["self_share"] = round(row["self_ms"] / root_total, 4) if root_total else 0.0
+        row["total_ms"] = round(row["total_ms"], 1)
+        row["self_ms"] = round(row["self_ms"], 1)
+        rows.append(row)
+    rows.sort(key=lambda r: r["self_ms"], reverse=True)
+    return rows
+
+
+def format_trace_report(rows: List[dict], top: int = 15) -> str:
+    if not rows:
+        return "Трасс пока нет"
+    lines = ["⏱ Куда уходит время (собственное время спана, без вложенных):"]
+    for row in rows[:top]:
+        errors = f", ошибок {row['errors']}" if row["errors"] else ""
+        lines.append(
+            f"{row['name']}: {row['self_share'] * 100:.1f}% — {row['count']} шт., "
+            f"своё {row['self_ms']:.0f} мс, p50/p99 {row['p50_ms']}/{row['p99_ms']} мс{errors}"
+        )
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    paths = [part for path in sys.argv[1:] or ["data/traces.jsonl"] for part in trace_files(path)]
+    print(format_trace_report(summarize_spans(read_spans(paths)), top=50))
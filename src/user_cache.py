@@ -0,0 +1,97 @@
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Примерные накладные расходы Python на одно сообщение (dict, строки меток времени и роли)
+MESSAGE_OVERHEAD_BYTES = 400
+
+
+def message_size(message: dict) -> int:
+    """Оценка памяти, занимаемой сообщением (содержимое + накладные расходы)"""
+    return len(message.get("content", "")) * 2 + MESSAGE_OVERHEAD_BYTES
+
+
+def user_size(user: dict) -> int:
+    return MESSAGE_OVERHEAD_BYTES + sum(
+        message_size(m) for s in user.get("sessions", []) for m in s.get("messages", [])
+    )
+
+
+class UserLRUCache:
+    """LRU активных пользователей: текущая сессия в памяти, остальные читаются с диска по требованию.
+    Ограничения — число пользователей и оценка занимаемой памяти; при превышении вытесняются
+    давно не обращавшиеся пользователи.
+    """
+
+    def __init__(self, max_users: int = 1000, max_bytes: int = 64 * 1024 * 1024) -> None:
+        self.max_users = max(1, max_users)
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, Tuple[dict, int]]" = OrderedDict()
+        self._bytes = 0
+        # экспорт читает хранилище из отдельного потока
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, user_id: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry[0]
+
+    def peek(self, user_id: str) -> Optional[dict]:
+        """Без учёта в статистике и без изменения порядка LRU"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            return entry[0] if entry else None
+
+    def put(self, user_id: str, user: dict, size: Optional[int] = None) -> None:
+        size = user_size(user) if size is None else size
+        with self._lock:
+            old = self._entries.pop(user_id, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[user_id] = (user, size)
+            self._bytes += size
+            self._evict()
+
+    def grow(self, user_id: str, delta: int) -> None:
+        """Учесть изменение размера записи, изменённой на месте"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return
+            self._entries[user_id] = (entry[0], entry[1] + delta)
+            self._bytes += delta
+            self._evict()
+
+    def invalidate(self, user_id: str) -> None:
+        with self._lock:
+            old = self._entries.pop(user_id, None)
+            if old is not None:
+                self._bytes -= old[1]
+
+    def _evict(self) -> None:
+        # последнего (только что использованного) пользователя не вытесняем
+        while len(self._entries) > 1 and (len(self._entries) > self.max_users or self._bytes > self.max_bytes):
+            _, (_, size) = self._entries.popitem(last=False)
+            self._bytes -= size
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "users": len(self._entries),
+                "bytes": self._bytes,
+            }
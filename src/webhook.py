@@ -0,0 +1,88 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+
+class UpdateDeduplicator:
+    """Outer-middleware для dp.update: пропускает update_id, которые уже обрабатывались.
+    Telegram повторяет доставку webhook, если не получил ответ вовремя, а при переключении
+    polling/webhook одно обновление может прийти дважды.
+    """
+
+    def __init__(self, max_size: int = 10000) -> None:
+        self.max_size = max(1, max_size)
+        self._seen: "OrderedDict[int, None]" = OrderedDict()
+        self.duplicates = 0
+
+    def seen(self, update_id: int) -> bool:
+        """Отметить update_id; вернуть True, если он уже встречался"""
+        if update_id in self._seen:
+            self._seen.move_to_end(update_id)
+            self.duplicates += 1
+            return True
+        self._seen[update_id] = None
+        if len(self._seen) > self.max_size:
+            self._seen.popitem(last=False)
+        return False
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any],
+    ) -> Any:
+        if self.seen(event.update_id):
+            logger.info(f"Повторное обновление {event.update_id} пропущено")
+            return None
+        return await handler(event, data)
+
+
+async def run_webhook(
+    dp: Dispatcher,
+    bot: Bot,
+    *,
+    host: str,
+    port: int,
+    path: str,
+    secret_token: Optional[str] = None,
+    public_url: str = "",
+    reuse_port: bool = False,
+) -> None:
+    """Принимать обновления через webhook на локальном aiohttp-сервере до отмены задачи.
+    public_url — внешний адрес ingress; если задан, webhook регистрируется в Telegram при старте.
+    reuse_port — несколько процессов слушают один порт, ядро распределяет соединения между ними.
+    Состояние (дедупликация, склейка, очередь, кэш) у каждого процесса своё, поэтому это режим
+    для перекрывающегося перезапуска, а не для масштабирования (для него — WORKERS).
+    """
+    app = web.Application()
+    SimpleRequestHandler(dispatcher=dp, bot=bot, secret_token=secret_token).register(app, path=path)
+    # startup/shutdown диспетчера (и его обработчики) привязываются к жизненному циклу приложения
+    setup_application(app, dp, bot=bot)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, host, port, reuse_port=reuse_port or None).start()
+        logger.info(f"Webhook слушает http://{host}:{port}{path}")
+        if reuse_port:
+            logger.warning(
+                "WEBHOOK_REUSE_PORT: дедупликация обновлений и состояние пользователей — в каждом процессе свои; "
+                "для нескольких процессов используйте WORKERS"
+            )
+        if public_url:
+            await bot.set_webhook(
+                url=public_url.rstrip("/") + path,
+                secret_token=secret_token,
+                allowed_updates=dp.resolve_used_update_types(),
+            )
+            logger.info(f"Webhook зарегистрирован: {public_url.rstrip('/')}{path}")
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
@@ -0,0 +1,128 @@
+"""
+Многопроцессный режим: входной процесс принимает обновления (polling или webhook)
+и раздаёт их воркерам по хэшу user_id. История — в общей SQLite (WAL, транзакции),
+метрики каждый воркер пишет в свой файл, входной процесс отдаёт их сумму на /metrics.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+from typing import List
+
+from aiogram import Bot, Dispatcher
+
+from .config import Config
+from .metrics import merge_metrics, read_metrics_file
+from .monitoring import EventLoopLagMonitor, MetricsServer, process_rss_bytes, storage_sizes
+from .sharding import ShardRouter, worker_path
+from .storage import SQLiteStorage
+from .webhook import UpdateDeduplicator, run_webhook
+
+logger = logging.getLogger(__name__)
+
+
+def _worker_entry(index: int, count: int, update_queue) -> None:
+    """Точка входа процесса-воркера (spawn: модули импортируются заново)"""
+    from .bot import DreamsBot
+
+    # файл кэша ответов у каждого воркера свой
+    if Config.LLM_CACHE_PATH:
+        Config.LLM_CACHE_PATH = worker_path(Config.LLM_CACHE_PATH, index)
+    bot = DreamsBot(worker_index=index, worker_count=count)
+    try:
+        asyncio.run(bot.start(update_queue))
+    except KeyboardInterrupt:
+        pass
+
+
+def aggregate_worker_metrics(count: int) -> dict:
+    return merge_metrics([read_metrics_file(worker_path("data/metrics.json", i)) for i in range(count)])
+
+
+async def _run_ingress(queues: List) -> None:
+    bot = Bot(token=Config.TELEGRAM_BOT_TOKEN)
+    dp = Dispatcher()
+    dedup = UpdateDeduplicator(max_size=Config.UPDATE_DEDUP_SIZE)
+    router = ShardRouter(queues)
+    dp.update.outer_middleware(dedup)
+    dp.update.outer_middleware(router)
+
+    loop_lag = EventLoopLagMonitor()
+    metrics_server = None
+    if Config.METRICS_HTTP_ENABLED:
+        def gauges() -> dict:
+            result = {
+                "dreams_event_loop_lag_seconds": round(loop_lag.last_lag_s, 6),
+                "dreams_process_rss_bytes": process_rss_bytes(),
+                "dreams_updates_duplicate": dedup.duplicates,
+                "dreams_updates_dropped": router.dropped,
+            }
+            for index, routed in enumerate(router.routed):
+                result[f'dreams_updates_routed{{worker="{index}"}}'] = routed
+            for name, size in storage_sizes("data").items():
+                result[f'dreams_storage_bytes{{file="{name}"}}'] = size
+            return result
+
+        metrics_server = MetricsServer(
+            lambda: aggregate_worker_metrics(len(queues)),
+            gauges,
+            host=Config.METRICS_HTTP_HOST,
+            port=Config.METRICS_HTTP_PORT,
+        )
+        loop_lag.start()
+        await metrics_server.start()
+    try:
+        if Config.BOT_MODE == "webhook":
+            await run_webhook(
+                dp,
+                bot,
+                host=Config.WEBHOOK_HOST,
+                port=Config.WEBHOOK_PORT,
+                path=Config.WEBHOOK_PATH,
+                secret_token=Config.WEBHOOK_SECRET or None,
+                public_url=Config.WEBHOOK_URL,
+                reuse_port=Config.WEBHOOK_REUSE_PORT,
+            )
+        else:
+            await bot.delete_webhook()
+            await dp.start_polling(bot, allowed_updates=["message"])
+    finally:
+        if metrics_server:
+            await metrics_server.stop()
+            await loop_lag.stop()
+        await bot.session.close()
+
+
+def run_sharded(count: int) -> None:
+    """Запустить count воркеров и входной процесс; вернуться после остановки всех"""
+    os.makedirs("data", exist_ok=True)
+    # схема и миграции SQLite — один раз до старта воркеров, чтобы они не гонялись за ALTER TABLE
+    storage = SQLiteStorage(os.path.splitext("data/conversations.json")[0] + ".db")
+    storage.load()
+    storage.close()
+
+    ctx = multiprocessing.get_context("spawn")
+    queues = [ctx.Queue(maxsize=Config.WORKER_QUEUE_SIZE) for _ in range(count)]
+    processes = [
+        ctx.Process(target=_worker_entry, args=(i, count, queues[i]), name=f"dreams-worker-{i}")
+        for i in range(count)
+    ]
+    for process in processes:
+        process.start()
+    logger.info(f"Запущено воркеров: {count}")
+    try:
+        asyncio.run(_run_ingress(queues))
+    except KeyboardInterrupt:
+        logger.info("Входной процесс остановлен")
+    finally:
+        for q in queues:
+            try:
+                q.put(None, timeout=1.0)
+            except Exception:
+                pass
+        for process in processes:
+            process.join(timeout=30)
+            if process.is_alive():
+                logger.warning(f"{process.name} не остановился вовремя — завершаем принудительно")
+                process.terminate()
@@ -0,0 +1,97 @@
+import os
+
+import pytest
+from aiohttp.test_utils import TestServer
+
+from bench.fake_servers import FakeLLMConfig, create_fake_llm_app, create_fake_telegram_app
+from bench.run import run_benchmark
+
+
+@pytest.mark.asyncio
+async def test_benchmark_runs_bot_against_fakes(tmp_path, monkeypatch):
+    llm = TestServer(create_fake_llm_app(FakeLLMConfig(latency_ms=5, jitter_ms=0, length_rate=0.5, seed=1)))
+    telegram = TestServer(create_fake_telegram_app())
+    await llm.start_server()
+    await telegram.start_server()
+    monkeypatch.chdir(tmp_path)
+    try:
+        report = await run_benchmark(
+            messages=6,
+            users=3,
+            rate=0,
+            llm_url=str(llm.make_url("")).rstrip("/"),
+            telegram_url=str(telegram.make_url("")).rstrip("/"),
+            config_overrides={"SCHEDULER_NOTIFY_POSITION": 100},
+        )
+    finally:
+        await llm.close()
+        await telegram.close()
+
+    assert report["messages"] == 6
+    assert report["bot"]["llm_requests"] == 6
+    assert report["bot"]["llm_errors"] == 0
+    assert report["latency_ms"]["p50"] is not None
+    assert os.path.exists(tmp_path / "data" / "events.jsonl")
+
+
+def test_build_trace_restores_texts_and_timeline():
+    from datetime import datetime, timedelta
+
+    from bench.replay import build_trace
+
+    t0 = datetime(2025, 1, 1, 12, 0, 0)
+    long_dream = "Мне снилось, что я иду по длинному коридору старой школы и ищу свой класс"
+    first = "Сначала я стояла на перроне и смотрела, как уходят поезда один за другим"
+    second = "Потом перрон превратился в берег моря, и поезда поплыли как корабли вдаль"
+    events = [
+        {"ts": t0, "event": "message_in", "payload": {"user_id": "1", "text": long_dream[:50] + "..."}},
+        {"ts": t0 + timedelta(seconds=2), "event": "message_out", "payload": {"user_id": "1"}},
+        {"ts": t0 + timedelta(hours=8), "event": "message_in", "payload": {"user_id": "2", "text": first[:50] + "..."}},
+        {"ts": t0 + timedelta(hours=8, seconds=1), "event": "message_in", "payload": {"user_id": "2", "text": second[:50] + "..."}},
+    ]
+    history = {
+        "1": {"username": "anna", "messages": [{"role": "user", "content": long_dream}]},
+        "2": {"username": "", "messages": [{"role": "user", "content": first + "\n" + second}]},
+    }
+
+    trace = build_trace(events, history, speed=2.0, max_gap_s=60)
+
+    assert [a.text for a in trace.arrivals] == [long_dream, first, second]
+    # пауза в 8 часов сжата до 60 с, затем всё ускорено вдвое
+    assert [a.offset_s for a in trace.arrivals] == [0.0, 30.0, 30.5]
+    assert trace.arrivals[0].user_id == 1 and trace.arrivals[0].username == "anna"
+    assert trace.unmatched == 0
+    assert trace.recorded_latency_s == [2.0]
+
+
+def test_read_history_opens_sqlite_read_only(tmp_path):
+    import sqlite3
+
+    from bench.replay import read_history
+
+    # база старой схемы: без агрегатов сессий — load() хранилища запустил бы миграцию
+    db = tmp_path / "conversations.db"
+    conn = sqlite3.connect(db)
+    conn.executescript("""
+        CREATE TABLE users (user_id TEXT PRIMARY KEY, username TEXT, created_at TEXT);
+        CREATE TABLE sessions (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT, session_id TEXT, created_at TEXT);
+        CREATE TABLE messages (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT, session_id TEXT,
+                               role TEXT, content TEXT, timestamp TEXT, metadata TEXT);
+        INSERT INTO users VALUES ('u1', 'anna', '2024-01-01T10:00:00');
+        INSERT INTO sessions (user_id, session_id, created_at) VALUES ('u1', 's1', '2024-01-01T10:00:00');
+        INSERT INTO messages (user_id, session_id, role, content, timestamp)
+            VALUES ('u1', 's1', 'user', 'снилось море', '2024-01-01T10:00:00');
+    """)
+    conn.commit()
+    conn.close()
+    before = db.read_bytes()
+
+    history = read_history(str(tmp_path / "conversations.json"), "sqlite")
+    assert history["u1"]["username"] == "anna"
+    assert [m["content"] for m in history["u1"]["messages"]] == ["снилось море"]
+    assert db.read_bytes() == before
+
+    # ошибочный путь — ошибка, а не новая пустая база
+    with pytest.raises(FileNotFoundError):
+        read_history(str(tmp_path / "missing" / "conversations.json"), "sqlite")
+    assert not (tmp_path / "missing").exists()
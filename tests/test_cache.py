@@ -0,0 +1,35 @@
+from src.cache import ResponseCache, make_cache_key
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_cache_key_normalizes_text():
+    a = make_cache_key("m", [{"role": "user", "content": "Мне  снилось   море\n"}])
+    b = make_cache_key("m", [{"role": "user", "content": "мне снилось море"}])
+    c = make_cache_key("other", [{"role": "user", "content": "мне снилось море"}])
+    assert a == b
+    assert a != c
+
+
+def test_cache_ttl_lru_and_persistence(tmp_path):
+    clock = FakeClock()
+    path = str(tmp_path / "cache.json")
+    cache = ResponseCache(max_entries=2, ttl_s=60, path=path, clock=clock)
+    cache.put("a", "A", {"model": "m"})
+    cache.put("b", "B", {"model": "m"})
+    assert cache.get("a")[0] == "A"  # "a" становится свежей
+    cache.put("c", "C", {"model": "m"})  # вытесняется "b"
+    assert cache.get("b") is None
+    assert cache.stats() == {"hits": 1, "misses": 1, "evictions": 1, "size": 2}
+
+    cache.save()
+    restored = ResponseCache(max_entries=2, ttl_s=60, path=path, clock=clock)
+    assert restored.get("c")[0] == "C"
+    clock.now += 61
+    assert restored.get("a") is None
@@ -0,0 +1,30 @@
+import asyncio
+
+import pytest
+
+from src.coalescer import MessageCoalescer
+
+
+@pytest.mark.asyncio
+async def test_coalescer_merges_fragments_within_window():
+    coalescer = MessageCoalescer(window_s=0.05, max_wait_s=1)
+    first = asyncio.create_task(coalescer.collect("u1", "Мне снилось, что я"))
+    await asyncio.sleep(0.02)
+    second = await coalescer.collect("u1", "летаю над морем")
+    other = asyncio.create_task(coalescer.collect("u2", "Чужой сон"))
+
+    assert second is None
+    assert await first == ["Мне снилось, что я", "летаю над морем"]
+    assert await other == ["Чужой сон"]
+
+
+@pytest.mark.asyncio
+async def test_coalescer_respects_max_wait():
+    coalescer = MessageCoalescer(window_s=0.05, max_wait_s=0.1)
+    first = asyncio.create_task(coalescer.collect("u1", "1"))
+    for part in ["2", "3", "4", "5"]:
+        await asyncio.sleep(0.03)
+        await coalescer.collect("u1", part)
+    fragments = await asyncio.wait_for(first, timeout=0.5)
+    assert fragments[0] == "1"
+    assert len(fragments) < 5
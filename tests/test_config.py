@@ -19,6 +19,17 @@ def test_config_invalid_log_level(monkeypatch):
         Config.validate()
 
 
+def test_config_rejects_reuse_port_with_workers(monkeypatch):
+    monkeypatch.setenv("TELEGRAM_BOT_TOKEN", "T")
+    monkeypatch.setenv("OPENROUTER_API_KEY", "K")
+    monkeypatch.setenv("DATA_STORAGE_BACKEND", "sqlite")
+    monkeypatch.setenv("WORKERS", "4")
+    Config.validate()
+    monkeypatch.setenv("WEBHOOK_REUSE_PORT", "true")
+    with pytest.raises(ValueError):
+        Config.validate()
+
+
 def test_config_admin_check(monkeypatch):
     monkeypatch.setenv("ADMIN_USER_ID", "123")
     assert Config.is_admin(123) is True
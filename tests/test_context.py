@@ -0,0 +1,71 @@
+import pytest
+
+from src.context import ContextBuilder, estimate_tokens
+
+
+def _history(turns):
+    messages = [{"role": role, "content": text, "timestamp": ""} for role, text in turns]
+    return {"user_id": "u1", "sessions": [{"session_id": "s1", "messages": messages}]}
+
+
+def test_estimate_tokens_counts_cyrillic_denser():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("сон" * 100) > estimate_tokens("dog" * 100)
+
+
+def test_build_includes_recent_turns_and_skips_current_message():
+    builder = ContextBuilder(max_tokens=2000)
+    history = _history([("user", "мне снилось море"), ("assistant", "море — символ чувств"), ("user", "а что значит волна?")])
+    window = builder.build("SYS", history, "а что значит волна?", "Проанализируй этот сон: а что значит волна?")
+    assert [m["content"] for m in window.messages] == [
+        "SYS",
+        "мне снилось море",
+        "море — символ чувств",
+        "Проанализируй этот сон: а что значит волна?",
+    ]
+    assert not builder.needs_summary(window)
+
+
+def test_resent_dream_is_not_duplicated_in_context():
+    builder = ContextBuilder(max_tokens=2000)
+    history = _history([
+        ("user", "мне снилось море"),
+        ("assistant", "море — символ чувств"),
+        ("user", "а волна?"),
+        ("assistant", "волна — перемены"),
+        ("user", "Мне снилось  море"),
+    ])
+    window = builder.build("SYS", history, "Мне снилось  море", "Проанализируй этот сон: Мне снилось  море")
+    # прежняя копия сна и ответ на неё в контекст не попадают
+    assert [m["content"] for m in window.messages] == [
+        "SYS",
+        "а волна?",
+        "волна — перемены",
+        "Проанализируй этот сон: Мне снилось  море",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_old_turns_are_summarized_incrementally():
+    calls = []
+
+    async def summarizer(previous, turns, user_id):
+        assert user_id == "u1"
+        calls.append((previous, [t["content"] for t in turns]))
+        return f"{previous}+{len(turns)}"
+
+    builder = ContextBuilder(max_tokens=120, summarizer=summarizer)
+    turns = [("user" if i % 2 == 0 else "assistant", f"реплика номер {i} " + "x" * 80) for i in range(6)]
+    history = _history(turns + [("user", "ещё")])
+
+    window = builder.build("SYS", history, "ещё", "ещё")
+    assert window.window_start > 0
+    assert builder.needs_summary(window)
+    await builder.update_summary(window)
+    assert calls[0][0] == ""
+
+    # повторная сборка использует сводку и не отправляет уже свёрнутые реплики
+    window = builder.build("SYS", history, "ещё", "ещё")
+    assert window.messages[1]["content"].endswith(f"+{window.summary_covered}")
+    assert window.window_start >= window.summary_covered
+    assert len(calls) == 1
@@ -0,0 +1,72 @@
+import json
+from datetime import datetime
+
+from src.costs import CostTracker, cheapest_first, parse_prices, request_cost
+
+
+class Clock:
+    def __init__(self, now: datetime) -> None:
+        self.now = now
+
+    def __call__(self) -> datetime:
+        return self.now
+
+
+def test_parse_prices_and_cheapest_first():
+    prices = parse_prices("openai/gpt-4o=2.5:10, openai/gpt-4o-mini=0.15:0.6,broken")
+    assert prices == {"openai/gpt-4o": (2.5, 10.0), "openai/gpt-4o-mini": (0.15, 0.6)}
+    # модель без цены и в порядке экономии, и в учёте — бесплатная
+    assert cheapest_first(["openai/gpt-4o", "unknown", "openai/gpt-4o-mini"], prices) == [
+        "unknown", "openai/gpt-4o-mini", "openai/gpt-4o"
+    ]
+    assert request_cost(prices, "unknown", {"prompt_tokens": 1000, "completion_tokens": 1000}) == 0.0
+
+
+def test_cost_tracker_totals_budgets_and_day_rollover(tmp_path):
+    clock = Clock(datetime(2025, 3, 1, 12, 0))
+    path = tmp_path / "costs.json"
+    tracker = CostTracker(
+        {"big": (10.0, 30.0), "small": (1.0, 2.0)},
+        daily_budget=0.1,
+        user_daily_budget=0.06,
+        threshold=0.8,
+        path=str(path),
+        retention_days=2,
+        clock=clock,
+    )
+    # ответ big с догенерациями + отброшенный «сухой» ответ small
+    meta = {
+        "model": "big",
+        "usage": {"prompt_tokens": 1000, "completion_tokens": 1000},
+        "discarded": [{"model": "small", "usage": {"prompt_tokens": 1000, "completion_tokens": 500}}],
+    }
+    cost = tracker.record("u1", meta)
+    assert round(cost, 6) == 0.042  # 0.01 + 0.03 + 0.001 + 0.001
+    today = tracker.today()
+    assert today["total"]["requests"] == 1
+    assert today["total"]["prompt_tokens"] == 2000
+    assert today["models"]["small"]["requests"] == 1
+    assert round(today["users"]["u1"]["cost_usd"], 6) == 0.042
+    assert not tracker.should_economize("u1")
+
+    tracker.record("u1", {"model": "big", "usage": {"prompt_tokens": 0, "completion_tokens": 1000}})
+    # пользователь потратил 0.072 из 0.06 — экономим для него; общий бюджет (72%) ещё не на пороге
+    assert tracker.should_economize("u1")
+    assert not tracker.should_economize("u2")
+
+    # сводка диалога: расход учитывается, но запросом пользователя не считается
+    tracker.record("u2", {"model": "small", "usage": {"prompt_tokens": 1000, "completion_tokens": 0}}, request=False)
+    assert tracker.today()["total"]["requests"] == 2
+    assert tracker.today()["users"]["u2"] == {
+        "requests": 0, "prompt_tokens": 1000, "completion_tokens": 0, "cost_usd": 0.001
+    }
+
+    tracker.flush()
+    assert json.loads(path.read_text())["days"]["2025-03-01"]["total"]["requests"] == 2
+
+    # новый день — бюджеты с нуля, старые дни обрезаются до retention_days
+    for day in (2, 3):
+        clock.now = datetime(2025, 3, day, 9, 0)
+        tracker.record("u1", {"model": "small", "usage": {"prompt_tokens": 10, "completion_tokens": 10}})
+    assert not tracker.should_economize("u1")
+    assert sorted(tracker.state["days"]) == ["2025-03-02", "2025-03-03"]
@@ -2,6 +2,9 @@ import json
 import os
 import tempfile
 
+import pytest
+
+from src.config import Config
 from src.data_manager import DataManager
 
 
@@ -35,3 +38,144 @@ def test_data_manager_clear(tmp_path, monkeypatch):
     hist = dm.get_user_history("u1")
     assert hist is not None
     assert hist["sessions"] == []
+
+
+def test_data_manager_journal_replay(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    dm = DataManager(backend="journal")
+    dm.add_message("u1", "user", "user", "hello")
+    dm.add_message("u1", "user", "assistant", "hi")
+    # снимок не переписывается на каждое сообщение — только журнал
+    assert not (tmp_path / "data" / "conversations.json").exists()
+    assert (tmp_path / "data" / "conversations.journal.jsonl").exists()
+
+    # перезапуск без close(): данные восстанавливаются из журнала
+    restored = DataManager(backend="journal")
+    hist = restored.get_user_history("u1")
+    assert [m["content"] for m in hist["sessions"][0]["messages"]] == ["hello", "hi"]
+
+    # компактизация при остановке: снимок записан, журнал пуст
+    restored.close()
+    assert (tmp_path / "data" / "conversations.journal.jsonl").read_text(encoding="utf-8") == ""
+    again = DataManager(backend="journal")
+    assert again.get_statistics()["total_messages"] == 2
+
+
+def test_journal_replay_after_crash_between_snapshot_and_truncation(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    journal = tmp_path / "data" / "conversations.journal.jsonl"
+    dm = DataManager(backend="journal")
+    dm.add_message("u1", "user", "user", "hello")
+    dm.add_message("u1", "user", "assistant", "hi")
+    lines = journal.read_text(encoding="utf-8")
+
+    # снимок записан, а до очистки журнала процесс не дошёл
+    dm.storage.compact()
+    journal.write_text(lines, encoding="utf-8")
+    restored = DataManager(backend="journal")
+    assert [m["content"] for m in restored.get_user_history("u1")["sessions"][0]["messages"]] == ["hello", "hi"]
+    assert restored.get_statistics()["total_messages"] == 2
+
+    # записи после снимка воспроизводятся, а нумерация продолжается с отметки снимка
+    restored.add_message("u1", "user", "user", "ещё сон")
+    journal.write_text(lines + journal.read_text(encoding="utf-8"), encoding="utf-8")
+    again = DataManager(backend="journal")
+    assert [m["content"] for m in again.get_user_history("u1")["sessions"][0]["messages"]] == ["hello", "hi", "ещё сон"]
+    assert again.get_statistics()["total_messages"] == 3
+
+
+def test_data_manager_sqlite_backend(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    dm = DataManager(backend="sqlite")
+    dm.add_message("u1", "user", "user", "hello")
+    dm.add_message("u1", "user", "assistant", "hi", metadata={"model": "gpt-4"})
+    dm.add_message("u2", "other", "user", "сон")
+    assert dm.get_statistics() == {"total_users": 2, "total_sessions": 2, "total_messages": 3}
+
+    hist = dm.get_user_history("u1")
+    assert [m["content"] for m in hist["sessions"][0]["messages"]] == ["hello", "hi"]
+    assert hist["sessions"][0]["messages"][1]["metadata"] == {"model": "gpt-4"}
+
+    dm.clear_user_history("u1")
+    assert dm.get_statistics() == {"total_users": 2, "total_sessions": 1, "total_messages": 1}
+    assert json.loads(dm.export_all_history())["total_users"] == 2
+    dm.close()
+
+
+@pytest.mark.parametrize("backend", ["json", "sqlite"])
+def test_iter_user_histories_returns_snapshots(tmp_path, monkeypatch, backend):
+    monkeypatch.chdir(tmp_path)
+    dm = DataManager(backend=backend)
+    dm.add_message("u1", "user", "user", "hello")
+    dm.add_message("u2", "other", "user", "сон")
+
+    exported = list(dm.iter_user_histories(["u2", "missing", "u1"]))
+    assert [u["user_id"] for u in exported] == ["u2", "u1"]
+    # экспорт идёт в отдельном потоке — новые сообщения не должны менять уже выданные данные
+    dm.add_message("u1", "user", "assistant", "hi")
+    assert [m["content"] for m in exported[1]["sessions"][0]["messages"]] == ["hello"]
+    dm.close()
+
+
+def test_migrate_json_to_sqlite(tmp_path, monkeypatch):
+    from src.migrate import migrate_json_to_sqlite
+
+    monkeypatch.chdir(tmp_path)
+    dm = DataManager(backend="journal")
+    dm.add_message("u1", "user", "user", "hello")
+    dm.add_message("u1", "user", "assistant", "hi")
+
+    imported = migrate_json_to_sqlite("data/conversations.json", "data/conversations.db")
+    assert imported == 2
+    migrated = DataManager(backend="sqlite")
+    assert migrated.get_statistics()["total_messages"] == 2
+    assert migrated.get_user_history("u1")["username"] == "user"
+    migrated.close()
+
+
+@pytest.mark.parametrize("backend", ["journal", "sqlite"])
+def test_idle_timeout_starts_new_session_with_aggregates(tmp_path, monkeypatch, backend):
+    from datetime import datetime, timedelta
+
+    import src.data_manager as data_manager_module
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(Config, "SESSION_IDLE_TIMEOUT", 600)
+    clock = {"now": datetime(2025, 1, 1, 9, 0, 0)}
+
+    class FakeDateTime(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return clock["now"]
+
+    monkeypatch.setattr(data_manager_module, "datetime", FakeDateTime)
+    dm = DataManager(backend=backend)
+    usage = {"prompt_tokens": 100, "completion_tokens": 50, "total_tokens": 150}
+    dm.add_message("u1", "user", "user", "первый сон")
+    dm.add_message("u1", "user", "assistant", "ответ", metadata={"model": "m1", "usage": usage})
+    clock["now"] += timedelta(minutes=5)
+    dm.add_message("u1", "user", "user", "уточнение")
+    clock["now"] += timedelta(hours=2)
+    dm.add_message("u1", "user", "user", "второй сон")
+
+    summaries = dm.get_session_summaries("u1")
+    assert [s["messages"] for s in summaries] == [3, 1]
+    assert summaries[0]["total_tokens"] == 150
+    assert summaries[0]["models"] == {"m1": 1}
+    assert dm.get_statistics()["total_sessions"] == 2
+    current = dm.get_current_session("u1")
+    assert [m["content"] for m in current["sessions"][0]["messages"]] == ["второй сон"]
+    dm.close()
+
+
+@pytest.mark.asyncio
+async def test_lazy_load_in_background(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    dm = DataManager(backend="journal")
+    dm.add_message("u1", "user", "user", "hello")
+    dm.close()
+
+    lazy = DataManager(backend="journal", lazy_load=True)
+    await lazy.wait_loaded()
+    assert lazy.is_loaded()
+    assert lazy.get_statistics()["total_messages"] == 1
@@ -0,0 +1,48 @@
+import gzip
+import json
+
+import pytest
+
+from src.export import iter_export_users, parse_export_args, write_export_parts
+
+
+def _user(user_id: str, timestamps: list[str]) -> dict:
+    return {
+        "user_id": user_id,
+        "username": user_id,
+        "created_at": timestamps[0],
+        "sessions": [{
+            "session_id": "s1",
+            "created_at": timestamps[0],
+            "messages": [{"role": "user", "content": "сон " * 50, "timestamp": ts} for ts in timestamps],
+        }],
+    }
+
+
+def test_export_args_and_date_filter():
+    params = parse_export_args("/export from=2024-01-02 to=2024-01-03 users=1,2")
+    assert params["user_ids"] == ["1", "2"]
+    users = [
+        _user("1", ["2024-01-01T10:00:00", "2024-01-02T10:00:00", "2024-01-03T23:00:00"]),
+        _user("2", ["2024-01-05T10:00:00"]),
+    ]
+    filtered = list(iter_export_users(users, since=params["since"], until=params["until"]))
+    assert [u["user_id"] for u in filtered] == ["1"]
+    # to= включает весь указанный день
+    assert len(filtered[0]["sessions"][0]["messages"]) == 2
+    assert parse_export_args("/export to=2024-01-03T12:00")["until"] == "2024-01-03T12:00:00"
+    with pytest.raises(ValueError):
+        parse_export_args("/export since=вчера")
+
+
+def test_export_splits_into_gzip_parts(tmp_path):
+    users = (_user(str(i), ["2024-01-01T10:00:00"]) for i in range(5))
+    paths = write_export_parts(users, str(tmp_path), max_part_bytes=600, prefix="export")
+    assert len(paths) > 1
+    exported = []
+    for path in paths:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            lines = [json.loads(line) for line in f]
+        assert "exported_at" in lines[0]
+        exported.extend(u["user_id"] for u in lines[1:])
+    assert exported == ["0", "1", "2", "3", "4"]
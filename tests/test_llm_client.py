@@ -1,3 +1,5 @@
+import asyncio
+import time
 import types
 import pytest
 
@@ -18,7 +20,7 @@ class DummyResponse:
 
 
 class DummyCompletions:
-    def create(self, *, model: str, messages: list, max_tokens: int, temperature: float):
+    async def create(self, *, model: str, messages: list, max_tokens: int, temperature: float):
         # имитируем: primary сначала вернет "сухой" ответ, потом при fallback нормальный
         if model == Config.LLM_PRIMARY_MODEL:
             return DummyResponse("коротко и сухо", finish_reason="stop")
@@ -38,13 +40,17 @@ def _set_env(monkeypatch):
     monkeypatch.setenv("LLM_PRIMARY_MODEL", "gpt-4")
     monkeypatch.setenv("LLM_FALLBACK_ENABLED", "true")
     monkeypatch.setenv("LLM_FALLBACK_MODELS", "gpt-4o-mini")
+    # Config читает окружение при импорте — выставляем атрибуты напрямую
+    monkeypatch.setattr(Config, "LLM_PRIMARY_MODEL", "gpt-4")
+    monkeypatch.setattr(Config, "LLM_FALLBACK_ENABLED", True)
+    monkeypatch.setattr(Config, "LLM_FALLBACK_MODELS", ["gpt-4o-mini"])
 
 
 @pytest.mark.asyncio
 async def test_llm_fallback(monkeypatch):
     # подменяем OpenAI клиента на заглушку
     from src import llm as llm_module
-    monkeypatch.setattr(llm_module, "OpenAI", lambda base_url, api_key: DummyClient())
+    monkeypatch.setattr(llm_module, "AsyncOpenAI", lambda **kwargs: DummyClient())
 
     client = LLMClient()
     messages = [{"role": "user", "content": "расскажи про сон..."}]
@@ -52,3 +58,249 @@ async def test_llm_fallback(monkeypatch):
 
     assert "ключевые символы" in text.lower()
     assert meta.get("fallback") in (True, False)  # может быть выставлен
+
+
+class SlowCompletions:
+    async def create(self, *, model: str, messages: list, max_tokens: int, temperature: float):
+        await asyncio.sleep(0.2)
+        return DummyResponse("Ответ с нужной структурой и ключевые символы: " + "x" * 80)
+
+
+@pytest.mark.asyncio
+async def test_llm_concurrent_requests_do_not_block(monkeypatch):
+    from src import llm as llm_module
+    monkeypatch.setattr(
+        llm_module, "AsyncOpenAI",
+        lambda **kwargs: types.SimpleNamespace(chat=types.SimpleNamespace(completions=SlowCompletions())),
+    )
+    client = LLMClient()
+    messages = [{"role": "user", "content": "сон"}]
+    started = time.perf_counter()
+    results = await asyncio.gather(*(client.generate_with_fallback(messages) for _ in range(5)))
+    elapsed = time.perf_counter() - started
+    assert len(results) == 5
+    # 5 запросов по 0.2с выполняются параллельно, а не последовательно (1с)
+    assert elapsed < 0.6
+
+
+class StreamChunk:
+    def __init__(self, content=None, finish_reason=None, usage=None):
+        self.choices = [] if content is None and finish_reason is None else [
+            types.SimpleNamespace(delta=types.SimpleNamespace(content=content), finish_reason=finish_reason)
+        ]
+        self.usage = usage
+
+
+class StreamingCompletions:
+    async def create(self, *, model: str, messages: list, max_tokens: int, temperature: float, **kwargs):
+        assert kwargs.get("stream") is True
+        if model == Config.LLM_PRIMARY_MODEL:
+            raise RuntimeError("primary недоступна")
+
+        async def gen():
+            yield StreamChunk("Ключевые ")
+            yield StreamChunk("символы", finish_reason="stop")
+            yield StreamChunk(usage=types.SimpleNamespace(prompt_tokens=5, completion_tokens=2, total_tokens=7))
+        return gen()
+
+
+@pytest.mark.asyncio
+async def test_llm_streaming_falls_back_before_output(monkeypatch):
+    from src import llm as llm_module
+    monkeypatch.setattr(
+        llm_module, "AsyncOpenAI",
+        lambda **kwargs: types.SimpleNamespace(chat=types.SimpleNamespace(completions=StreamingCompletions())),
+    )
+    client = LLMClient()
+    deltas = []
+
+    async def on_delta(delta):
+        deltas.append(delta)
+
+    text, meta = await client.generate_streaming([{"role": "user", "content": "сон"}], on_delta)
+    assert text == "Ключевые символы"
+    assert deltas == ["Ключевые ", "символы"]
+    assert meta["fallback"] is True
+    assert meta["usage"]["total_tokens"] == 7
+    assert meta["ttft_ms"] >= 0
+
+
+class HedgeCompletions:
+    def __init__(self):
+        self.cancelled = False
+
+    async def create(self, *, model: str, messages: list, max_tokens: int, temperature: float):
+        if model == Config.LLM_PRIMARY_MODEL:
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                self.cancelled = True
+                raise
+        return DummyResponse("Ответ с нужной структурой и ключевые символы: " + "x" * 80)
+
+
+@pytest.mark.asyncio
+async def test_llm_hedging_races_fallback(monkeypatch):
+    from src import llm as llm_module
+    completions = HedgeCompletions()
+    monkeypatch.setattr(
+        llm_module, "AsyncOpenAI",
+        lambda **kwargs: types.SimpleNamespace(chat=types.SimpleNamespace(completions=completions)),
+    )
+    monkeypatch.setattr(Config, "LLM_HEDGING", True)
+    monkeypatch.setattr(Config, "LLM_HEDGE_DELAY_MS", 50)
+    client = LLMClient()
+    started = time.perf_counter()
+    text, meta = await client.generate_with_fallback([{"role": "user", "content": "сон"}])
+    await asyncio.sleep(0)
+    assert time.perf_counter() - started < 1
+    assert meta["model"] == "gpt-4o-mini"
+    assert meta["fallback"] is True
+    assert meta["hedge"]["launched"] == 2
+    assert meta["hedge"]["cancelled"] == 1
+    assert completions.cancelled is True
+    # отменённый запрос к primary учтён оценкой промпта
+    assert meta["discarded"] == [
+        {"model": "gpt-4", "usage": {"prompt_tokens": 6, "completion_tokens": 0, "total_tokens": 6}, "cancelled": True}
+    ]
+    assert meta["hedge"]["wasted_tokens"] == 6
+
+
+@pytest.mark.asyncio
+async def test_llm_cache_serves_repeated_dream(monkeypatch):
+    from src import llm as llm_module
+    calls = []
+
+    class CountingCompletions:
+        async def create(self, *, model: str, messages: list, max_tokens: int, temperature: float):
+            calls.append(model)
+            return DummyResponse("Ответ с нужной структурой и ключевые символы: " + "x" * 80)
+
+    monkeypatch.setattr(
+        llm_module, "AsyncOpenAI",
+        lambda **kwargs: types.SimpleNamespace(chat=types.SimpleNamespace(completions=CountingCompletions())),
+    )
+    monkeypatch.setattr(Config, "LLM_CACHE_ENABLED", True)
+    monkeypatch.setattr(Config, "LLM_CACHE_PATH", "")
+    client = LLMClient()
+    _, first_meta = await client.generate_with_fallback([{"role": "user", "content": "Снилось море"}])
+    text, meta = await client.generate_with_fallback([{"role": "user", "content": "снилось  море "}])
+    assert len(calls) == 1
+    assert "cached" not in first_meta
+    assert meta["cached"] is True
+    assert "ключевые символы" in text
+
+
+@pytest.mark.asyncio
+async def test_llm_cache_skips_answers_built_from_dialogue_context(monkeypatch):
+    from src import llm as llm_module
+    from src.context import ContextBuilder
+    calls = []
+
+    class CountingCompletions:
+        async def create(self, *, model: str, messages: list, max_tokens: int, temperature: float):
+            calls.append([m["content"] for m in messages])
+            return DummyResponse("Ответ с нужной структурой и ключевые символы: " + "x" * 80)
+
+    monkeypatch.setattr(
+        llm_module, "AsyncOpenAI",
+        lambda **kwargs: types.SimpleNamespace(chat=types.SimpleNamespace(completions=CountingCompletions())),
+    )
+    monkeypatch.setattr(Config, "LLM_CACHE_ENABLED", True)
+    monkeypatch.setattr(Config, "LLM_CACHE_PATH", "")
+    client = LLMClient()
+    builder = ContextBuilder(max_tokens=2000)
+
+    def history(user_id, turns):
+        messages = [{"role": role, "content": text, "timestamp": ""} for role, text in turns]
+        return {"user_id": user_id, "sessions": [{"session_id": "s1", "messages": messages}]}
+
+    dream = "а что значит второй сон?"
+    prompt = f"Проанализируй этот сон: {dream}"
+    # у пользователя A ответ опирается на его диалог
+    window_a = builder.build("SYS", history("a", [
+        ("user", "мне снились два сна: море и лес"), ("assistant", "море — чувства"), ("user", dream),
+    ]), dream, prompt)
+    await client.generate_with_fallback(window_a.messages)
+    # пользователь B с тем же текстом не должен получить ответ, построенный на диалоге A
+    window_b = builder.build("SYS", history("b", [("user", dream)]), dream, prompt)
+    _, meta = await client.generate_with_fallback(window_b.messages)
+    assert "cached" not in meta
+    assert len(calls) == 2
+    assert "мне снились два сна: море и лес" not in calls[1]
+    # запрос без истории кэшируется как обычно
+    _, meta = await client.generate_with_fallback(window_b.messages)
+    assert meta["cached"] is True
+    assert len(calls) == 2
+
+
+
+class PricedCompletions:
+    """primary даёт «сухой» ответ, дешёвая fallback-модель — нормальный; запоминаем вызванные модели"""
+
+    def __init__(self):
+        self.models = []
+
+    async def create(self, *, model: str, messages: list, max_tokens: int, temperature: float):
+        self.models.append(model)
+        if model == Config.LLM_PRIMARY_MODEL:
+            return DummyResponse("коротко и сухо", finish_reason="stop")
+        return DummyResponse("Ответ с нужной структурой и ключевые символы: " + "x" * 80)
+
+
+@pytest.mark.asyncio
+async def test_llm_economy_prefers_cheaper_model_and_reports_discarded(monkeypatch):
+    from src import llm as llm_module
+    completions = PricedCompletions()
+    monkeypatch.setattr(
+        llm_module, "AsyncOpenAI",
+        lambda **kwargs: types.SimpleNamespace(chat=types.SimpleNamespace(completions=completions)),
+    )
+    monkeypatch.setattr(Config, "LLM_CACHE_ENABLED", False)
+    monkeypatch.setattr(Config, "LLM_HEDGING", False)
+    monkeypatch.setattr(Config, "LLM_PRICES", "gpt-4=30:60,gpt-4o-mini=0.15:0.6")
+    client = LLMClient()
+    messages = [{"role": "user", "content": "расскажи про сон..."}]
+
+    # обычный режим: «сухой» ответ primary отброшен, но оплачен
+    _, meta = await client.generate_with_fallback(messages)
+    assert meta["model"] == "gpt-4o-mini"
+    assert meta["discarded"] == [
+        {"model": "gpt-4", "usage": {"prompt_tokens": 10, "completion_tokens": 20, "total_tokens": 30}}
+    ]
+
+    # бюджет на исходе: сразу дешёвая модель, дорогую не вызываем
+    completions.models.clear()
+    _, meta = await client.generate_with_fallback(messages, economy=True)
+    assert meta["model"] == "gpt-4o-mini"
+    assert "discarded" not in meta
+    assert completions.models == ["gpt-4o-mini"]
+
+
+@pytest.mark.asyncio
+async def test_llm_economy_answers_not_cached_and_summary_reports_usage(monkeypatch):
+    from src import llm as llm_module
+    completions = PricedCompletions()
+    monkeypatch.setattr(
+        llm_module, "AsyncOpenAI",
+        lambda **kwargs: types.SimpleNamespace(chat=types.SimpleNamespace(completions=completions)),
+    )
+    monkeypatch.setattr(Config, "LLM_CACHE_ENABLED", True)
+    monkeypatch.setattr(Config, "LLM_CACHE_PATH", "")
+    monkeypatch.setattr(Config, "LLM_HEDGING", False)
+    monkeypatch.setattr(Config, "LLM_PRICES", "gpt-4=30:60,gpt-4o-mini=0.15:0.6")
+    client = LLMClient()
+    messages = [{"role": "user", "content": "расскажи про сон..."}]
+
+    # ответ дешёвой модели в режиме экономии не должен доставаться обычным запросам
+    await client.generate_with_fallback(messages, economy=True)
+    _, meta = await client.generate_with_fallback(messages)
+    assert "cached" not in meta
+    assert completions.models == ["gpt-4o-mini", "gpt-4", "gpt-4o-mini"]
+
+    # сводка диалога отдаёт usage для учёта расходов и тоже экономит
+    completions.models.clear()
+    summary, meta = await client.summarize_dialogue("", [{"role": "user", "content": "сон"}], economy=True)
+    assert summary
+    assert completions.models == ["gpt-4o-mini"]
+    assert meta == {"model": "gpt-4o-mini", "usage": {"prompt_tokens": 10, "completion_tokens": 20, "total_tokens": 30}}
@@ -0,0 +1,60 @@
+import gzip
+import json
+import os
+
+from src.logging_utils import JSONEventLogger, JSONLWriter
+
+
+def test_event_logger_batches_in_background(tmp_path):
+    path = tmp_path / "events.jsonl"
+    events = JSONEventLogger(str(path), batch_size=1000, flush_interval=60)
+    events.log_event("message_in", {"user_id": "1"})
+    events.log_event("message_out", {"user_id": "1"})
+    # пакет ещё не набран и таймер не истёк — явный flush дописывает всё
+    events.flush()
+    lines = path.read_text(encoding="utf-8").splitlines()
+    assert [json.loads(line)["event"] for line in lines] == ["message_in", "message_out"]
+    events.close()
+
+
+def test_writer_rotates_and_compresses(tmp_path):
+    path = tmp_path / "app.jsonl"
+    writer = JSONLWriter(str(path), batch_size=1, max_bytes=5, backup_count=1, compress=True)
+    writer.write('{"n": 1}')
+    writer.flush()
+    writer.write('{"n": 2, "pad": "xxxxxxxx"}')
+    writer.flush()
+    writer.close()
+
+    assert path.read_text(encoding="utf-8") == '{"n": 2, "pad": "xxxxxxxx"}\n'
+    rotated = [name for name in os.listdir(tmp_path) if name.endswith(".gz")]
+    assert len(rotated) == 1
+    with gzip.open(tmp_path / rotated[0], "rt", encoding="utf-8") as f:
+        assert f.read() == '{"n": 1}\n'
+
+
+def test_writer_rotations_within_one_timestamp_do_not_overwrite(tmp_path, monkeypatch):
+    from datetime import datetime
+
+    from src import logging_utils
+
+    class FrozenDatetime(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return datetime(2024, 1, 1, 12, 0, 0)
+
+    monkeypatch.setattr(logging_utils, "datetime", FrozenDatetime)
+    path = tmp_path / "app.jsonl"
+    writer = JSONLWriter(str(path), batch_size=1, max_bytes=5, backup_count=5, compress=True)
+    for n in range(4):
+        writer.write(f'{{"n": {n}}}')
+        writer.flush()
+    writer.close()
+
+    rotated = sorted(name for name in os.listdir(tmp_path) if name.endswith(".gz"))
+    contents = []
+    for name in rotated:
+        with gzip.open(tmp_path / name, "rt", encoding="utf-8") as f:
+            contents.append(f.read())
+    # все части сохранились и по именам идут в порядке ротации
+    assert contents == ['{"n": 0}\n', '{"n": 1}\n', '{"n": 2}\n']
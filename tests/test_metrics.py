@@ -8,6 +8,9 @@ def test_metrics_record(tmp_path, monkeypatch):
     mm = MetricsManager(path=str(path))
     mm.record_request(model="gpt-4", used_fallback=False, success=True, response_time_ms=120, primary_attempt=True)
     mm.record_request(model="gpt-4o-mini", used_fallback=True, success=True, response_time_ms=80, primary_attempt=False)
+    # запись на диск — только при сбросе
+    assert not path.exists()
+    mm.flush()
 
     data = json.loads(path.read_text(encoding="utf-8"))
     assert data["totals"]["requests"] == 2
@@ -15,3 +18,33 @@ def test_metrics_record(tmp_path, monkeypatch):
     assert data["llm"]["primary_attempts"] == 1
     assert data["llm"]["fallback_attempts"] == 1
     assert data["timings"]["response_ms_count"] == 2
+
+
+def test_metrics_histograms_and_tokens(tmp_path):
+    mm = MetricsManager(path=str(tmp_path / "metrics.json"))
+    for ms in [40] * 90 + [900] * 9 + [25000]:
+        mm.record_request(model="gpt-4", used_fallback=False, success=True, response_time_ms=ms)
+    mm.record_request(
+        model="gpt-4", used_fallback=False, success=True,
+        usage={"prompt_tokens": 10, "completion_tokens": 20, "total_tokens": 30}, continuations=2,
+    )
+
+    assert mm.latency_percentiles() == {"p50": 50, "p95": 1000, "p99": 1000}
+    assert mm.latency_percentiles("gpt-4")["p50"] == 50
+    assert mm.metrics["tokens"]["total"] == 30
+    assert mm.metrics["tokens"]["per_model"]["gpt-4"]["completion"] == 20
+    assert mm.metrics["llm"]["continuations"] == 2
+
+
+def test_histogram_tail_past_last_bucket_reports_max():
+    from src.metrics import histogram_percentile, new_histogram, observe
+
+    histogram = new_histogram()
+    for ms in [100] * 98 + [90000, 150000]:
+        observe(histogram, ms)
+    assert histogram_percentile(histogram, 0.5) == 100
+    # хвост за последней границей (60 с) не срезается до неё
+    assert histogram_percentile(histogram, 0.99) == 150000
+    # файл метрик старого формата без max — последняя известная граница
+    del histogram["max"]
+    assert histogram_percentile(histogram, 0.99) == 60000
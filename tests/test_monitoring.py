@@ -0,0 +1,47 @@
+import aiohttp
+import pytest
+
+from src.metrics import MetricsManager
+from src.monitoring import MetricsServer, render_prometheus
+
+
+def test_render_prometheus_histograms_and_gauges(tmp_path):
+    mm = MetricsManager(path=str(tmp_path / "metrics.json"))
+    mm.record_request(model="m1", used_fallback=False, success=True, response_time_ms=120)
+    mm.record_request(model="m1", used_fallback=False, success=True, response_time_ms=4000)
+
+    text = render_prometheus(mm.metrics, {'dreams_storage_bytes{file="a.json"}': 10, 'dreams_storage_bytes{file="b.db"}': 20})
+
+    assert 'dreams_requests_total{status="success"} 2' in text
+    assert 'dreams_llm_response_seconds_bucket{model="m1",le="0.25"} 1' in text
+    assert 'dreams_llm_response_seconds_bucket{model="m1",le="+Inf"} 2' in text
+    assert 'dreams_llm_response_seconds_count{model="m1"} 2' in text
+    assert text.count("# TYPE dreams_storage_bytes gauge") == 1
+    assert 'dreams_storage_bytes{file="b.db"} 20' in text
+
+    # каждое семейство объявлено через # TYPE, и его сэмплы идут одним блоком
+    families, current = [], None
+    for line in text.splitlines():
+        if line.startswith("# TYPE "):
+            current = line.split()[2]
+            assert current not in families
+            families.append(current)
+            continue
+        name = line.split("{", 1)[0].split(" ", 1)[0]
+        assert name == current or (name.rsplit("_", 1)[0] == current and name.rsplit("_", 1)[1] in ("bucket", "sum", "count"))
+
+
+@pytest.mark.asyncio
+async def test_metrics_server_serves_text(tmp_path):
+    mm = MetricsManager(path=str(tmp_path / "metrics.json"))
+    server = MetricsServer(lambda: mm.metrics, lambda: {"dreams_process_rss_bytes": 1}, host="127.0.0.1", port=0)
+    await server.start()
+    try:
+        port = server._runner.addresses[0][1]
+        async with aiohttp.ClientSession() as session:
+            async with session.get(f"http://127.0.0.1:{port}/metrics") as resp:
+                body = await resp.text()
+        assert resp.status == 200
+        assert "dreams_process_rss_bytes 1" in body
+    finally:
+        await server.stop()
@@ -0,0 +1,80 @@
+import json
+import threading
+
+from src.costs import CostTracker
+from src.data_manager import DataManager
+from src.metrics import MetricsManager
+from src.persistence import BackgroundWriter
+
+
+def test_background_writer_coalesces_pending_jobs():
+    writer = BackgroundWriter()
+    gate = threading.Event()
+    calls = []
+    # первое задание держит поток, пока ставятся следующие
+    writer.schedule("block", gate.wait)
+    for i in range(5):
+        writer.schedule("snapshot", lambda i=i: calls.append(i))
+    gate.set()
+    writer.flush()
+    # пять отметок «изменилось» — одна запись, с последними данными
+    assert calls == [4]
+    assert writer.stats()["coalesced"] == 4
+    writer.close()
+
+
+def test_data_manager_and_metrics_with_writer(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    writer = BackgroundWriter()
+    dm = DataManager(backend="journal", writer=writer)
+    for i in range(10):
+        dm.add_message("u1", "user", "user", f"сон {i}")
+    mm = MetricsManager(path=str(tmp_path / "data" / "metrics.json"), writer=writer)
+    mm.record_request(model="m1", used_fallback=False, success=True, response_time_ms=100)
+    mm.flush()
+    # учёт стоимости пишется через тот же PeriodicFlusher и тот же writer
+    costs = CostTracker({"m1": (1.0, 2.0)}, path=str(tmp_path / "data" / "costs.json"), writer=writer)
+    costs.record("u1", {"model": "m1", "usage": {"prompt_tokens": 1000, "completion_tokens": 500}})
+    costs.flush()
+
+    dm.flush()
+    journal = (tmp_path / "data" / "conversations.journal.jsonl").read_text(encoding="utf-8").splitlines()
+    assert len(journal) == 10
+    assert json.loads((tmp_path / "data" / "metrics.json").read_text(encoding="utf-8"))["totals"]["success"] == 1
+    saved_costs = json.loads((tmp_path / "data" / "costs.json").read_text(encoding="utf-8"))
+    assert saved_costs["days"][costs._today_key()]["total"]["cost_usd"] == 0.002
+
+    dm.close()
+    writer.close()
+    restored = DataManager(backend="journal")
+    assert restored.get_statistics()["total_messages"] == 10
+
+
+def test_snapshot_serialization_runs_outside_storage_lock(tmp_path, monkeypatch):
+    from src import storage as storage_module
+
+    store = storage_module.JournalStorage(str(tmp_path / "conversations.json"))
+    store.load()
+    store.write({
+        "op": "message", "user_id": "u1", "session_id": "s1",
+        "message": {"role": "user", "content": "сон", "timestamp": "2024-01-01T10:00:00"},
+    })
+
+    # пока идёт json.dumps снимка, запись с event loop (другой поток) должна брать блокировку сразу
+    lock_free = []
+    real_dumps = json.dumps
+
+    def probing_dumps(obj, **kwargs):
+        if kwargs.get("indent"):
+            attempt = threading.Thread(
+                target=lambda: lock_free.append(store._lock.acquire(timeout=0) and (store._lock.release() or True))
+            )
+            attempt.start()
+            attempt.join()
+        return real_dumps(obj, **kwargs)
+
+    monkeypatch.setattr(storage_module.json, "dumps", probing_dumps)
+    store.compact()
+    assert lock_free == [True]
+    snapshot = json.loads((tmp_path / "conversations.json").read_text(encoding="utf-8"))
+    assert snapshot["u1"]["sessions"][0]["messages"][0]["content"] == "сон"
@@ -0,0 +1,63 @@
+import asyncio
+import threading
+
+import pytest
+
+from src.profiler import parse_profile_args, profile_allocations, profile_stacks
+
+
+def test_parse_profile_args():
+    assert parse_profile_args("/profile") == (10, "cpu")
+    assert parse_profile_args("/profile 15 mem", max_seconds=30) == (15, "mem")
+    with pytest.raises(ValueError):
+        parse_profile_args("/profile 120", max_seconds=60)
+    with pytest.raises(ValueError):
+        parse_profile_args("/profile fast")
+
+
+def _busy_loop(stop: threading.Event) -> None:
+    while not stop.is_set():
+        sum(i * i for i in range(1000))
+
+
+async def _waiting_for_llm() -> None:
+    await asyncio.sleep(10)
+
+
+@pytest.mark.asyncio
+async def test_profile_stacks_sees_threads_and_suspended_tasks():
+    stop = threading.Event()
+    thread = threading.Thread(target=_busy_loop, args=(stop,), name="busy")
+    thread.start()
+    waiting = asyncio.create_task(_waiting_for_llm())
+    try:
+        profiler = await profile_stacks(0.3, interval=0.005)
+    finally:
+        stop.set()
+        thread.join()
+        waiting.cancel()
+
+    collapsed = profiler.collapsed()
+    assert profiler.samples > 5
+    assert any(line.startswith("thread busy;") and "_busy_loop (tests/test_profiler.py:" in line
+               for line in collapsed.splitlines())
+    assert "asyncio;task _waiting_for_llm;_waiting_for_llm (tests/test_profiler.py:" in collapsed
+    # каждая строка — «стек число»
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in collapsed.strip().splitlines())
+    assert "Выборок:" in profiler.summary()
+
+
+@pytest.mark.asyncio
+async def test_profile_allocations_reports_growth():
+    retained = []
+
+    async def allocate():
+        for _ in range(20):
+            retained.append(bytearray(100_000))
+            await asyncio.sleep(0.005)
+
+    task = asyncio.create_task(allocate())
+    report = await profile_allocations(0.3)
+    await task
+    assert "Прирост по строкам:" in report
+    assert "tests/test_profiler.py" in report
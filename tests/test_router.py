@@ -0,0 +1,70 @@
+from src.router import ModelRouter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_router_opens_breaker_and_reorders():
+    clock = FakeClock()
+    router = ModelRouter(failure_threshold=2, cooldown_s=30, clock=clock)
+    router.record_success("fallback", 500)
+    for _ in range(2):
+        router.record_failure("primary")
+
+    assert router.state("primary") == "open"
+    assert router.allow("primary") is False
+    assert router.order(["primary", "fallback"]) == ["fallback", "primary"]
+
+    # после остывания — одна пробная попытка (half-open)
+    clock.now = 31
+    assert router.allow("primary") is True
+    assert router.allow("primary") is False
+    router.record_success("primary", 300)
+    assert router.state("primary") == "closed"
+    assert router.order(["primary", "fallback"]) == ["primary", "fallback"]
+
+
+def test_router_half_open_trial_goes_to_one_request():
+    clock = FakeClock()
+    router = ModelRouter(failure_threshold=3, cooldown_s=60, clock=clock)
+    for _ in range(3):
+        router.record_failure("p")
+    assert router.order(["p", "f"]) == ["f", "p"]
+
+    # пробу получает только первый запрос, остальные по-прежнему идут в fallback
+    clock.now = 61
+    assert router.order(["p", "f"]) == ["p", "f"]
+    assert router.order(["p", "f"]) == ["f", "p"]
+    assert router.order(["p", "f"]) == ["f", "p"]
+    assert router.state("p") == "half_open"
+
+    # проба не удалась — breaker снова открыт на cooldown
+    router.record_failure("p")
+    assert router.state("p") == "open"
+    clock.now = 100
+    assert router.order(["p", "f"]) == ["f", "p"]
+
+    # выданная, но так и не использованная проба через cooldown выдаётся заново
+    clock.now = 121
+    assert router.order(["p", "f"]) == ["p", "f"]
+    clock.now = 181
+    assert router.order(["p", "f"]) == ["p", "f"]
+    router.record_success("p", 200)
+    assert router.order(["p", "f"]) == ["p", "f"]
+
+
+def test_router_snapshot_stats():
+    router = ModelRouter(min_samples=2)
+    router.record_success("m", 100)
+    router.record_success("m", 300, finish_reason="length")
+    router.record_failure("m")
+    snap = router.snapshot()["m"]
+    assert snap["samples"] == 3
+    assert snap["error_rate"] == round(1 / 3, 3)
+    assert snap["length_rate"] == 0.5
+    assert snap["p95_ms"] == 300
@@ -0,0 +1,58 @@
+import asyncio
+
+import pytest
+
+from src.scheduler import QueueFullError, RequestScheduler
+
+
+@pytest.mark.asyncio
+async def test_scheduler_round_robin_between_users():
+    scheduler = RequestScheduler(workers=1, max_queue=10)
+    order = []
+    gate = asyncio.Event()
+
+    def job(name):
+        async def run():
+            await gate.wait()
+            order.append(name)
+            return name
+        return run
+
+    # один пользователь прислал три сна подряд, второй — один
+    submits = [
+        asyncio.create_task(scheduler.submit("spammer", job("s1"))),
+        asyncio.create_task(scheduler.submit("spammer", job("s2"))),
+        asyncio.create_task(scheduler.submit("spammer", job("s3"))),
+        asyncio.create_task(scheduler.submit("other", job("o1"))),
+    ]
+    await asyncio.sleep(0.01)
+    # s1 уже у воркера; новый пользователь встанет после o1 и одного сна spammer
+    assert scheduler.position_for("newbie") == 3
+    gate.set()
+    results = await asyncio.gather(*submits)
+    await scheduler.stop()
+
+    assert results == ["s1", "s2", "s3", "o1"]
+    # второй пользователь не ждёт, пока выполнятся все сны первого
+    assert order == ["s1", "o1", "s2", "s3"]
+    assert scheduler.stats()["wait_ms_count"] == 4
+
+
+@pytest.mark.asyncio
+async def test_scheduler_rejects_when_full():
+    scheduler = RequestScheduler(workers=1, max_queue=1)
+    gate = asyncio.Event()
+
+    async def blocked():
+        await gate.wait()
+
+    running = asyncio.create_task(scheduler.submit("u1", blocked))
+    await asyncio.sleep(0.01)  # первое задание взято воркером
+    queued = asyncio.create_task(scheduler.submit("u2", blocked))
+    await asyncio.sleep(0.01)
+    with pytest.raises(QueueFullError):
+        await scheduler.submit("u3", blocked)
+    gate.set()
+    await asyncio.gather(running, queued)
+    await scheduler.stop()
+    assert scheduler.stats()["rejected"] == 1
@@ -0,0 +1,58 @@
+import queue
+
+import pytest
+from aiogram.types import Update
+
+from src.metrics import MetricsManager, merge_metrics, percentiles_from
+from src.sharding import ShardRouter, shard_for, worker_path
+
+
+def _update(update_id: int, user_id: int) -> Update:
+    return Update.model_validate({
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "u"},
+            "text": "сон",
+        },
+    })
+
+
+def test_shard_for_is_stable_and_paths_are_per_worker():
+    assert shard_for("12345", 4) == shard_for("12345", 4)
+    assert {shard_for(str(uid), 4) for uid in range(100)} == {0, 1, 2, 3}
+    assert worker_path("data/metrics.json", 2) == "data/metrics.worker2.json"
+    assert worker_path("data/metrics.json", None) == "data/metrics.json"
+
+
+@pytest.mark.asyncio
+async def test_router_sends_all_user_updates_to_one_worker():
+    queues = [queue.Queue() for _ in range(3)]
+    router = ShardRouter(queues)
+
+    async def handler(event, data):
+        raise AssertionError("во входном процессе обработчики не вызываются")
+
+    for update_id in range(5):
+        await router(handler, _update(update_id, 42), {})
+    target = shard_for("42", 3)
+    assert queues[target].qsize() == 5
+    assert queues[target].get()["message"]["text"] == "сон"
+    assert sum(router.routed) == 5
+
+
+def test_merge_metrics_sums_counters_and_histograms(tmp_path):
+    parts = []
+    for i, latency in enumerate((100, 4000)):
+        mm = MetricsManager(path=str(tmp_path / f"m{i}.json"))
+        mm.record_request(model="m1", used_fallback=False, success=True, response_time_ms=latency,
+                          queue={"depth": i, "max_depth": 5 + i})
+        parts.append(mm.metrics)
+
+    merged = merge_metrics(parts)
+    assert merged["totals"]["requests"] == 2
+    assert merged["llm"]["latency"]["m1"]["count"] == 2
+    assert merged["queue"]["max_depth"] == 6
+    assert percentiles_from(merged)["p50"] == 100
@@ -0,0 +1,49 @@
+import pytest
+
+from src.streaming import TelegramStreamRenderer
+
+
+class FakeSentMessage:
+    def __init__(self, text: str):
+        self.text = text
+        self.edits = 0
+
+    async def edit_text(self, text: str):
+        self.text = text
+        self.edits += 1
+
+
+class FakeIncomingMessage:
+    def __init__(self):
+        self.sent: list[FakeSentMessage] = []
+
+    async def answer(self, text: str):
+        msg = FakeSentMessage(text)
+        self.sent.append(msg)
+        return msg
+
+
+@pytest.mark.asyncio
+async def test_stream_renderer_throttles_edits():
+    incoming = FakeIncomingMessage()
+    renderer = TelegramStreamRenderer(incoming, edit_interval=60)
+    for word in ["Сон ", "про ", "море"]:
+        await renderer.feed(word)
+    # первое сообщение отправлено сразу, дальнейшие правки отложены интервалом
+    assert len(incoming.sent) == 1
+    assert incoming.sent[0].text == "Сон "
+    await renderer.finish()
+    assert incoming.sent[0].text == "Сон про море"
+    assert incoming.sent[0].edits == 1
+
+
+@pytest.mark.asyncio
+async def test_stream_renderer_rolls_over_limit():
+    incoming = FakeIncomingMessage()
+    renderer = TelegramStreamRenderer(incoming, edit_interval=0, limit=20)
+    for _ in range(6):
+        await renderer.feed("слово ")
+    await renderer.finish()
+    assert len(incoming.sent) == 2
+    assert all(len(m.text) <= 20 for m in incoming.sent)
+    assert " ".join(m.text for m in incoming.sent).split() == ["слово"] * 6
@@ -0,0 +1,82 @@
+import asyncio
+import json
+
+import pytest
+
+from src.tracing import Tracer, read_spans, summarize_spans, trace_files
+
+
+@pytest.mark.asyncio
+async def test_spans_nest_across_tasks_and_export_one_line_per_trace(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    tracer = Tracer()
+    tracer.configure(str(path), flush_interval=0.01)
+
+    async def job():
+        with tracer.span("llm.completion", model="m1"):
+            await asyncio.sleep(0.01)
+
+    async def worker(queue):
+        # как воркер очереди: задание выполняется в чужой задаче
+        await (await queue.get())()
+
+    queue = asyncio.Queue()
+    worker_task = asyncio.create_task(worker(queue))
+    with tracer.span("handle_message", user_id="1"):
+        with tracer.span("scheduler.submit"):
+            await queue.put(tracer.bind(job))
+            await worker_task
+        with pytest.raises(ValueError):
+            with tracer.span("telegram.send"):
+                raise ValueError("boom")
+    tracer.close()
+
+    lines = path.read_text(encoding="utf-8").splitlines()
+    assert len(lines) == 1
+    spans = {s["name"]: s for s in json.loads(lines[0])["resourceSpans"][0]["scopeSpans"][0]["spans"]}
+    root = spans["handle_message"]
+    assert "parentSpanId" not in root
+    assert spans["scheduler.submit"]["parentSpanId"] == root["spanId"]
+    assert spans["llm.completion"]["parentSpanId"] == spans["scheduler.submit"]["spanId"]
+    assert len({s["traceId"] for s in spans.values()}) == 1
+    assert spans["telegram.send"]["status"] == {"code": 2, "message": "ValueError: boom"}
+    assert {"key": "model", "value": {"stringValue": "m1"}} in spans["llm.completion"]["attributes"]
+
+    rows = {row["name"]: row for row in summarize_spans(read_spans([str(path)]))}
+    assert rows["llm.completion"]["count"] == 1
+    assert rows["llm.completion"]["self_ms"] >= 10
+    # собственное время очереди — без вложенного вызова LLM
+    assert rows["scheduler.submit"]["self_ms"] < rows["llm.completion"]["self_ms"]
+    assert rows["telegram.send"]["errors"] == 1
+
+
+def test_disabled_or_unsampled_tracer_writes_nothing(tmp_path):
+    tracer = Tracer()
+    with tracer.span("handle_message") as span:
+        span.set_attribute("ignored", True)
+
+    path = tmp_path / "traces.jsonl"
+    tracer.configure(str(path), sample_rate=0.0)
+    with tracer.span("handle_message"):
+        with tracer.span("llm.completion"):
+            pass
+    tracer.close()
+    assert tracer.exported == 0
+    assert not path.exists() or path.read_text() == ""
+
+
+def test_trace_files_include_rotated_parts(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    tracer = Tracer()
+    # каждая трасса больше max_bytes — следующая запись уходит в новый файл
+    tracer.configure(str(path), batch_size=1, max_bytes=10, backup_count=10, compress=True)
+    for _ in range(3):
+        with tracer.span("handle_message"):
+            pass
+        tracer.flush()
+    tracer.close()
+
+    files = trace_files(str(path))
+    assert files[-1] == str(path)
+    assert sum(name.endswith(".gz") for name in files) == 2
+    assert [row["count"] for row in summarize_spans(read_spans(files))] == [3]
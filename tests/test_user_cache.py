@@ -0,0 +1,32 @@
+from src.config import Config
+from src.data_manager import DataManager
+from src.user_cache import UserLRUCache
+
+
+def test_lru_evicts_by_user_count_and_bytes():
+    cache = UserLRUCache(max_users=2, max_bytes=10_000)
+    cache.put("a", {"sessions": []}, size=100)
+    cache.put("b", {"sessions": []}, size=100)
+    assert cache.get("a") is not None  # a теперь самый свежий
+    cache.put("c", {"sessions": []}, size=100)
+    assert cache.peek("b") is None
+    cache.put("d", {"sessions": []}, size=9_950)
+    assert cache.stats()["users"] == 1
+    assert cache.stats()["evictions"] == 3
+
+
+def test_sqlite_current_session_served_from_cache(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(Config, "USER_CACHE_MAX_USERS", 10)
+    dm = DataManager(backend="sqlite")
+    dm.add_message("u1", "user", "user", "сон")
+    assert dm.get_current_session("u1")["sessions"][0]["messages"][0]["content"] == "сон"  # промах, чтение из БД
+    dm.add_message("u1", "user", "assistant", "ответ")  # обновляет запись в кэше на месте
+    session = dm.get_current_session("u1")["sessions"][0]
+    assert [m["content"] for m in session["messages"]] == ["сон", "ответ"]
+    assert dm.get_cache_stats()["hits"] == 1
+    assert dm.get_cache_stats()["misses"] == 1
+
+    dm.clear_user_history("u1")
+    assert dm.get_current_session("u1")["sessions"] == []
+    dm.close()
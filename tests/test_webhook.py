@@ -0,0 +1,70 @@
+import asyncio
+import socket
+
+import aiohttp
+import pytest
+from aiogram import Bot, Dispatcher
+
+from src.webhook import UpdateDeduplicator, run_webhook
+
+
+def test_deduplicator_remembers_recent_updates():
+    dedup = UpdateDeduplicator(max_size=2)
+    assert dedup.seen(1) is False
+    assert dedup.seen(1) is True
+    dedup.seen(2)
+    dedup.seen(3)  # вытесняет самый старый update_id
+    assert dedup.seen(2) is True
+    assert dedup.duplicates == 2
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.mark.asyncio
+async def test_webhook_checks_secret_and_skips_duplicates():
+    bot = Bot(token="123456:TEST")
+    dp = Dispatcher()
+    dp.update.outer_middleware(UpdateDeduplicator())
+    received = []
+
+    @dp.message()
+    async def on_message(message):
+        received.append(message.text)
+
+    port = _free_port()
+    server = asyncio.create_task(
+        run_webhook(dp, bot, host="127.0.0.1", port=port, path="/hook", secret_token="s3cret")
+    )
+    update = {
+        "update_id": 7,
+        "message": {
+            "message_id": 1,
+            "date": 0,
+            "chat": {"id": 1, "type": "private"},
+            "from": {"id": 1, "is_bot": False, "first_name": "u"},
+            "text": "сон",
+        },
+    }
+    try:
+        async with aiohttp.ClientSession() as session:
+            for _ in range(50):
+                try:
+                    async with session.post(f"http://127.0.0.1:{port}/hook", json=update) as resp:
+                        break
+                except aiohttp.ClientConnectionError:
+                    await asyncio.sleep(0.05)
+            assert resp.status == 401
+            headers = {"X-Telegram-Bot-Api-Secret-Token": "s3cret"}
+            for _ in range(2):
+                async with session.post(f"http://127.0.0.1:{port}/hook", json=update, headers=headers) as resp:
+                    assert resp.status == 200
+        await asyncio.sleep(0.1)
+        assert received == ["сон"]
+    finally:
+        server.cancel()
+        await asyncio.gather(server, return_exceptions=True)
+        await bot.session.close()